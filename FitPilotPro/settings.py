@@ -161,5 +161,8 @@ EMAIL_PORT = config('EMAIL_PORT')
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 
+# Shared secret the payment gateway signs webhook bodies with (payments.gateway)
+PAYMENT_WEBHOOK_SECRET = config('PAYMENT_WEBHOOK_SECRET', default='')
+
 # For production deployment (e.g., email link redirection)
 BASE_URL = 'https://fitpilotpro.vercel.app'  # Update with your actual Vercel domain
\ No newline at end of file
@@ -1,24 +1,30 @@
 from django.urls import path , include
 from rest_framework.routers import DefaultRouter
-from classes.views import FitnessClassViewSet, ClassBookingViewSet
+from classes.views import FitnessClassViewSet, ClassScheduleViewSet, ClassBookingViewSet, WaitlistViewSet
 from memberships.views import MembershipPlanViewSet, MembershipViewSet
 from payments.views import PaymentViewSet
 from feedback.views import FeedbackViewSet
 from attendance.views import AttendanceViewSet
-from reports.views import ReportViewSet
+from reports.views import ReportViewSet, ReportJobViewSet, ClassRollupViewSet, InstructorDailyRollupViewSet, CohortRetentionViewSet
 from accounts.views import UserProfileView
 
 router = DefaultRouter()
 
 # router.register(r'users/profile', UserProfileView, basename='userprofile')
 router.register(r'fitness_classes', FitnessClassViewSet, basename='fitnessclass') # ok 
+router.register(r'class_schedules', ClassScheduleViewSet, basename='classschedule')
 router.register(r'class_bookings', ClassBookingViewSet, basename='classbooking') # ok 
+router.register(r'class_waitlist', WaitlistViewSet, basename='waitlistentry')
 router.register(r'membership_plans', MembershipPlanViewSet, basename='membershipplan') # ok 
 router.register(r'memberships', MembershipViewSet, basename='membership') # ok
 router.register(r'payments', PaymentViewSet, basename='payment') # ok
 router.register(r'feedbacks', FeedbackViewSet, basename='feedback') # ok 
 router.register(r'attendances', AttendanceViewSet, basename='attendance') # 
 # router.register(r'reports', ReportViewSet, basename='report') #
+router.register(r'report_jobs', ReportJobViewSet, basename='reportjob')
+router.register(r'class_rollups', ClassRollupViewSet, basename='classrollup')
+router.register(r'instructor_rollups', InstructorDailyRollupViewSet, basename='instructordailyrollup')
+router.register(r'cohort_retention', CohortRetentionViewSet, basename='cohortretention')
 
 
 urlpatterns = [
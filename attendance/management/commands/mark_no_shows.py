@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from attendance import services
+
+
+class Command(BaseCommand):
+    help = "Record 'absent' attendance for booked members of finished classes who never checked in."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=services.NO_SHOW_CHUNK_SIZE,
+            help="Classes processed per transaction (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        swept, absences = services.sweep_no_shows(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Swept {swept} classes, recorded {absences} absences."))
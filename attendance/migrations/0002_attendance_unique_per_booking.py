@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 11:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_duplicate_attendances(apps, schema_editor):
+    # keep the latest record per booking before the unique constraint goes in
+    Attendance = apps.get_model('attendance', 'Attendance')
+    latest = (
+        Attendance.objects.values('class_booking')
+        .annotate(latest_id=models.Max('id'), total=models.Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in latest:
+        Attendance.objects.filter(class_booking=row['class_booking']).exclude(id=row['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0001_initial'),
+        ('classes', '0006_fitnessclass_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_attendances, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('class_booking',), name='unique_attendance_per_booking'),
+        ),
+    ]
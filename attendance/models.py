@@ -18,6 +18,10 @@ class Attendance(models.Model):
 
     class Meta:
         unique_together = ('user', 'fitness_class', 'attendance_date')
+        constraints = [
+            # one attendance record per booking; roster marking upserts on it
+            models.UniqueConstraint(fields=['class_booking'], name='unique_attendance_per_booking'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.fitness_class.name} - {self.attendance_date}"
\ No newline at end of file
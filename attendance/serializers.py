@@ -1,22 +1,39 @@
 from rest_framework import serializers
+from django.db import IntegrityError, transaction
 from attendance.models import Attendance
 from classes.serializers import FitnessClassSerializer, ClassBookingSerializer
 from accounts.models import CustomUser
 from classes.models import FitnessClass, ClassBooking
+from memberships.services import has_active_membership
 
 class AttendanceSerializer(serializers.ModelSerializer):
     fitness_class = FitnessClassSerializer(read_only=True)
     class_booking = ClassBookingSerializer(read_only=True)
+    booking = serializers.PrimaryKeyRelatedField(
+        queryset=ClassBooking.objects.select_related('fitness_class'),
+        source='class_booking', write_only=True, required=False,
+    )
 
     class Meta:
         model = Attendance
-        fields = ['id', 'user', 'fitness_class', 'class_booking', 'attendance_date' , 'status']
+        fields = ['id', 'user', 'fitness_class', 'class_booking', 'booking', 'attendance_date' , 'status']
+
+    def validate(self, attrs):
+        class_booking = attrs.get('class_booking')
+        if class_booking and attrs.get('user') and class_booking.user_id != attrs['user'].pk:
+            raise serializers.ValidationError({'booking': "This booking belongs to another user."})
+        user = attrs.get('user')
+        if self.instance is None and user and user.role == 'MEMBER' and not has_active_membership(user.pk):
+            raise serializers.ValidationError({'user': "This member has no active membership."})
+        return attrs
 
     def create(self, validated_data):
         user = validated_data.get('user')
 
-        # Automatically fetch the latest class booking for the user
-        class_booking = ClassBooking.objects.filter(user=user).order_by('-id').first()
+        class_booking = validated_data.get('class_booking')
+        if class_booking is None:
+            # Older clients send no booking: fall back to the user's latest class booking
+            class_booking = ClassBooking.objects.filter(user=user).select_related('fitness_class').order_by('-id').first()
         if not class_booking:
             raise serializers.ValidationError("This user has no class bookings.")
 
@@ -25,4 +42,41 @@ class AttendanceSerializer(serializers.ModelSerializer):
         validated_data['fitness_class'] = class_booking.fitness_class
         validated_data['attendance_date'] = class_booking.booking_date
 
-        return super().create(validated_data)
\ No newline at end of file
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError("Attendance for this booking is already recorded.")
+
+
+class RosterEntrySerializer(serializers.Serializer):
+    class_booking = serializers.IntegerField(source='id')
+    user = serializers.UUIDField(source='user_id')
+    email = serializers.EmailField(source='user.email')
+    booking_date = serializers.DateTimeField()
+    attendance = serializers.IntegerField(source='attendance_id', allow_null=True)
+    status = serializers.CharField(allow_null=True)
+
+
+class AttendanceMarkEntrySerializer(serializers.Serializer):
+    user = serializers.UUIDField()
+    status = serializers.ChoiceField(choices=Attendance.ATTENDANCE_STATUS)
+
+
+class AttendanceMarkSerializer(serializers.Serializer):
+    fitness_class = serializers.PrimaryKeyRelatedField(queryset=FitnessClass.objects.all())
+    marks = AttendanceMarkEntrySerializer(many=True, allow_empty=False)
+
+    def validate_marks(self, value):
+        if len(value) > 1000:
+            raise serializers.ValidationError("At most 1000 marks per request.")
+        return value
+
+
+class CheckInSerializer(serializers.Serializer):
+    token = serializers.CharField(max_length=512)
+
+
+class CheckInTokenSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    expires_at = serializers.DateTimeField()
@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone
+from attendance.models import Attendance
+from classes.models import FitnessClass, ClassBooking
+from memberships.services import has_active_membership
+from reports.rollups import mark_classes_dirty
+
+NO_SHOW_CHUNK_SIZE = 200
+CHECK_IN_TOKEN_SALT = 'attendance.check-in'
+# a displayed QR code is only good for a few minutes; the app refreshes it
+CHECK_IN_TOKEN_MAX_AGE = timedelta(minutes=10)
+# front desk opens this long before a class starts
+CHECK_IN_OPENS_BEFORE = timedelta(minutes=60)
+
+
+class CheckInError(Exception):
+    pass
+
+
+def class_roster(fitness_class_id):
+    """Booked members of a class with their current attendance status, in one query."""
+    attendance = Attendance.objects.filter(class_booking=OuterRef('pk')).order_by('-id')
+    return (
+        ClassBooking.objects.filter(fitness_class_id=fitness_class_id)
+        .select_related('user')
+        .annotate(
+            attendance_id=Subquery(attendance.values('id')[:1]),
+            status=Subquery(attendance.values('status')[:1]),
+        )
+        .order_by('user__email')
+    )
+
+
+@transaction.atomic
+def mark_roster(fitness_class_id, marks):
+    """
+    Upsert attendance for a whole class roster.
+    `marks` maps user id -> status. Bookings are resolved with one query and
+    all rows are written with one INSERT ... ON CONFLICT (class_booking) DO UPDATE.
+    Returns (saved attendances, user ids without a booking for the class).
+    """
+    bookings = {
+        booking.user_id: booking
+        for booking in ClassBooking.objects.filter(fitness_class_id=fitness_class_id, user_id__in=marks)
+    }
+    rows = [
+        Attendance(
+            user_id=user_id,
+            fitness_class_id=fitness_class_id,
+            class_booking=bookings[user_id],
+            status=status,
+        )
+        for user_id, status in marks.items()
+        if user_id in bookings
+    ]
+    Attendance.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['class_booking'],
+        update_fields=['status'],
+    )
+    if rows:
+        mark_classes_dirty([fitness_class_id])
+    return rows, [user_id for user_id in marks if user_id not in bookings]
+
+
+def make_check_in_token(booking):
+    """
+    Signed, short-lived check-in token for a booking.
+    Everything the kiosk needs is in the payload, so verifying it needs no
+    database access; the signature (SECRET_KEY) makes it tamper-proof.
+    """
+    fitness_class = booking.fitness_class
+    payload = {
+        'b': booking.pk,
+        'u': str(booking.user_id),
+        'c': booking.fitness_class_id,
+        's': int(fitness_class.schedule.timestamp()),
+        'd': fitness_class.duration,
+    }
+    token = signing.dumps(payload, salt=CHECK_IN_TOKEN_SALT, compress=True)
+    return token, timezone.now() + CHECK_IN_TOKEN_MAX_AGE
+
+
+def read_check_in_token(token, now=None):
+    """Verify a check-in token and the class check-in window, without touching the database."""
+    try:
+        payload = signing.loads(token, salt=CHECK_IN_TOKEN_SALT, max_age=CHECK_IN_TOKEN_MAX_AGE)
+    except signing.SignatureExpired:
+        raise CheckInError("This check-in code has expired, refresh it and try again.")
+    except signing.BadSignature:
+        raise CheckInError("Invalid check-in code.")
+
+    now = now or timezone.now()
+    starts_at = datetime.fromtimestamp(payload['s'], tz=dt_timezone.utc)
+    ends_at = starts_at + timedelta(minutes=payload['d'])
+    if now < starts_at - CHECK_IN_OPENS_BEFORE:
+        raise CheckInError("Check-in for this class is not open yet.")
+    if now > ends_at:
+        raise CheckInError("This class has already finished.")
+    payload['late'] = now > starts_at
+    return payload
+
+
+def check_in(token, now=None):
+    """
+    Record attendance from a kiosk scan with a single INSERT.
+    The booking is addressed by primary key from the token; scanning twice
+    keeps the first record; the membership check is normally a cache hit.
+    Returns the attendance status.
+    """
+    payload = read_check_in_token(token, now=now)
+    if not has_active_membership(payload['u'], now=now):
+        raise CheckInError("This member has no active membership.")
+    status = 'late' if payload['late'] else 'present'
+    try:
+        # foreign keys are checked at commit, so keep the insert in its own block
+        with transaction.atomic():
+            Attendance.objects.bulk_create(
+                [Attendance(
+                    user_id=payload['u'],
+                    fitness_class_id=payload['c'],
+                    class_booking_id=payload['b'],
+                    status=status,
+                )],
+                ignore_conflicts=True,
+            )
+            mark_classes_dirty([payload['c']])
+    except IntegrityError:
+        # the booking was cancelled after the code was issued
+        raise CheckInError("This booking no longer exists.")
+    return {'class_booking': payload['b'], 'user': payload['u'], 'fitness_class': payload['c'], 'status': status}
+
+
+def sweep_no_shows(now=None, chunk_size=NO_SHOW_CHUNK_SIZE):
+    """
+    Record an 'absent' attendance for every booked member of a finished class
+    who never checked in.
+    Only classes not swept yet are visited (partial index on schedule), a
+    chunk of classes at a time, so a long backlog runs in bounded memory.
+    Each chunk is one transaction: one anti-join read, one bulk insert and
+    one UPDATE marking the classes as swept. Re-running is a no-op.
+    Returns (classes swept, absences recorded).
+    """
+    now = now or timezone.now()
+    swept = absences = 0
+    unswept = FitnessClass.objects.filter(attendance_swept_at__isnull=True, schedule__lt=now).order_by('schedule', 'id')
+    after = Q()
+    while True:
+        candidates = list(unswept.filter(after).values_list('id', 'schedule', 'duration')[:chunk_size])
+        if not candidates:
+            break
+        # keyset continuation, stepping over classes that started but have not finished yet
+        last_id, last_schedule, _ = candidates[-1]
+        after = Q(schedule__gt=last_schedule) | Q(schedule=last_schedule, id__gt=last_id)
+        finished = [class_id for class_id, schedule, duration in candidates if schedule + timedelta(minutes=duration) <= now]
+        if not finished:
+            continue
+
+        with transaction.atomic():
+            missing = (
+                ClassBooking.objects.filter(fitness_class_id__in=finished)
+                .filter(~Exists(Attendance.objects.filter(class_booking=OuterRef('pk'))))
+                .values_list('id', 'user_id', 'fitness_class_id')
+            )
+            rows = [
+                Attendance(class_booking_id=booking_id, user_id=user_id, fitness_class_id=class_id, status='absent')
+                for booking_id, user_id, class_id in missing
+            ]
+            # a member checking in concurrently wins: their row already holds the booking
+            Attendance.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+            FitnessClass.objects.filter(id__in=finished).update(attendance_swept_at=now)
+            mark_classes_dirty({row.fitness_class_id for row in rows})
+        swept += len(finished)
+        absences += len(rows)
+    return swept, absences
@@ -1,3 +1,232 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from attendance import services
+from attendance.models import Attendance
+from classes.models import FitnessClass, ClassBooking
+from classes.serializers import FitnessClassSerializer
+from core.testing import make_user, make_class, give_membership
 
 # Create your tests here.
+
+class NoShowSweepTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.coach = make_user('coach@example.com', 'STAFF')
+        self.members = [make_user(f'member{i}@example.com') for i in range(3)]
+        # finished, finished, still running, upcoming
+        self.classes = [
+            make_class(self.coach, f'Class {i}', starts_in=starts_in)
+            for i, starts_in in enumerate([-timedelta(days=2), -timedelta(days=1), -timedelta(minutes=30), timedelta(days=1)])
+        ]
+        for fitness_class in self.classes:
+            for member in self.members:
+                ClassBooking.objects.create(user=member, fitness_class=fitness_class)
+        services.mark_roster(self.classes[0].pk, {self.members[0].pk: 'present'})
+
+    def absences(self):
+        return sorted(Attendance.objects.filter(status='absent').values_list('fitness_class_id', 'user_id'))
+
+    def swept_at(self):
+        return dict(FitnessClass.objects.values_list('id', 'attendance_swept_at'))
+
+    def test_only_finished_classes_are_swept_and_checked_in_members_kept(self):
+        self.assertEqual(services.sweep_no_shows(now=self.now, chunk_size=1), (2, 5))
+        expected = sorted(
+            (fitness_class.pk, member.pk) for fitness_class in self.classes[:2] for member in self.members
+            if (fitness_class, member) != (self.classes[0], self.members[0])
+        )
+        self.assertEqual(self.absences(), expected)
+        self.assertEqual(Attendance.objects.get(user=self.members[0], fitness_class=self.classes[0]).status, 'present')
+        swept_at = self.swept_at()
+        self.assertEqual([swept_at[fitness_class.pk] for fitness_class in self.classes], [self.now, self.now, None, None])
+
+    def test_rerunning_is_a_no_op(self):
+        services.sweep_no_shows(now=self.now)
+        absences, swept_at = self.absences(), self.swept_at()
+        # a late roster correction is not undone by the next run
+        services.mark_roster(self.classes[1].pk, {self.members[1].pk: 'late'})
+        self.assertEqual(services.sweep_no_shows(now=self.now + timedelta(minutes=5)), (0, 0))
+        self.assertEqual(len(self.absences()), len(absences) - 1)
+        self.assertEqual(self.swept_at(), swept_at)
+
+    def test_running_class_is_swept_once_it_finishes(self):
+        services.sweep_no_shows(now=self.now)
+        later = self.now + timedelta(hours=1)
+        self.assertEqual(services.sweep_no_shows(now=later), (1, 3))
+        self.assertEqual(self.swept_at()[self.classes[2].pk], later)
+        self.assertEqual(services.sweep_no_shows(now=later), (0, 0))
+
+    def test_stale_class_edit_keeps_the_watermark(self):
+        stale = FitnessClass.objects.get(pk=self.classes[0].pk)
+        services.sweep_no_shows(now=self.now)
+        serializer = FitnessClassSerializer(stale, data={'description': 'Renamed after the fact'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(self.swept_at()[self.classes[0].pk], self.now)
+        self.assertEqual(services.sweep_no_shows(now=self.now), (0, 0))
+
+
+class RosterEndpointTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach@example.com', 'STAFF')
+        self.other_coach = make_user('other@example.com', 'STAFF')
+        self.admin = make_user('admin@example.com', 'ADMIN')
+        self.members = [make_user(f'member{i}@example.com') for i in range(3)]
+        self.outsider = make_user('outsider@example.com')
+        self.fitness_class = make_class(self.coach, starts_in=-timedelta(minutes=10))
+        for member in self.members:
+            ClassBooking.objects.create(user=member, fitness_class=self.fitness_class)
+        self.client = APIClient()
+
+    def mark(self, user, marks):
+        self.client.force_authenticate(user)
+        return self.client.post('/attendances/mark/', {
+            'fitness_class': self.fitness_class.pk,
+            'marks': [{'user': str(member.pk), 'status': status} for member, status in marks],
+        }, format='json')
+
+    def statuses(self):
+        return dict(Attendance.objects.values_list('user__email', 'status'))
+
+    def test_roster_lists_booked_members(self):
+        self.client.force_authenticate(self.coach)
+        response = self.client.get('/attendances/roster/', {'fitness_class': self.fitness_class.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['email'] for entry in response.data], [member.email for member in self.members])
+        self.assertTrue(all(entry['status'] is None for entry in response.data))
+
+    def test_roster_rejects_bad_requests(self):
+        self.client.force_authenticate(self.coach)
+        self.assertEqual(self.client.get('/attendances/roster/').status_code, 400)
+        self.assertEqual(self.client.get('/attendances/roster/', {'fitness_class': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/attendances/roster/', {'fitness_class': self.fitness_class.pk + 100}).status_code, 404)
+        self.client.force_authenticate(self.members[0])
+        self.assertEqual(self.client.get('/attendances/roster/', {'fitness_class': self.fitness_class.pk}).status_code, 403)
+
+    def test_instructor_marks_the_roster(self):
+        response = self.mark(self.coach, [(self.members[0], 'present'), (self.members[1], 'late')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['not_booked'], [])
+        self.assertEqual(
+            [entry['status'] for entry in response.data['roster']],
+            ['present', 'late', None],
+        )
+
+    def test_other_staff_cannot_mark(self):
+        response = self.mark(self.other_coach, [(self.members[0], 'present')])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_admin_marks_any_class(self):
+        self.assertEqual(self.mark(self.admin, [(self.members[0], 'present')]).status_code, 200)
+        self.assertEqual(self.statuses(), {'member0@example.com': 'present'})
+
+    def test_members_cannot_mark(self):
+        self.assertEqual(self.mark(self.members[0], [(self.members[0], 'present')]).status_code, 403)
+
+    def test_users_not_on_the_roster_are_skipped(self):
+        response = self.mark(self.coach, [(self.outsider, 'present'), (self.members[2], 'absent')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['not_booked'], [self.outsider.pk])
+        self.assertEqual(self.statuses(), {'member2@example.com': 'absent'})
+
+    def test_remarking_updates_the_same_record(self):
+        self.mark(self.coach, [(self.members[0], 'absent')])
+        first = Attendance.objects.get()
+        response = self.mark(self.coach, [(self.members[0], 'late'), (self.members[1], 'present')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Attendance.objects.count(), 2)
+        self.assertEqual(Attendance.objects.get(user=self.members[0]).pk, first.pk)
+        self.assertEqual(self.statuses(), {'member0@example.com': 'late', 'member1@example.com': 'present'})
+
+    def test_unknown_status_is_rejected(self):
+        self.assertEqual(self.mark(self.coach, [(self.members[0], 'asleep')]).status_code, 400)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class CheckInTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.coach = make_user('coach@example.com', 'STAFF')
+        self.member = make_user('member@example.com')
+        give_membership(self.member)
+        # whole seconds, as the token carries the start as a timestamp
+        self.start = (timezone.now() + timedelta(hours=2)).replace(microsecond=0)
+        self.fitness_class = FitnessClass.objects.create(
+            name='Spin', description='spin', duration=60, max_capacity=10, instructor=self.coach, schedule=self.start,
+        )
+        self.booking = ClassBooking.objects.create(user=self.member, fitness_class=self.fitness_class)
+        self.token, _ = services.make_check_in_token(self.booking)
+        self.client = APIClient()
+
+    def check_in(self, offset):
+        return services.check_in(self.token, now=self.start + offset)['status']
+
+    def refused(self, offset):
+        with self.assertRaises(services.CheckInError) as raised:
+            services.check_in(self.token, now=self.start + offset)
+        return str(raised.exception)
+
+    def test_window_opens_an_hour_before_the_start(self):
+        self.assertEqual(self.refused(-services.CHECK_IN_OPENS_BEFORE - timedelta(seconds=1)), "Check-in for this class is not open yet.")
+        self.assertEqual(self.check_in(-services.CHECK_IN_OPENS_BEFORE), 'present')
+
+    def test_late_after_the_start(self):
+        self.assertEqual(self.check_in(timedelta(0)), 'present')
+        Attendance.objects.all().delete()
+        self.assertEqual(self.check_in(timedelta(seconds=1)), 'late')
+
+    def test_window_closes_when_the_class_ends(self):
+        self.assertEqual(self.refused(timedelta(minutes=60, seconds=1)), "This class has already finished.")
+        self.assertEqual(self.check_in(timedelta(minutes=60)), 'late')
+
+    def test_duplicate_scan_keeps_the_first_record(self):
+        self.check_in(-timedelta(minutes=5))
+        self.check_in(timedelta(minutes=5))
+        attendance = Attendance.objects.get()
+        self.assertEqual((attendance.class_booking_id, attendance.status), (self.booking.pk, 'present'))
+
+    def test_tampered_code_is_rejected(self):
+        self.token = self.token[:-2] + ('AA' if not self.token.endswith('AA') else 'BB')
+        self.assertEqual(self.refused(timedelta(0)), "Invalid check-in code.")
+        self.assertFalse(Attendance.objects.exists())
+
+    def test_lapsed_member_is_refused(self):
+        self.member.memberships.update(is_active=False)
+        cache.clear()
+        self.assertEqual(self.refused(timedelta(0)), "This member has no active membership.")
+
+    def test_kiosk_endpoint(self):
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.post('/attendances/check_in/', {'token': self.token}, format='json').status_code, 403)
+        self.client.force_authenticate(self.coach)
+        self.assertEqual(self.client.post('/attendances/check_in/', {'token': 'garbage'}, format='json').status_code, 400)
+        # the class starts in two hours, so the window is not open yet
+        response = self.client.post('/attendances/check_in/', {'token': self.token}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Attendance.objects.exists())
+
+        soon = make_class(self.coach, 'Soon', starts_in=timedelta(minutes=10))
+        token, _ = services.make_check_in_token(ClassBooking.objects.create(user=self.member, fitness_class=soon))
+        response = self.client.post('/attendances/check_in/', {'token': token}, format='json')
+        self.assertEqual((response.status_code, response.data['status']), (200, 'present'))
+        self.assertEqual(Attendance.objects.get().fitness_class_id, soon.pk)
+
+
+class CheckInWithoutBookingTests(TransactionTestCase):
+    """Foreign keys are checked when check_in's insert commits, so this needs real transactions."""
+
+    def test_cancelled_booking_is_refused(self):
+        cache.clear()
+        member = make_user('member@example.com')
+        give_membership(member)
+        fitness_class = make_class(make_user('coach@example.com', 'STAFF'), starts_in=timedelta(minutes=10))
+        booking = ClassBooking.objects.create(user=member, fitness_class=fitness_class)
+        token, _ = services.make_check_in_token(booking)
+        booking.delete()
+        with self.assertRaisesMessage(services.CheckInError, "This booking no longer exists."):
+            services.check_in(token)
+        self.assertFalse(Attendance.objects.exists())
@@ -7,9 +7,13 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from attendance.models import Attendance
-from attendance.serializers import AttendanceSerializer
+from attendance.serializers import AttendanceSerializer, RosterEntrySerializer, AttendanceMarkSerializer, CheckInSerializer
+from attendance import services
+from classes.models import FitnessClass
+from core.exports import EXPORT_PARAMETER, export_response, ATTENDANCE_REPORT_COLUMNS
 from core.permissions import IsAdminOrStaff
 from drf_yasg.utils import swagger_auto_schema
+from drf_yasg import openapi
 
 # Create your views here.
 
@@ -68,9 +72,70 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     #     serializer.save()
     #     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @swagger_auto_schema(
+        operation_description="Booked members of a class with their current attendance status (Admin and Staff only).",
+        manual_parameters=[
+            openapi.Parameter('fitness_class', openapi.IN_QUERY, description="Fitness class id", type=openapi.TYPE_INTEGER, required=True),
+        ],
+        responses={200: RosterEntrySerializer(many=True), 400: "Bad Request", 404: "Not Found"}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
+    def roster(self, request):
+        fitness_class_id = request.query_params.get('fitness_class')
+        if not fitness_class_id or not fitness_class_id.isdigit():
+            return Response({'error': 'fitness_class is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if not FitnessClass.objects.filter(pk=fitness_class_id).exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        roster = services.class_roster(fitness_class_id)
+        return Response(RosterEntrySerializer(roster, many=True).data)
+
+    @swagger_auto_schema(
+        operation_description="Mark present/late/absent for a whole class roster in one request (Admins, and Staff for the classes they teach).\n\nExisting records are updated, missing ones created, all in one transaction. Users without a booking for the class are skipped and listed in `not_booked`.",
+        request_body=AttendanceMarkSerializer,
+        responses={200: "Updated roster and users without a booking", 400: "Bad Request", 403: "Not the instructor of the class"}
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminOrStaff])
+    def mark(self, request):
+        serializer = AttendanceMarkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        fitness_class = serializer.validated_data['fitness_class']
+        user = request.user
+        if not (user.is_superuser or user.role == 'ADMIN') and fitness_class.instructor_id != user.pk:
+            return Response({'detail': 'Only the instructor of this class can mark its attendance.'}, status=status.HTTP_403_FORBIDDEN)
+        marks = {entry['user']: entry['status'] for entry in serializer.validated_data['marks']}
+
+        _, not_booked = services.mark_roster(fitness_class.id, marks)
+        roster = services.class_roster(fitness_class.id)
+        return Response({
+            'not_booked': not_booked,
+            'roster': RosterEntrySerializer(roster, many=True).data,
+        })
+
+    @swagger_auto_schema(
+        operation_description="Front desk kiosk: check a member in from the code of their booking (Admin and Staff only).\n\nThe code is verified from its signature alone; attendance is recorded with a single insert. Scanning after the class started records `late`.",
+        request_body=CheckInSerializer,
+        responses={200: "Recorded status", 400: "Invalid, expired or out-of-window code"}
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminOrStaff])
+    def check_in(self, request):
+        serializer = CheckInSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = services.check_in(serializer.validated_data['token'])
+        except services.CheckInError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+    @swagger_auto_schema(
+        operation_description="Attendance report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def attendance_report(self, request):
         """Generate attendance reports for admins."""
         attendance_data = self.filter_queryset(self.get_queryset())
+        response = export_response(request, attendance_data, ATTENDANCE_REPORT_COLUMNS, 'attendance')
+        if response is not None:
+            return response
         serializer = self.get_serializer(attendance_data, many=True)
         return Response(serializer.data)
\ No newline at end of file
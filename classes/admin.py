@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import FitnessClass, ClassBooking
+from .models import ClassSchedule, FitnessClass, ClassBooking, WaitlistEntry
 
 # Register your models here.
 
+admin.site.register(ClassSchedule)
 admin.site.register(FitnessClass)
-admin.site.register(ClassBooking)
\ No newline at end of file
+admin.site.register(ClassBooking)
+admin.site.register(WaitlistEntry)
\ No newline at end of file
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from accounts.models import CustomUser
+from classes import services
+from classes.models import FitnessClass, ClassBooking
+from classes.serializers import ClassBookingSerializer, BulkEnrollSerializer
+from core.benchmarks import measure, rolled_back
+
+
+class Command(BaseCommand):
+    help = (
+        "Enrol a group into a set of classes with one ClassBookingSerializer save per pair "
+        "and with bulk_enroll, and compare queries and time. Runs in a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=250, help="Members enrolled (default: %(default)s).")
+        parser.add_argument('--classes', type=int, default=3, help="Classes per path (default: %(default)s).")
+        parser.add_argument('--capacity', type=int, default=200, help="Seats per class (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            instructor = CustomUser.objects.create_user(email='benchmark-instructor@example.invalid', role='STAFF')
+            members = CustomUser.objects.bulk_create(
+                CustomUser(email=f'benchmark-member-{i}@example.invalid') for i in range(options['users'])
+            )
+
+            def new_classes(label):
+                return FitnessClass.objects.bulk_create(
+                    FitnessClass(
+                        name=f'Benchmark {label} {i}', description=label, duration=60,
+                        max_capacity=options['capacity'], instructor=instructor,
+                        schedule=timezone.now() + timedelta(days=1, hours=i),
+                    )
+                    for i in range(options['classes'])
+                )
+
+            def per_row(classes):
+                # what one POST /class_bookings/ per member and class does past authentication
+                for member in members:
+                    request = SimpleNamespace(user=member)
+                    for fitness_class in classes:
+                        serializer = ClassBookingSerializer(data={'fitness_class': fitness_class.pk}, context={'request': request})
+                        serializer.is_valid(raise_exception=True)
+                        try:
+                            serializer.save()
+                        except ValidationError:
+                            pass
+
+            def bulk(classes):
+                serializer = BulkEnrollSerializer(data={
+                    'users': [member.pk for member in members],
+                    'fitness_classes': [fitness_class.pk for fitness_class in classes],
+                })
+                serializer.is_valid(raise_exception=True)
+                services.bulk_enroll(serializer.validated_data['users'], serializer.validated_data['fitness_classes'])
+
+            pairs = len(members) * options['classes']
+            for label, path in [('per-row', per_row), ('bulk_enroll', bulk)]:
+                classes = new_classes(label)
+                _, queries, seconds = measure(path, classes)
+                booked = ClassBooking.objects.filter(fitness_class__in=classes).count()
+                self.stdout.write(
+                    f"{label:>12}: {pairs} pairs, {booked} booked, {queries} queries, "
+                    f"{seconds:.3f}s ({seconds / pairs * 1000:.2f} ms/pair)"
+                )
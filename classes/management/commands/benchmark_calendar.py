@@ -0,0 +1,71 @@
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from accounts.models import CustomUser
+from classes.models import FitnessClass
+from classes.views import FitnessClassViewSet, parse_calendar_bound
+from core.benchmarks import measure, rolled_back
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a synthetic timetable and walk a month of /fitness_classes/calendar/ "
+        "cursor by cursor, reporting queries and time per response. Runs in a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=100_000, help="Classes loaded (default: %(default)s).")
+        parser.add_argument('--instructors', type=int, default=50, help="Instructors teaching them (default: %(default)s).")
+        parser.add_argument('--days', type=int, default=31, help="Calendar range walked (default: %(default)s).")
+        parser.add_argument('--limit', type=int, default=500, help="Classes per response (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        total, days = options['classes'], options['days']
+        with rolled_back():
+            instructors = CustomUser.objects.bulk_create(
+                CustomUser(email=f'benchmark-instructor-{i}@example.invalid', role='STAFF')
+                for i in range(options['instructors'])
+            )
+            # spread evenly over two years, starting a year ago
+            origin = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=365), time(6)))
+            step = timedelta(days=730) / total
+            FitnessClass.objects.bulk_create(
+                (
+                    FitnessClass(
+                        name=f'Benchmark {i}', description='benchmark', duration=45, max_capacity=20,
+                        instructor=instructors[i % len(instructors)], schedule=origin + step * i,
+                    )
+                    for i in range(total)
+                ),
+                batch_size=5000,
+            )
+
+            start = timezone.localdate()
+            params = {'from': start.isoformat(), 'to': (start + timedelta(days=days - 1)).isoformat(), 'limit': options['limit']}
+            view = FitnessClassViewSet.as_view({'get': 'calendar'})
+            factory = APIRequestFactory()
+            responses = queries = classes = 0
+            elapsed = slowest = 0.0
+            while True:
+                response, count, seconds = measure(view, factory.get('/fitness_classes/calendar/', params))
+                response.render()
+                responses += 1
+                queries += count
+                elapsed += seconds
+                slowest = max(slowest, seconds)
+                classes += sum(len(day) for day in response.data['days'].values())
+                if not response.data['next']:
+                    break
+                params['cursor'] = response.data['next']
+
+            plan = FitnessClass.objects.filter(
+                schedule__gte=parse_calendar_bound(params['from']),
+                schedule__lt=parse_calendar_bound(params['to'], end_of_day=True),
+            ).order_by('schedule', 'id')[:options['limit']].explain()
+            self.stdout.write(f"{total} classes loaded; {days} day range holds {classes} classes")
+            self.stdout.write(
+                f"{responses} responses, {queries} queries, {elapsed:.3f}s total, "
+                f"{elapsed / responses * 1000:.1f} ms/response average, {slowest * 1000:.1f} ms slowest"
+            )
+            self.stdout.write(f"plan: {plan}")
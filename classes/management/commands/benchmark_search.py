@@ -0,0 +1,83 @@
+import random
+import string
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import CustomUser
+from classes.models import FitnessClass
+from core import search
+from core.benchmarks import measure, rolled_back
+
+PAGE_SIZE = 20
+
+
+def icontains_search(queryset, text):
+    """What ?search= did before core.search: every word ILIKE '%word%' on each searched column."""
+    for token in search.tokenize(text):
+        queryset = queryset.filter(
+            Q(name__icontains=token) | Q(description__icontains=token) | Q(instructor__email__icontains=token)
+        )
+    return queryset.order_by('pk')
+
+
+def first_page(queryset):
+    # what a paginated listing runs: the count and one page
+    return queryset.count(), list(queryset[:PAGE_SIZE])
+
+
+class Command(BaseCommand):
+    help = (
+        "Load synthetic classes, index them and compare ?search= through core.search with the "
+        "icontains scan it replaced: queries and warm time per listing page. Runs in a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=100_000, help="Classes loaded (default: %(default)s).")
+        parser.add_argument('--instructors', type=int, default=50, help="Instructors teaching them (default: %(default)s).")
+        parser.add_argument('--vocabulary', type=int, default=5000, help="Distinct words in names and descriptions (default: %(default)s).")
+        parser.add_argument('--repeat', type=int, default=5, help="Warm runs timed per query (default: %(default)s).")
+        parser.add_argument('--seed', type=int, default=8, help="Random seed (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = sorted({''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(options['vocabulary'])})
+        total = options['classes']
+        with rolled_back():
+            instructors = CustomUser.objects.bulk_create(
+                CustomUser(email=f'benchmark.instructor{i}@gym.example.invalid', role='STAFF')
+                for i in range(options['instructors'])
+            )
+            schedule = timezone.now() + timedelta(days=1)
+            FitnessClass.objects.bulk_create(
+                (
+                    FitnessClass(
+                        name=' '.join(rng.choices(words, k=2)), description=' '.join(rng.choices(words, k=8)),
+                        duration=45, max_capacity=20, instructor=instructors[i % len(instructors)],
+                        schedule=schedule + timedelta(minutes=i),
+                    )
+                    for i in range(total)
+                ),
+                batch_size=5000,
+            )
+            # bulk_create skips the post_save indexing
+            pks = list(FitnessClass.objects.order_by('pk').values_list('pk', flat=True))
+            _, index_queries, index_seconds = measure(lambda: [
+                search.update_search_index(FitnessClass.objects.filter(pk__in=pks[start:start + 5000]))
+                for start in range(0, len(pks), 5000)
+            ])
+            backend = 'tsvector' if search.uses_tsvector() else 'core.SearchTerm'
+            self.stdout.write(f"{total} classes indexed ({backend}) in {index_seconds:.1f}s, {index_queries} queries")
+
+            word, other = words[len(words) // 2], words[-1]
+            # a word, a prefix, two words, an instructor email part and a miss
+            texts = [word, word[:3], f'{word} {other}', 'instructor7', 'nosuchword']
+            for text in texts:
+                for label, run in [('full-text', search.search), ('icontains', icontains_search)]:
+                    queryset = run(FitnessClass.objects.all(), text)
+                    (found, _), queries, _ = measure(first_page, queryset)
+                    timings = [measure(first_page, queryset)[2] for _ in range(options['repeat'])]
+                    self.stdout.write(
+                        f"{text!r:>24} {label:>9}: {found:>6} matches, {queries} queries, "
+                        f"{sum(timings) / len(timings) * 1000:.1f} ms warm average, {min(timings) * 1000:.1f} ms best"
+                    )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from classes import services
+
+
+class Command(BaseCommand):
+    help = "Materialize recurring class schedules into fitness classes over a rolling horizon."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=services.SCHEDULE_HORIZON_DAYS,
+            help="How many days ahead to materialize (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        created, skipped = services.materialize_schedules(horizon_days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Created {created} class occurrences."))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} occurrences that would double-book their instructor."))
@@ -0,0 +1,70 @@
+from django.db import models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Greatest
+
+RATING_VALUES = range(1, 6)
+
+
+def rating_changes(rating, count):
+    """
+    UPDATE assignments adding `count` (1, or -1 to take it back) ratings of
+    `rating` stars to the rating_* counters of a row. The average is computed
+    from the old counters in the same statement.
+    """
+    return {
+        'rating_count': F('rating_count') + count,
+        'rating_sum': F('rating_sum') + count * rating,
+        f'rating_{rating}': F(f'rating_{rating}') + count,
+        'rating_average': Cast(F('rating_sum') + count * rating, FloatField()) / Greatest(F('rating_count') + count, 1),
+    }
+
+
+class FitnessClassQuerySet(models.QuerySet):
+    def reserve_seats(self, pk, seats=1):
+        """
+        Take `seats` seats on a class in one conditional UPDATE.
+        The row is only touched while enough seats are left, so concurrent
+        callers can never push booked_count past max_capacity.
+        Returns True when the seats were taken.
+        """
+        return self.filter(
+            pk=pk,
+            booked_count__lte=F('max_capacity') - seats,
+        ).update(booked_count=F('booked_count') + seats) == 1
+
+    def release_seats(self, pk, seats=1):
+        """Give back `seats` seats on a class, never going below zero."""
+        return self.filter(
+            pk=pk,
+            booked_count__gte=seats,
+        ).update(booked_count=F('booked_count') - seats) == 1
+
+    def add_rating(self, pk, rating):
+        """Count one `rating` star feedback towards a class, in one UPDATE."""
+        return self.filter(pk=pk).update(**rating_changes(rating, 1)) == 1
+
+    def remove_rating(self, pk, rating):
+        """Take back one `rating` star feedback from a class, never going below zero."""
+        return self.filter(pk=pk, **{f'rating_{rating}__gte': 1}).update(**rating_changes(rating, -1)) == 1
+
+
+class FitnessClassManager(models.Manager.from_queryset(FitnessClassQuerySet)):
+    pass
+
+
+class WaitlistEntryQuerySet(models.QuerySet):
+    def with_position(self):
+        """
+        Annotate each entry's 1-based place in its class queue as
+        `queue_position`: a correlated count over the (fitness_class, id)
+        index, computed in the same query as the entries themselves.
+        """
+        ahead = (
+            self.model.objects.filter(fitness_class_id=OuterRef('fitness_class_id'), id__lte=OuterRef('id'))
+            .order_by().values('fitness_class_id').annotate(total=Count('id')).values('total')
+        )
+        return self.annotate(queue_position=Subquery(ahead))
+
+
+class WaitlistEntryManager(models.Manager.from_queryset(WaitlistEntryQuerySet)):
+    pass
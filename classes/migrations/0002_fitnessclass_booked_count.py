@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 11:15
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_booked_count(apps, schema_editor):
+    FitnessClass = apps.get_model('classes', 'FitnessClass')
+    ClassBooking = apps.get_model('classes', 'ClassBooking')
+    counts = models.Subquery(
+        ClassBooking.objects.filter(fitness_class=models.OuterRef('pk'))
+        .order_by()
+        .values('fitness_class')
+        .annotate(total=models.Count('pk'))
+        .values('total')
+    )
+    FitnessClass.objects.update(booked_count=Coalesce(counts, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_booked_count, migrations.RunPython.noop),
+    ]
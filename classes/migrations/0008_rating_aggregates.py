@@ -0,0 +1,82 @@
+# Generated by Django 5.2 on 2026-10-18 12:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    FitnessClass = apps.get_model('classes', 'FitnessClass')
+    Feedback = apps.get_model('feedback', 'Feedback')
+    counters = {}
+    for class_id, rating, total in (
+        Feedback.objects.order_by().values_list('fitness_class_id', 'rating').annotate(total=models.Count('pk'))
+    ):
+        counters.setdefault(class_id, {})[rating] = total
+    fields = ['rating_count', 'rating_sum', 'rating_average', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+    classes = []
+    for class_id, histogram in counters.items():
+        fitness_class = FitnessClass(pk=class_id)
+        fitness_class.rating_count = sum(histogram.values())
+        fitness_class.rating_sum = sum(rating * total for rating, total in histogram.items())
+        fitness_class.rating_average = fitness_class.rating_sum / fitness_class.rating_count
+        for rating in range(1, 6):
+            setattr(fitness_class, f'rating_{rating}', histogram.get(rating, 0))
+        classes.append(fitness_class)
+    FitnessClass.objects.bulk_update(classes, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classes', '0007_fitnessclass_attendance_swept_at'),
+        ('feedback', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_average',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fitnessclass',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='fitnessclass',
+            index=models.Index(fields=['-rating_average', '-rating_count'], name='class_top_rated_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
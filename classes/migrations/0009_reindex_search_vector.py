@@ -0,0 +1,37 @@
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Replace
+
+
+def _text(expression):
+    return Coalesce(expression, Value(''), output_field=TextField())
+
+
+# instructor emails are now indexed as their parts (see core.search._document_text);
+# other backends rebuild the core.SearchTerm index with `manage.py rebuild_search_index`
+def reindex_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    FitnessClass = apps.get_model('classes', 'FitnessClass')
+    CustomUser = FitnessClass._meta.get_field('instructor').related_model
+    instructor_email = _text(Subquery(CustomUser.objects.filter(pk=OuterRef('instructor_id')).values('email')[:1]))
+    for separator in '@.':
+        instructor_email = Replace(instructor_email, Value(separator), Value(' '), output_field=TextField())
+    # a frozen copy of core.search.search_vector_expression as of this migration
+    FitnessClass.objects.update(search_vector=(
+        SearchVector(_text(F('name')), weight='A')
+        + SearchVector(_text(F('description')), weight='B')
+        + SearchVector(instructor_email, weight='C')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('classes', '0008_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_search_vector, migrations.RunPython.noop),
+    ]
@@ -1,32 +1,120 @@
-from django.db import models
+from django.db import models, transaction
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from accounts.models import CustomUser
 from cloudinary.models import CloudinaryField
+from classes.managers import FitnessClassManager, WaitlistEntryManager
 
 # Create your models here.
 
+class ClassSchedule(models.Model):
+    """
+    A weekly recurrence (RRULE FREQ=WEEKLY;BYDAY=...) that is materialized into
+    FitnessClass rows over a rolling horizon by classes.services.materialize_schedules.
+    """
+    WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+    name = models.CharField(max_length=255)
+    description = models.TextField()
+    duration = models.IntegerField()
+    max_capacity = models.IntegerField()
+    instructor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='class_schedules')
+    weekdays = models.CharField(max_length=20, help_text="Comma separated RRULE BYDAY codes, e.g. MO,WE,FR")
+    start_time = models.TimeField()
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    generated_until = models.DateField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.weekdays} {self.start_time:%H:%M})"
+
+    def weekday_numbers(self):
+        return {self.WEEKDAYS.index(code.strip().upper()) for code in self.weekdays.split(',') if code.strip()}
+
+    def clean(self):
+        super().clean()
+        codes = [code.strip().upper() for code in self.weekdays.split(',') if code.strip()]
+        if not codes or any(code not in self.WEEKDAYS for code in codes):
+            raise ValidationError("Weekdays must be a comma separated list of MO, TU, WE, TH, FR, SA, SU.")
+        if self.max_capacity <= 0:
+            raise ValidationError("Max capacity must be a positive integer.")
+        if self.end_date and self.end_date < self.start_date:
+            raise ValidationError("End date must not be before start date.")
+
+
 class FitnessClass(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     image = CloudinaryField('Class_Image', null=True, blank=True)
     duration = models.IntegerField()
     max_capacity = models.IntegerField()
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
     instructor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='fitness_classes')
     schedule = models.DateTimeField()
+    recurrence = models.ForeignKey(ClassSchedule, on_delete=models.SET_NULL, null=True, blank=True, related_name='occurrences')
+    # maintained by core.search; GIN-indexed on PostgreSQL (see migration 0006)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # set by the no-show sweeper once absentees of the finished class are recorded
+    attendance_swept_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # feedback rating aggregates, kept current by Feedback.save and feedback.signals
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = FitnessClassManager()
+
+    # Written only by UPDATEs relative to the stored row (see classes.managers).
+    # Saving an existing class leaves them out, so an edit made from an
+    # instance loaded before a booking cannot write back stale counts.
+    MAINTAINED_FIELDS = [
+        'booked_count', 'attendance_swept_at',
+        'rating_count', 'rating_sum', 'rating_average', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5',
+    ]
+
+    class Meta:
+        constraints = [
+            # a recurrence materializes each slot at most once
+            models.UniqueConstraint(fields=['recurrence', 'schedule'], name='unique_recurrence_occurrence'),
+        ]
+        indexes = [
+            # calendar range scans and keyset continuation
+            models.Index(fields=['schedule', 'id'], name='class_schedule_idx'),
+            models.Index(fields=['instructor', 'schedule'], name='class_instructor_schedule_idx'),
+            # only classes still waiting for the no-show sweep
+            models.Index(fields=['schedule', 'id'], condition=models.Q(attendance_swept_at__isnull=True), name='class_unswept_idx'),
+            # ?ordering=-rating_average ("top rated")
+            models.Index(fields=['-rating_average', '-rating_count'], name='class_top_rated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
     def is_fully_booked(self):
-        return self.bookings.count() >= self.max_capacity
+        return self.booked_count >= self.max_capacity
 
     def clean(self):
         super().clean()
         if self.max_capacity <= 0:
             raise ValidationError("Max capacity must be a positive integer.")
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS and field.attname not in deferred
+            ]
+        return super().save(*args, **kwargs)
+
 class ClassBooking(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='class_bookings')
     fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE, related_name='bookings')
@@ -38,7 +126,54 @@ class ClassBooking(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.fitness_class.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember which class holds this booking's seat, so a move can release it
+        instance._seat_class_id = instance.__dict__.get('fitness_class_id')
+        return instance
+
     def clean(self):
         super().clean()
-        if self.fitness_class.is_fully_booked():
-            raise ValidationError("This class is fully booked.")
\ No newline at end of file
+        if self._state.adding and self.fitness_class.is_fully_booked():
+            raise ValidationError("This class is fully booked.")
+
+    def save(self, *args, **kwargs):
+        seat_class_id = None if self._state.adding else getattr(self, '_seat_class_id', self.fitness_class_id)
+        if seat_class_id == self.fitness_class_id:
+            return super().save(*args, **kwargs)
+
+        # A new booking (or a move to another class) must win a seat first.
+        # The conditional UPDATE and the INSERT share one transaction, so a
+        # failed insert (e.g. duplicate booking) hands the seat back.
+        with transaction.atomic():
+            if not FitnessClass.objects.reserve_seats(self.fitness_class_id):
+                raise ValidationError("This class is fully booked.")
+            if seat_class_id is not None:
+                FitnessClass.objects.release_seats(seat_class_id)
+            super().save(*args, **kwargs)
+        self._seat_class_id = self.fitness_class_id
+
+class WaitlistEntry(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='waitlist_entries')
+    fitness_class = models.ForeignKey(FitnessClass, on_delete=models.CASCADE, related_name='waitlist_entries')
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    objects = WaitlistEntryManager()
+
+    class Meta:
+        unique_together = ('user', 'fitness_class')
+        # FIFO order is the (fitness_class, id) index: the head of a queue
+        # and a member's place in it are both index range lookups
+        indexes = [models.Index(fields=['fitness_class', 'id'], name='waitlist_class_fifo_idx')]
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.user.email} - {self.fitness_class.name} (waitlist)"
+
+    @property
+    def position(self):
+        # annotated by WaitlistEntry.objects.with_position() on listings
+        if not hasattr(self, 'queue_position'):
+            self.queue_position = WaitlistEntry.objects.filter(fitness_class_id=self.fitness_class_id, id__lte=self.id).count()
+        return self.queue_position
@@ -1,17 +1,91 @@
 from rest_framework import serializers
-from classes.models import FitnessClass, ClassBooking
+from django.core.exceptions import ValidationError as DjangoValidationError
+from classes.models import ClassSchedule, FitnessClass, ClassBooking, WaitlistEntry
+from classes.managers import RATING_VALUES
+from classes import services
 from accounts.models import CustomUser
+from feedback.models import Feedback
+
+class RatingSummarySerializer(serializers.Serializer):
+    """The stored rating_* counters of a FitnessClass or feedback.InstructorRating."""
+    average = serializers.SerializerMethodField()
+    count = serializers.IntegerField(source='rating_count', read_only=True)
+    histogram = serializers.SerializerMethodField()
+
+    def get_average(self, obj):
+        return round(obj.rating_average, 2) if obj.rating_count else None
+
+    def get_histogram(self, obj):
+        return {str(value): getattr(obj, f'rating_{value}') for value in RATING_VALUES}
 
 class FitnessClassSerializer(serializers.ModelSerializer):
     instructor = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all())
     image = serializers.ImageField(required=False, allow_null=True)
+    seats_remaining = serializers.SerializerMethodField()
+    is_full = serializers.BooleanField(source='is_fully_booked', read_only=True)
+    rating = RatingSummarySerializer(source='*', read_only=True)
 
     class Meta:
         model = FitnessClass
-        fields = ['id', 'name', 'description', 'image', 'duration', 'max_capacity', 'instructor', 'schedule', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = ['id', 'name', 'description', 'image', 'duration', 'max_capacity', 'booked_count', 'seats_remaining', 'is_full', 'rating', 'instructor', 'schedule', 'created_at', 'updated_at']
+        read_only_fields = ['booked_count', 'created_at', 'updated_at']
         ref_name = 'ClassesFitnessClass'
 
+    def get_seats_remaining(self, obj):
+        # read from the maintained counter, so listing classes costs no COUNT per row
+        return max(obj.max_capacity - obj.booked_count, 0)
+
+    def validate_duration(self, value):
+        if not 0 < value <= services.MAX_CLASS_DURATION:
+            raise serializers.ValidationError(f"Duration must be between 1 and {services.MAX_CLASS_DURATION} minutes.")
+        return value
+
+    def validate(self, attrs):
+        instructor = attrs.get('instructor', getattr(self.instance, 'instructor', None))
+        schedule = attrs.get('schedule', getattr(self.instance, 'schedule', None))
+        duration = attrs.get('duration', getattr(self.instance, 'duration', None))
+        if instructor and schedule and duration:
+            conflicts = services.find_instructor_conflicts(
+                instructor.pk, schedule, duration,
+                exclude_id=self.instance.pk if self.instance else None,
+            )
+            if conflicts:
+                names = ', '.join(f"{c.name} (#{c.id}) at {c.schedule:%Y-%m-%d %H:%M}" for c in conflicts)
+                raise serializers.ValidationError({'schedule': f"The instructor is already teaching {names}."})
+        return attrs
+
+class ClassScheduleSerializer(serializers.ModelSerializer):
+    instructor = serializers.PrimaryKeyRelatedField(queryset=CustomUser.objects.all())
+
+    class Meta:
+        model = ClassSchedule
+        fields = ['id', 'name', 'description', 'duration', 'max_capacity', 'instructor', 'weekdays', 'start_time', 'start_date', 'end_date', 'generated_until', 'created_at', 'updated_at']
+        read_only_fields = ['generated_until', 'created_at', 'updated_at']
+
+    def validate_weekdays(self, value):
+        codes = [code.strip().upper() for code in value.split(',') if code.strip()]
+        if not codes or any(code not in ClassSchedule.WEEKDAYS for code in codes):
+            raise serializers.ValidationError("Use a comma separated list of MO, TU, WE, TH, FR, SA, SU.")
+        return ','.join(dict.fromkeys(codes))
+
+    def validate_max_capacity(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Max capacity must be a positive integer.")
+        return value
+
+    def validate_duration(self, value):
+        if not 0 < value <= services.MAX_CLASS_DURATION:
+            raise serializers.ValidationError(f"Duration must be between 1 and {services.MAX_CLASS_DURATION} minutes.")
+        return value
+
+    def validate(self, attrs):
+        start_date = attrs.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = attrs.get('end_date', getattr(self.instance, 'end_date', None))
+        if end_date and start_date and end_date < start_date:
+            raise serializers.ValidationError({'end_date': "End date must not be before start date."})
+        return attrs
+
+
 class ClassBookingSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     fitness_class = serializers.PrimaryKeyRelatedField(queryset=FitnessClass.objects.all())
@@ -19,4 +93,108 @@ class ClassBookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = ClassBooking
         fields = ['id', 'user', 'fitness_class', 'booking_date']
-        read_only_fields = ['booking_date' , 'booking_date']
\ No newline at end of file
+        read_only_fields = ['booking_date' , 'booking_date']
+
+    def create(self, validated_data):
+        try:
+            return services.book_class(validated_data['user'], validated_data['fitness_class'])
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'fitness_class': e.messages})
+
+    def update(self, instance, validated_data):
+        previous_class_id = instance.fitness_class_id
+        try:
+            instance = super().update(instance, validated_data)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'fitness_class': e.messages})
+        if instance.fitness_class_id != previous_class_id:
+            services.promote_waitlist(previous_class_id)
+        return instance
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    fitness_class = serializers.PrimaryKeyRelatedField(queryset=FitnessClass.objects.all())
+    position = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['id', 'user', 'fitness_class', 'position', 'joined_at']
+        read_only_fields = ['joined_at']
+
+    def create(self, validated_data):
+        try:
+            return services.join_waitlist(validated_data['user'], validated_data['fitness_class'])
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'fitness_class': e.messages})
+
+class BulkEnrollSerializer(serializers.Serializer):
+    users = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=1000)
+    fitness_classes = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=100)
+
+    # ids are checked with one query per list instead of one per PrimaryKeyRelatedField
+    def validate_users(self, value):
+        value = list(dict.fromkeys(value))
+        found = set(CustomUser.objects.filter(pk__in=value).values_list('pk', flat=True))
+        missing = [str(pk) for pk in value if pk not in found]
+        if missing:
+            raise serializers.ValidationError(f"Unknown users: {', '.join(missing)}")
+        return value
+
+    def validate_fitness_classes(self, value):
+        value = list(dict.fromkeys(value))
+        found = set(FitnessClass.objects.filter(pk__in=value).values_list('pk', flat=True))
+        missing = [str(pk) for pk in value if pk not in found]
+        if missing:
+            raise serializers.ValidationError(f"Unknown fitness classes: {', '.join(missing)}")
+        return value
+
+
+class BulkEnrollResultSerializer(serializers.Serializer):
+    user = serializers.UUIDField()
+    fitness_class = serializers.IntegerField()
+    result = serializers.ChoiceField(choices=['created', 'duplicate', 'full'])
+
+class DashboardClassSerializer(serializers.ModelSerializer):
+    seats_remaining = serializers.SerializerMethodField()
+    waitlisted = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = FitnessClass
+        fields = ['id', 'name', 'schedule', 'duration', 'max_capacity', 'booked_count', 'seats_remaining', 'waitlisted']
+
+    def get_seats_remaining(self, obj):
+        return max(obj.max_capacity - obj.booked_count, 0)
+
+class DashboardCommentSerializer(serializers.ModelSerializer):
+    fitness_class_name = serializers.CharField(source='fitness_class.name', read_only=True)
+    user_email = serializers.EmailField(source='user.email', read_only=True)
+
+    class Meta:
+        model = Feedback
+        fields = ['id', 'fitness_class', 'fitness_class_name', 'user_email', 'rating', 'comment', 'created_at']
+
+class InstructorDashboardSerializer(serializers.Serializer):
+    """An instructor from services.instructor_dashboard; the latest comments come in the `comments` context."""
+    id = serializers.UUIDField(read_only=True)
+    email = serializers.EmailField(read_only=True)
+    upcoming_classes = DashboardClassSerializer(many=True, read_only=True)
+    attendance = serializers.SerializerMethodField()
+    rating = serializers.SerializerMethodField()
+    latest_comments = serializers.SerializerMethodField()
+
+    def get_attendance(self, obj):
+        return {
+            'days': services.DASHBOARD_ATTENDANCE_DAYS,
+            'classes': obj.recent_classes,
+            'bookings': obj.recent_bookings,
+            'attended': obj.recent_attended,
+            'attendance_rate': round(obj.recent_attended / obj.recent_bookings, 4) if obj.recent_bookings else None,
+        }
+
+    def get_rating(self, obj):
+        average = round(obj.rating_average, 2) if obj.rating_count else None
+        return {'average': average, 'count': obj.rating_count}
+
+    def get_latest_comments(self, obj):
+        return DashboardCommentSerializer(self.context.get('comments', []), many=True).data
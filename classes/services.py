@@ -0,0 +1,336 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from accounts.models import CustomUser
+from classes.models import ClassSchedule, FitnessClass, ClassBooking, WaitlistEntry
+from core.search import update_search_index
+from feedback.models import Feedback, InstructorRating
+from memberships.services import has_active_membership
+from reports.models import InstructorDailyRollup
+from reports.rollups import mark_classes_dirty
+
+SCHEDULE_HORIZON_DAYS = 90
+# upper bound on FitnessClass.duration (minutes); it turns "overlaps [start, end)"
+# into a bounded range scan on the (instructor, schedule) index
+MAX_CLASS_DURATION = 24 * 60
+# instructor dashboard: upcoming window, attendance look-back and comments shown
+DASHBOARD_DAYS = 7
+DASHBOARD_ATTENDANCE_DAYS = 30
+DASHBOARD_COMMENTS = 5
+
+
+def book_class(user, fitness_class):
+    """
+    Book `user` into `fitness_class`.
+    The seat is taken with a single conditional UPDATE on FitnessClass.booked_count
+    (see ClassBooking.save), so concurrent bookings can never overbook a class.
+    """
+    try:
+        return ClassBooking.objects.create(user=user, fitness_class=fitness_class)
+    except IntegrityError:
+        raise ValidationError("You have already booked this class.")
+
+
+@transaction.atomic
+def cancel_booking(booking):
+    """
+    Cancel a booking; its seat is released by the post_delete signal and
+    handed to the head of the class waitlist in the same transaction.
+    """
+    fitness_class_id = booking.fitness_class_id
+    booking.delete()
+    promote_waitlist(fitness_class_id)
+
+
+@transaction.atomic
+def bulk_enroll(user_ids, fitness_class_ids):
+    """
+    Enrol every user into every class in one transaction.
+    Class rows are locked once, existing bookings are read in one query, and
+    new bookings go in with a single bulk_create plus one counter UPDATE per
+    class. Users are seated in the order given until a class is full.
+    Returns one {'user', 'fitness_class', 'result'} row per pair, where result
+    is 'created', 'duplicate' or 'full'.
+    """
+    classes = FitnessClass.objects.select_for_update().filter(pk__in=fitness_class_ids).in_bulk()
+    existing = set(
+        ClassBooking.objects.filter(fitness_class_id__in=classes, user_id__in=user_ids)
+        .values_list('user_id', 'fitness_class_id')
+    )
+
+    results, new_bookings = [], []
+    for class_id in fitness_class_ids:
+        fitness_class = classes[class_id]
+        free_seats = fitness_class.max_capacity - fitness_class.booked_count
+        taken = 0
+        for user_id in user_ids:
+            if (user_id, class_id) in existing:
+                result = 'duplicate'
+            elif taken < free_seats:
+                result = 'created'
+                taken += 1
+                new_bookings.append(ClassBooking(user_id=user_id, fitness_class_id=class_id))
+            else:
+                result = 'full'
+            results.append({'user': user_id, 'fitness_class': class_id, 'result': result})
+        if taken:
+            FitnessClass.objects.filter(pk=class_id).update(booked_count=F('booked_count') + taken)
+
+    ClassBooking.objects.bulk_create(new_bookings)
+    # bulk_create skips post_save, so queue the classes for the rollup refresh
+    mark_classes_dirty({booking.fitness_class_id for booking in new_bookings})
+    return results
+
+
+def join_waitlist(user, fitness_class):
+    """Queue `user` for a full class. Members who can still book are told to do so."""
+    if not fitness_class.is_fully_booked():
+        raise ValidationError("This class still has free seats, book it instead.")
+    if ClassBooking.objects.filter(user=user, fitness_class=fitness_class).exists():
+        raise ValidationError("You have already booked this class.")
+    try:
+        return WaitlistEntry.objects.create(user=user, fitness_class=fitness_class)
+    except IntegrityError:
+        raise ValidationError("You are already on the waitlist for this class.")
+
+
+@transaction.atomic
+def promote_waitlist(fitness_class_id):
+    """
+    Move waitlisted members into free seats of a class, oldest entry first.
+    Each promotion is one index seek for the head entry, one seat reservation
+    and one insert; it stops as soon as the class is full again.
+    Members whose membership has lapsed keep their place but are skipped, as
+    HasActiveMembership would refuse them the booking.
+    Returns the created bookings.
+    """
+    promoted, skipped = [], []
+    queue = (
+        WaitlistEntry.objects.select_for_update(of=('self',)).select_related('user')
+        .filter(fitness_class_id=fitness_class_id).order_by('id')
+    )
+    while True:
+        entry = queue.exclude(id__in=skipped).first()
+        if entry is None:
+            break
+        user = entry.user
+        if not (user.is_superuser or user.role in ['ADMIN', 'STAFF'] or has_active_membership(user.pk)):
+            skipped.append(entry.id)
+            continue
+        try:
+            with transaction.atomic():
+                promoted.append(ClassBooking.objects.create(user_id=entry.user_id, fitness_class_id=fitness_class_id))
+        except ValidationError:
+            # class is full again
+            break
+        except IntegrityError:
+            # the member already holds a seat for this class
+            pass
+        entry.delete()
+    return promoted
+
+
+def class_end(schedule, duration):
+    return schedule + timedelta(minutes=duration)
+
+
+def find_instructor_conflicts(instructor_id, schedule, duration, exclude_id=None):
+    """
+    Classes of `instructor_id` overlapping [schedule, schedule + duration).
+    Only classes starting in (schedule - MAX_CLASS_DURATION, end) can overlap,
+    so this is one bounded range scan on the (instructor, schedule) index.
+    """
+    end = class_end(schedule, duration)
+    candidates = FitnessClass.objects.filter(
+        instructor_id=instructor_id,
+        schedule__gt=schedule - timedelta(minutes=MAX_CLASS_DURATION),
+        schedule__lt=end,
+    ).only('id', 'name', 'schedule', 'duration')
+    if exclude_id is not None:
+        candidates = candidates.exclude(pk=exclude_id)
+    return [c for c in candidates if class_end(c.schedule, c.duration) > schedule]
+
+
+def sweep_conflicts(rows):
+    """
+    Overlapping pairs among `rows` of (id, instructor_id, schedule, duration)
+    sorted by (instructor_id, schedule). A single sort-and-sweep pass: each
+    class is compared only with the classes of the same instructor still
+    running when it starts.
+    """
+    conflicts = []
+    active, current_instructor = [], None
+    for class_id, instructor_id, schedule, duration in rows:
+        if instructor_id != current_instructor:
+            active, current_instructor = [], instructor_id
+        active = [(other_id, other_end) for other_id, other_end in active if other_end > schedule]
+        for other_id, other_end in active:
+            conflicts.append((other_id, class_id))
+        active.append((class_id, class_end(schedule, duration)))
+    return conflicts
+
+
+class _InstructorTimeline:
+    """Sorted intervals of one instructor with O(log n) overlap checks."""
+
+    def __init__(self):
+        self.intervals = []
+
+    def overlaps(self, start, end):
+        lower = bisect_left(self.intervals, (start - timedelta(minutes=MAX_CLASS_DURATION),))
+        upper = bisect_left(self.intervals, (end,))
+        return any(other_end > start for _, other_end in self.intervals[lower:upper])
+
+    def add(self, start, end):
+        insort(self.intervals, (start, end))
+
+
+@transaction.atomic
+def materialize_schedules(schedules=None, horizon_days=SCHEDULE_HORIZON_DAYS, today=None):
+    """
+    Create the FitnessClass occurrences of recurring schedules up to `horizon_days` ahead.
+    Generation is incremental: each schedule remembers how far it has been
+    materialized (generated_until), so a re-run only adds the days the horizon
+    moved forward. Occurrences that would double-book their instructor are
+    skipped; the instructors' existing classes are read with one range query.
+    All occurrences go in with one bulk_create and the schedules are advanced
+    with one bulk_update.
+    Returns (created, skipped) occurrence counts.
+    """
+    today = today or timezone.localdate()
+    horizon = today + timedelta(days=horizon_days)
+    if schedules is None:
+        schedules = ClassSchedule.objects.filter(Q(end_date__isnull=True) | Q(end_date__gte=today))
+
+    candidates, advanced = [], []
+    for rule in schedules:
+        first = max(rule.start_date, today)
+        if rule.generated_until:
+            first = max(first, rule.generated_until + timedelta(days=1))
+        last = min(rule.end_date or horizon, horizon)
+        if first > last:
+            continue
+
+        weekdays = rule.weekday_numbers()
+        day = first
+        while day <= last:
+            if day.weekday() in weekdays:
+                candidates.append(FitnessClass(
+                    name=rule.name,
+                    description=rule.description,
+                    duration=rule.duration,
+                    max_capacity=rule.max_capacity,
+                    instructor_id=rule.instructor_id,
+                    schedule=timezone.make_aware(datetime.combine(day, rule.start_time)),
+                    recurrence=rule,
+                ))
+            day += timedelta(days=1)
+        rule.generated_until = last
+        advanced.append(rule)
+
+    occurrences, skipped = [], 0
+    if candidates:
+        existing = FitnessClass.objects.filter(
+            instructor_id__in={c.instructor_id for c in candidates},
+            schedule__gt=min(c.schedule for c in candidates) - timedelta(minutes=MAX_CLASS_DURATION),
+            schedule__lt=max(class_end(c.schedule, c.duration) for c in candidates),
+        ).order_by('instructor_id', 'schedule').values_list('instructor_id', 'schedule', 'duration', 'recurrence_id')
+        timelines = defaultdict(_InstructorTimeline)
+        already_materialized = set()
+        for instructor_id, schedule, duration, recurrence_id in existing:
+            timelines[instructor_id].add(schedule, class_end(schedule, duration))
+            already_materialized.add((recurrence_id, schedule))
+
+        for occurrence in sorted(candidates, key=lambda c: c.schedule):
+            if (occurrence.recurrence_id, occurrence.schedule) in already_materialized:
+                continue
+            end = class_end(occurrence.schedule, occurrence.duration)
+            timeline = timelines[occurrence.instructor_id]
+            if timeline.overlaps(occurrence.schedule, end):
+                skipped += 1
+                continue
+            timeline.add(occurrence.schedule, end)
+            occurrences.append(occurrence)
+
+    # ignore_conflicts + the (recurrence, schedule) constraint keep overlapping runs idempotent
+    FitnessClass.objects.bulk_create(occurrences, batch_size=1000, ignore_conflicts=True)
+    ClassSchedule.objects.bulk_update(advanced, ['generated_until'], batch_size=500)
+    if occurrences:
+        # bulk_create skips post_save, so index the new rows in one pass
+        created = FitnessClass.objects.filter(
+            recurrence__in={o.recurrence_id for o in occurrences},
+            schedule__gte=min(o.schedule for o in occurrences),
+            search_vector__isnull=True,
+        )
+        mark_classes_dirty(created.values_list('id', flat=True))
+        update_search_index(created)
+    return len(occurrences), skipped
+
+
+@transaction.atomic
+def regenerate_schedule(rule, horizon_days=SCHEDULE_HORIZON_DAYS):
+    """
+    Re-materialize a schedule after its rule changed.
+    Future occurrences nobody booked yet are dropped and generated again;
+    booked ones are kept as they are.
+    """
+    rule.occurrences.filter(schedule__gte=timezone.now(), booked_count=0).delete()
+    rule.generated_until = None
+    return materialize_schedules([rule], horizon_days=horizon_days)
+
+
+def _rollup_total(rollups, expression):
+    return Coalesce(Subquery(
+        rollups.order_by().values('instructor').annotate(total=Sum(expression)).values('total')
+    ), 0)
+
+
+def instructor_dashboard(instructor_id, now=None, days=DASHBOARD_DAYS):
+    """
+    An instructor's week in three queries, however many classes they teach:
+      . the instructor, with their rating (feedback.InstructorRating) and
+        recent attendance totals (reports.InstructorDailyRollup) as subqueries;
+      . their classes of the next `days` days, prefetched with seats and
+        waitlist length;
+      . the latest feedback comments on their classes.
+    Returns (instructor, latest feedback), or (None, []) for an unknown id.
+    """
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    rating = InstructorRating.objects.filter(instructor=OuterRef('pk'))
+    recent = InstructorDailyRollup.objects.filter(
+        instructor=OuterRef('pk'), date__gt=today - timedelta(days=DASHBOARD_ATTENDANCE_DAYS), date__lte=today,
+    )
+    upcoming = (
+        FitnessClass.objects.filter(schedule__gte=now, schedule__lt=now + timedelta(days=days))
+        .annotate(waitlisted=Coalesce(Subquery(
+            WaitlistEntry.objects.filter(fitness_class=OuterRef('pk'))
+            .order_by().values('fitness_class').annotate(total=Count('id')).values('total')
+        ), 0))
+        .order_by('schedule')
+    )
+    instructor = (
+        CustomUser.objects.filter(pk=instructor_id)
+        .annotate(
+            rating_average=Subquery(rating.values('rating_average')),
+            rating_count=Coalesce(Subquery(rating.values('rating_count')), 0),
+            recent_classes=_rollup_total(recent, 'classes'),
+            recent_bookings=_rollup_total(recent, 'bookings'),
+            recent_attended=_rollup_total(recent, F('present') + F('late')),
+        )
+        .prefetch_related(Prefetch('fitness_classes', queryset=upcoming, to_attr='upcoming_classes'))
+        .first()
+    )
+    if instructor is None:
+        return None, []
+    comments = list(
+        Feedback.objects.filter(fitness_class__instructor_id=instructor_id)
+        .select_related('user', 'fitness_class')
+        .order_by('-created_at')[:DASHBOARD_COMMENTS]
+    )
+    return instructor, comments
@@ -0,0 +1,8 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from classes.models import FitnessClass, ClassBooking
+
+@receiver(post_delete, sender=ClassBooking)
+def release_seat_on_booking_delete(sender, instance, **kwargs):
+    # Also fires for cascades (e.g. a deleted user), keeping booked_count honest.
+    FitnessClass.objects.release_seats(instance.fitness_class_id)
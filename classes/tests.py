@@ -1,3 +1,453 @@
-from django.test import TestCase
+import threading
+from datetime import datetime, time, timedelta
+from unittest import skipUnless
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, connections
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from classes import services
+from core.pagination import encode_cursor
+from core.testing import make_user, make_class, give_membership
+from classes.models import ClassSchedule, FitnessClass, ClassBooking, WaitlistEntry
+from classes.serializers import FitnessClassSerializer
+from feedback.models import Feedback
 
 # Create your tests here.
+
+class BookClassTests(TestCase):
+    def test_last_seat_is_taken_once(self):
+        fitness_class = make_class(make_user('coach@example.com', 'STAFF'), max_capacity=2)
+        first, second, third = (make_user(f'member{i}@example.com') for i in range(3))
+        services.book_class(first, fitness_class)
+        services.book_class(second, fitness_class)
+        with self.assertRaises(ValidationError):
+            services.book_class(third, fitness_class)
+        fitness_class.refresh_from_db()
+        self.assertEqual(fitness_class.booked_count, 2)
+        self.assertEqual(ClassBooking.objects.filter(fitness_class=fitness_class).count(), 2)
+
+    def test_stale_class_edit_keeps_the_seat_count(self):
+        fitness_class = make_class(make_user('coach@example.com', 'STAFF'), max_capacity=1)
+        stale = FitnessClass.objects.get(pk=fitness_class.pk)
+        services.book_class(make_user('first@example.com'), fitness_class)
+        serializer = FitnessClassSerializer(stale, data={'name': 'Evening Spin'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        fitness_class.refresh_from_db()
+        self.assertEqual((fitness_class.name, fitness_class.booked_count), ('Evening Spin', 1))
+        with self.assertRaises(ValidationError):
+            services.book_class(make_user('second@example.com'), fitness_class)
+        self.assertEqual(ClassBooking.objects.filter(fitness_class=fitness_class).count(), 1)
+
+
+class ReserveSeatsTests(TestCase):
+    """The conditional UPDATE behind every booking, checked on whatever database runs the suite."""
+
+    def setUp(self):
+        self.fitness_class = make_class(make_user('coach@example.com', 'STAFF'), max_capacity=2)
+
+    def booked_count(self):
+        return FitnessClass.objects.values_list('booked_count', flat=True).get(pk=self.fitness_class.pk)
+
+    def test_full_class_matches_no_row(self):
+        self.assertTrue(FitnessClass.objects.reserve_seats(self.fitness_class.pk))
+        self.assertTrue(FitnessClass.objects.reserve_seats(self.fitness_class.pk))
+        # the guard lives in the WHERE clause: a full class is simply not updated
+        full = FitnessClass.objects.filter(pk=self.fitness_class.pk, booked_count__lte=F('max_capacity') - 1)
+        self.assertEqual(full.update(booked_count=F('booked_count') + 1), 0)
+        self.assertFalse(FitnessClass.objects.reserve_seats(self.fitness_class.pk))
+        self.assertEqual(self.booked_count(), 2)
+
+    def test_seats_are_taken_all_or_nothing(self):
+        self.assertFalse(FitnessClass.objects.reserve_seats(self.fitness_class.pk, seats=3))
+        self.assertTrue(FitnessClass.objects.reserve_seats(self.fitness_class.pk, seats=2))
+        self.assertEqual(self.booked_count(), 2)
+
+    def test_release_never_goes_below_zero(self):
+        self.assertFalse(FitnessClass.objects.release_seats(self.fitness_class.pk))
+        self.assertEqual(self.booked_count(), 0)
+
+    def test_a_stale_instance_cannot_overbook(self):
+        # loaded while a seat was free; the seat goes before it books
+        stale = FitnessClass.objects.get(pk=self.fitness_class.pk)
+        FitnessClass.objects.reserve_seats(self.fitness_class.pk, seats=2)
+        self.assertFalse(stale.is_fully_booked())
+        with self.assertRaises(ValidationError):
+            ClassBooking(user=make_user('member@example.com'), fitness_class=stale).save()
+        self.assertEqual(self.booked_count(), 2)
+        self.assertFalse(ClassBooking.objects.exists())
+
+
+class WaitlistPositionTests(TestCase):
+    def setUp(self):
+        self.staff = make_user('coach@example.com', 'STAFF')
+        self.fitness_class = make_class(self.staff, max_capacity=1)
+        self.members = [make_user(f'member{i}@example.com') for i in range(7)]
+        for member in self.members:
+            give_membership(member)
+        WaitlistEntry.objects.bulk_create(
+            WaitlistEntry(user=member, fitness_class=self.fitness_class) for member in self.members
+        )
+        self.client = APIClient()
+
+    def test_listing_annotates_positions_in_one_query(self):
+        self.client.force_authenticate(self.staff)
+        # filter lookup, page count and the entries with their positions, however long the queue
+        with self.assertNumQueries(3):
+            response = self.client.get('/class_waitlist/', {'fitness_class': self.fitness_class.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['position'] for entry in response.data['results']], list(range(1, 8)))
+
+    def test_member_sees_their_place_in_the_whole_queue(self):
+        self.client.force_authenticate(self.members[4])
+        response = self.client.get('/class_waitlist/')
+        self.assertEqual([entry['position'] for entry in response.data['results']], [5])
+
+    def test_positions_move_up_after_a_promotion(self):
+        services.promote_waitlist(self.fitness_class.pk)
+        positions = dict(WaitlistEntry.objects.with_position().values_list('user_id', 'queue_position'))
+        self.assertNotIn(self.members[0].pk, positions)
+        self.assertEqual(positions[self.members[1].pk], 1)
+        self.assertEqual(positions[self.members[6].pk], 6)
+
+
+class WaitlistEntitlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fitness_class = make_class(make_user('coach@example.com', 'STAFF'), max_capacity=1)
+        self.seated, self.lapsed, self.active = (make_user(f'{name}@example.com') for name in ('seated', 'lapsed', 'active'))
+        give_membership(self.active)
+        expired = give_membership(self.lapsed)
+        expired.end_date = timezone.now() - timedelta(days=1)
+        expired.save()
+        self.booking = services.book_class(self.seated, self.fitness_class)
+
+    def test_lapsed_member_cannot_join(self):
+        client = APIClient()
+        client.force_authenticate(self.lapsed)
+        response = client.post('/class_waitlist/', {'fitness_class': self.fitness_class.pk})
+        self.assertEqual(response.status_code, 403)
+        client.force_authenticate(self.active)
+        response = client.post('/class_waitlist/', {'fitness_class': self.fitness_class.pk})
+        self.assertEqual(response.status_code, 201)
+
+    def test_lapsed_member_at_the_head_is_passed_over(self):
+        # joined while still entitled
+        WaitlistEntry.objects.create(user=self.lapsed, fitness_class=self.fitness_class)
+        WaitlistEntry.objects.create(user=self.active, fitness_class=self.fitness_class)
+        services.cancel_booking(self.booking)
+        self.assertEqual(list(ClassBooking.objects.values_list('user_id', flat=True)), [self.active.pk])
+        # they keep their place, and get the next seat once they renew
+        self.assertEqual(list(WaitlistEntry.objects.values_list('user_id', flat=True)), [self.lapsed.pk])
+        self.assertEqual(services.promote_waitlist(self.fitness_class.pk), [])
+        give_membership(self.lapsed)
+        self.fitness_class.max_capacity = 2
+        self.fitness_class.save()
+        self.assertEqual([booking.user_id for booking in services.promote_waitlist(self.fitness_class.pk)], [self.lapsed.pk])
+
+
+class BulkEnrollTests(TestCase):
+    def setUp(self):
+        self.staff = make_user('coach@example.com', 'STAFF')
+        self.members = [make_user(f'member{i}@example.com') for i in range(4)]
+        self.roomy = make_class(self.staff, 'Roomy', max_capacity=10)
+        self.small = make_class(self.staff, 'Small', max_capacity=2, starts_in=timedelta(days=2))
+        services.book_class(self.members[0], self.small)
+
+    def test_results_and_counters(self):
+        results = services.bulk_enroll([member.pk for member in self.members], [self.roomy.pk, self.small.pk])
+        outcome = {(row['user'], row['fitness_class']): row['result'] for row in results}
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(outcome[(member.pk, self.roomy.pk)] == 'created' for member in self.members))
+        self.assertEqual(
+            [outcome[(member.pk, self.small.pk)] for member in self.members],
+            ['duplicate', 'created', 'full', 'full'],
+        )
+        for fitness_class, booked in [(self.roomy, 4), (self.small, 2)]:
+            fitness_class.refresh_from_db()
+            self.assertEqual(fitness_class.booked_count, booked)
+            self.assertEqual(ClassBooking.objects.filter(fitness_class=fitness_class).count(), booked)
+
+    def test_endpoint_reports_every_pair(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.post('/class_bookings/bulk_enroll/', {
+            'users': [str(member.pk) for member in self.members],
+            'fitness_classes': [self.small.pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['result'] for row in response.data], ['duplicate', 'created', 'full', 'full'])
+
+    def test_endpoint_rejects_unknown_classes(self):
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        response = client.post('/class_bookings/bulk_enroll/', {
+            'users': [str(self.members[1].pk)],
+            'fitness_classes': [self.small.pk + 1000],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ClassBooking.objects.count(), 1)
+
+
+class CalendarTests(TestCase):
+    def setUp(self):
+        staff = make_user('coach@example.com', 'STAFF')
+        self.classes = [make_class(staff, f'Class {i}', starts_in=timedelta(days=1, hours=i)) for i in range(5)]
+        self.day = timezone.localdate(self.classes[0].schedule)
+        self.client = APIClient()
+
+    def calendar(self, **params):
+        params = {'from': self.day.isoformat(), 'to': (self.day + timedelta(days=1)).isoformat(), **params}
+        return self.client.get('/fitness_classes/calendar/', params)
+
+    def test_cursor_walks_the_range_once(self):
+        seen, params = [], {'limit': 2}
+        while True:
+            response = self.calendar(**params)
+            self.assertEqual(response.status_code, 200)
+            seen += [data['id'] for day in response.data['days'].values() for data in day]
+            if not response.data['next']:
+                break
+            params['cursor'] = response.data['next']
+        self.assertEqual(seen, [fitness_class.pk for fitness_class in self.classes])
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ['not-base64!', encode_cursor('garbage', 1), encode_cursor(self.classes[0].schedule.isoformat(), 'x')]:
+            response = self.calendar(cursor=cursor)
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_malformed_parameters_are_rejected(self):
+        for params in [{'instructor': 'abc'}, {'instructor': '12'}, {'limit': 'ten'}, {'from': 'yesterday'}]:
+            response = self.calendar(**params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_instructor_filter(self):
+        other = make_class(make_user('other@example.com', 'STAFF'), 'Other', starts_in=timedelta(days=1, minutes=30))
+        response = self.calendar(instructor=str(other.instructor_id))
+        self.assertEqual([data['id'] for day in response.data['days'].values() for data in day], [other.pk])
+
+
+class ConflictDetectionTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach@example.com', 'STAFF')
+        self.other_coach = make_user('other@example.com', 'STAFF')
+        self.start = (timezone.now() + timedelta(days=2)).replace(second=0, microsecond=0)
+        # 10:00-11:00 in relative terms
+        self.base = self.add(self.coach, 0, 60, 'Base')
+        self.client = APIClient()
+        self.client.force_authenticate(self.coach)
+
+    def add(self, instructor, minutes, duration, name='Class'):
+        return FitnessClass.objects.create(
+            name=name, description=name, duration=duration, max_capacity=10,
+            instructor=instructor, schedule=self.start + timedelta(minutes=minutes),
+        )
+
+    def conflicts(self, minutes, duration, instructor=None, exclude_id=None):
+        found = services.find_instructor_conflicts(
+            (instructor or self.coach).pk, self.start + timedelta(minutes=minutes), duration, exclude_id=exclude_id,
+        )
+        return [c.pk for c in found]
+
+    def test_touching_boundaries_do_not_conflict(self):
+        # ends exactly when the base class starts / starts exactly when it ends
+        self.assertEqual(self.conflicts(-30, 30), [])
+        self.assertEqual(self.conflicts(60, 30), [])
+
+    def test_one_minute_overlap_conflicts(self):
+        self.assertEqual(self.conflicts(-30, 31), [self.base.pk])
+        self.assertEqual(self.conflicts(59, 30), [self.base.pk])
+
+    def test_enclosing_and_enclosed_classes_conflict(self):
+        self.assertEqual(self.conflicts(15, 15), [self.base.pk])
+        self.assertEqual(self.conflicts(-120, 240), [self.base.pk])
+
+    def test_long_class_started_hours_earlier_conflicts(self):
+        marathon = self.add(self.coach, -6 * 60, 8 * 60, 'Marathon')
+        self.assertEqual(self.conflicts(90, 30), [marathon.pk])
+
+    def test_only_the_same_instructor_conflicts(self):
+        # classes have no rooms; another instructor may teach at the same time
+        self.assertEqual(self.conflicts(0, 60, instructor=self.other_coach), [])
+
+    def test_a_class_does_not_conflict_with_itself(self):
+        self.assertEqual(self.conflicts(0, 60, exclude_id=self.base.pk), [])
+
+    def test_moving_a_class_over_its_own_slot_is_allowed(self):
+        moved = self.start + timedelta(minutes=30)
+        response = self.client.patch(f'/fitness_classes/{self.base.pk}/', {'schedule': moved.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        response = self.client.patch(f'/fitness_classes/{self.base.pk}/', {'duration': 90}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_moving_a_class_onto_another_is_rejected(self):
+        later = self.add(self.coach, 120, 60, 'Later')
+        response = self.client.patch(f'/fitness_classes/{later.pk}/', {'schedule': (self.start + timedelta(minutes=45)).isoformat()}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Base', str(response.data['schedule']))
+        # changing the instructor is checked against the new instructor's classes
+        busy = self.add(self.other_coach, 120, 60, 'Busy')
+        response = self.client.patch(f'/fitness_classes/{busy.pk}/', {'instructor': str(self.coach.pk)}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_creating_an_overlapping_class_is_rejected(self):
+        data = {
+            'name': 'Overlap', 'description': 'overlap', 'duration': 30, 'max_capacity': 10,
+            'instructor': str(self.coach.pk), 'schedule': (self.start + timedelta(minutes=30)).isoformat(),
+        }
+        self.assertEqual(self.client.post('/fitness_classes/', data, format='json').status_code, 400)
+        data['schedule'] = (self.start + timedelta(minutes=60)).isoformat()
+        self.assertEqual(self.client.post('/fitness_classes/', data, format='json').status_code, 201)
+
+    def test_conflicts_endpoint_reports_only_overlapping_pairs(self):
+        overlap = self.add(self.coach, 30, 60, 'Overlap')
+        self.add(self.coach, 90, 30, 'Back to back')
+        self.add(self.other_coach, 0, 60, 'Other instructor')
+        response = self.client.get('/fitness_classes/conflicts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        pair = response.data['conflicts'][0]
+        self.assertEqual(pair['instructor'], self.coach.pk)
+        self.assertEqual([c['id'] for c in pair['classes']], [self.base.pk, overlap.pk])
+
+
+class ScheduleMaterializationTests(TestCase):
+    HORIZON = 14
+
+    def setUp(self):
+        self.staff = make_user('coach@example.com', 'STAFF')
+        self.today = timezone.localdate()
+        # every day from tomorrow, so every occurrence is still ahead
+        self.rule = ClassSchedule.objects.create(
+            name='Morning Spin', description='spin', duration=60, max_capacity=10, instructor=self.staff,
+            weekdays='MO,TU,WE,TH,FR,SA,SU', start_time=time(7, 0), start_date=self.today + timedelta(days=1),
+        )
+
+    def materialize(self, horizon=HORIZON):
+        return services.materialize_schedules(horizon_days=horizon, today=self.today)
+
+    def occurrences(self):
+        return list(self.rule.occurrences.order_by('schedule').values_list('schedule', flat=True))
+
+    def test_second_run_creates_nothing(self):
+        self.assertEqual(self.materialize(), (self.HORIZON, 0))
+        first = self.occurrences()
+        self.assertEqual(self.materialize(), (0, 0))
+        self.assertEqual(self.occurrences(), first)
+        self.rule.refresh_from_db()
+        self.assertEqual(self.rule.generated_until, self.today + timedelta(days=self.HORIZON))
+
+    def test_lost_watermark_creates_no_duplicates(self):
+        self.materialize()
+        ClassSchedule.objects.filter(pk=self.rule.pk).update(generated_until=None)
+        self.assertEqual(self.materialize(), (0, 0))
+        self.assertEqual(len(set(self.occurrences())), self.HORIZON)
+
+    def test_longer_horizon_only_adds_the_new_days(self):
+        self.materialize()
+        self.assertEqual(self.materialize(self.HORIZON + 7), (7, 0))
+        self.assertEqual(len(set(self.occurrences())), self.HORIZON + 7)
+
+    def test_occurrence_overlapping_another_class_is_skipped(self):
+        first = timezone.make_aware(datetime.combine(self.rule.start_date, time(7, 30)))
+        FitnessClass.objects.create(
+            name='One-off', description='one-off', duration=45, max_capacity=5, instructor=self.staff, schedule=first,
+        )
+        self.assertEqual(self.materialize(), (self.HORIZON - 1, 1))
+
+    def test_regenerate_keeps_booked_classes(self):
+        self.materialize()
+        booked = self.rule.occurrences.order_by('schedule')[2]
+        services.book_class(make_user('member@example.com'), booked)
+
+        ClassSchedule.objects.filter(pk=self.rule.pk).update(start_time=time(18, 0), name='Evening Spin')
+        self.rule.refresh_from_db()
+        created, skipped = services.regenerate_schedule(self.rule, horizon_days=self.HORIZON)
+
+        self.assertEqual((created, skipped), (self.HORIZON, 0))
+        booked.refresh_from_db()
+        self.assertEqual((booked.name, booked.booked_count), ('Morning Spin', 1))
+        self.assertEqual(booked.bookings.count(), 1)
+        # the unbooked morning classes were replaced by evening ones
+        remaining = self.rule.occurrences.exclude(pk=booked.pk)
+        self.assertEqual(remaining.count(), self.HORIZON)
+        self.assertEqual({timezone.localtime(schedule).time() for schedule in remaining.values_list('schedule', flat=True)}, {time(18, 0)})
+
+
+@skipUnless(connection.vendor == 'postgresql', "concurrent writers need a database server with row locking")
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 40
+    CAPACITY = 10
+
+    def test_concurrent_bookings_never_overbook(self):
+        fitness_class = make_class(make_user('coach@example.com', 'STAFF'), max_capacity=self.CAPACITY)
+        members = [make_user(f'member{i}@example.com') for i in range(self.THREADS)]
+        start = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def book(user):
+            try:
+                start.wait()
+                services.book_class(user, FitnessClass.objects.get(pk=fitness_class.pk))
+                outcomes.append('booked')
+            except ValidationError:
+                outcomes.append('full')
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=book, args=(member,)) for member in members]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        fitness_class.refresh_from_db()
+        bookings = ClassBooking.objects.filter(fitness_class=fitness_class).count()
+        self.assertEqual(len(outcomes), self.THREADS)
+        self.assertEqual(outcomes.count('booked'), self.CAPACITY)
+        self.assertEqual(fitness_class.booked_count, bookings)
+        self.assertLessEqual(bookings, fitness_class.max_capacity)
+
+
+class InstructorDashboardTests(TestCase):
+    def setUp(self):
+        self.staff = make_user('coach@example.com', 'STAFF')
+        self.members = [make_user(f'member{i}@example.com') for i in range(3)]
+        past = make_class(self.staff, 'Earlier', starts_in=-timedelta(days=2))
+        for member in self.members:
+            services.book_class(member, past)
+            Feedback.objects.create(user=member, fitness_class=past, rating=4, comment='Good class')
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def add_upcoming(self, count):
+        for i in range(count):
+            fitness_class = make_class(self.staff, f'Class {i}', max_capacity=1, starts_in=timedelta(days=1, hours=i))
+            services.book_class(self.members[0], fitness_class)
+            WaitlistEntry.objects.bulk_create(
+                WaitlistEntry(user=member, fitness_class=fitness_class) for member in self.members[1:]
+            )
+
+    def test_three_queries_for_one_or_many_classes(self):
+        for count, total in [(1, 1), (19, 20)]:
+            self.add_upcoming(count)
+            with self.assertNumQueries(3):
+                instructor, comments = services.instructor_dashboard(self.staff.pk)
+                classes = [(c.booked_count, c.waitlisted) for c in instructor.upcoming_classes]
+                emails = [comment.user.email for comment in comments]
+            self.assertEqual(classes, [(1, 2)] * total)
+            self.assertEqual(sorted(emails), [member.email for member in self.members])
+            self.assertEqual(instructor.rating_count, 3)
+
+    def test_endpoint_costs_the_same_three_queries(self):
+        for count, total in [(1, 1), (19, 20)]:
+            self.add_upcoming(count)
+            with self.assertNumQueries(3):
+                response = self.client.get('/fitness_classes/instructor_dashboard/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['upcoming_classes']), total)
+            self.assertEqual(response.data['upcoming_classes'][0]['seats_remaining'], 0)
+            self.assertEqual(len(response.data['latest_comments']), 3)
@@ -1,20 +1,32 @@
+import uuid
+from datetime import datetime, time, timedelta
 from django.shortcuts import render
 from django.http import HttpResponse
+from django.db.models import Q
+from django.utils import timezone
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import PageNumberPagination
-from classes.models import FitnessClass, ClassBooking
-from classes.serializers import FitnessClassSerializer, ClassBookingSerializer
+from classes.models import ClassSchedule, FitnessClass, ClassBooking, WaitlistEntry
+from classes.serializers import FitnessClassSerializer, ClassScheduleSerializer, ClassBookingSerializer, WaitlistEntrySerializer, BulkEnrollSerializer, BulkEnrollResultSerializer, InstructorDashboardSerializer
+from classes import services
 from core.permissions import IsAdminOrStaffOrReadOnly
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django_filters import rest_framework as filters
 from core.filters import FitnessClassFilter
-from core.permissions import IsMemberOrAdminStaff
+from core.permissions import IsMemberOrAdminStaff, HasActiveMembership
 from rest_framework.decorators import action
 from core.permissions import IsAdminOrStaff
+from core.exports import EXPORT_PARAMETER, export_response, CLASS_BOOKING_REPORT_COLUMNS, CLASS_REPORT_COLUMNS
+from core.search import FullTextSearchFilter
+from attendance import services as attendance_services
+from attendance.serializers import CheckInTokenSerializer
+from core.pagination import encode_cursor, decode_cursor
 from rest_framework.permissions import IsAuthenticated
 
 # Create your views here.
@@ -24,9 +36,33 @@ from rest_framework.permissions import IsAuthenticated
 class FitnessClassPagination(PageNumberPagination):
     page_size = 12
 
+CALENDAR_PAGE_SIZE = 500
+CALENDAR_MAX_PAGE_SIZE = 1000
+CALENDAR_MAX_RANGE = timedelta(days=62)
+
+
+def parse_calendar_bound(value, end_of_day=False):
+    """Accept either an ISO date or datetime; bare dates cover the whole day."""
+    day = parse_date(value) if len(value) == 10 else None
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Invalid date: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
 class ClassBookingPagination(PageNumberPagination):
     page_size = 6
 
+class WaitlistPagination(PageNumberPagination):
+    page_size = 10
+
+class ClassSchedulePagination(PageNumberPagination):
+    page_size = 10
+
 class FitnessClassViewSet(viewsets.ModelViewSet):
     """ 
     Fitness classes overview:
@@ -35,16 +71,18 @@ class FitnessClassViewSet(viewsets.ModelViewSet):
         . All users can view classes.
     features:
         . Filter by instructor email and max capacity.
+        . Filter by availability (`available`, `min_seats`) using the booked_count counter.
+        . Order by the stored rating aggregates (`?ordering=-rating_average` for top rated).
         . Search by name, description, and instructor email.
         . Paginate results.
     """
     queryset = FitnessClass.objects.select_related('instructor').all()
     serializer_class = FitnessClassSerializer
     permission_classes = [IsAdminOrStaffOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_class = FitnessClassFilter
     search_fields = ['name', 'description', 'instructor__email']
-    ordering_fields = ['schedule', 'max_capacity']
+    ordering_fields = ['schedule', 'max_capacity', 'booked_count', 'rating_average', 'rating_count']
     pagination_class = FitnessClassPagination
 
     def get_queryset(self):
@@ -73,7 +111,10 @@ class FitnessClassViewSet(viewsets.ModelViewSet):
             openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
             openapi.Parameter('instructor__email', openapi.IN_QUERY, description="Filter by instructor email", type=openapi.TYPE_STRING),
             openapi.Parameter('max_capacity', openapi.IN_QUERY, description="Filter by max capacity", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('available', openapi.IN_QUERY, description="Only classes that still have free seats", type=openapi.TYPE_BOOLEAN),
+            openapi.Parameter('min_seats', openapi.IN_QUERY, description="Only classes with at least this many free seats", type=openapi.TYPE_INTEGER),
             openapi.Parameter('search', openapi.IN_QUERY, description="Search by name, description, or instructor email", type=openapi.TYPE_STRING),
+            openapi.Parameter('ordering', openapi.IN_QUERY, description="Sort field, e.g. `-rating_average` for top rated first", type=openapi.TYPE_STRING),
         ]
     )
     def list(self, request, *args, **kwargs):
@@ -134,24 +175,209 @@ class FitnessClassViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        instance = serializer.save()
+        # a raised capacity hands the new seats to the waitlist
+        if not instance.is_fully_booked():
+            services.promote_waitlist(instance.id)
+
+
+    @swagger_auto_schema(
+        operation_description="Classes between `from` and `to` grouped by day.\n\nThe range is read with one index range scan on `schedule`. When more than `limit` classes fall in the range, `next` holds a cursor to continue from the last returned class.",
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, description="Start date or datetime (inclusive)", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('to', openapi.IN_QUERY, description="End date (inclusive) or datetime (exclusive)", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('instructor', openapi.IN_QUERY, description="Instructor id", type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Continuation cursor from a previous response", type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Max classes per response (default 500, max 1000)", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: "Classes grouped by day", 400: "Bad Request"}
+    )
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        params = request.query_params
+        if 'from' not in params or 'to' not in params:
+            return Response({'error': 'from and to are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = parse_calendar_bound(params['from'])
+            end = parse_calendar_bound(params['to'], end_of_day=True)
+            limit = min(max(int(params.get('limit', CALENDAR_PAGE_SIZE)), 1), CALENDAR_MAX_PAGE_SIZE)
+            instructor_id = uuid.UUID(params['instructor']) if params.get('instructor') else None
+            cursor = None
+            if params.get('cursor'):
+                last_schedule, last_id = decode_cursor(params['cursor'])
+                last_schedule = parse_datetime(last_schedule)
+                if last_schedule is None:
+                    raise ValueError("Invalid cursor")
+                cursor = (last_schedule, int(last_id))
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if end <= start or end - start > CALENDAR_MAX_RANGE:
+            return Response({'error': 'to must be after from and at most 62 days later'}, status=status.HTTP_400_BAD_REQUEST)
 
+        queryset = self.get_queryset().filter(schedule__gte=start, schedule__lt=end)
+        if instructor_id:
+            queryset = queryset.filter(instructor_id=instructor_id)
+        if cursor:
+            # keyset continuation on (schedule, id) instead of OFFSET
+            last_schedule, last_id = cursor
+            queryset = queryset.filter(Q(schedule__gt=last_schedule) | Q(schedule=last_schedule, id__gt=last_id))
+        classes = list(queryset.order_by('schedule', 'id')[:limit + 1])
+
+        next_cursor = None
+        if len(classes) > limit:
+            classes = classes[:limit]
+            next_cursor = encode_cursor(classes[-1].schedule.isoformat(), classes[-1].id)
+
+        days = {}
+        for fitness_class, data in zip(classes, FitnessClassSerializer(classes, many=True, context={'request': request}).data):
+            days.setdefault(timezone.localtime(fitness_class.schedule).date().isoformat(), []).append(data)
+        return Response({'from': start, 'to': end, 'days': days, 'next': next_cursor})
+
+    @swagger_auto_schema(
+        operation_description="Pairs of classes that double-book an instructor (Admin and Staff only).\n\nFound in one pass: classes are read ordered by (instructor, schedule) and swept, not compared pairwise.",
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, description="Start date or datetime (default: now)", type=openapi.TYPE_STRING),
+            openapi.Parameter('to', openapi.IN_QUERY, description="End date (inclusive) or datetime (exclusive)", type=openapi.TYPE_STRING),
+        ],
+        responses={200: "Overlapping class pairs", 400: "Bad Request"}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
+    def conflicts(self, request):
+        params = request.query_params
+        try:
+            start = parse_calendar_bound(params['from']) if params.get('from') else timezone.now()
+            end = parse_calendar_bound(params['to'], end_of_day=True) if params.get('to') else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = FitnessClass.objects.filter(schedule__gt=start - timedelta(minutes=services.MAX_CLASS_DURATION))
+        if end:
+            queryset = queryset.filter(schedule__lt=end)
+        rows = queryset.order_by('instructor_id', 'schedule', 'id').values_list('id', 'instructor_id', 'schedule', 'duration')
+        pairs = services.sweep_conflicts(rows.iterator(chunk_size=2000))
+
+        details = FitnessClass.objects.in_bulk({class_id for pair in pairs for class_id in pair})
+        results = []
+        for first, second in pairs:
+            first, second = details[first], details[second]
+            # both classes started before `from`; they only overlapped in the past
+            if min(services.class_end(c.schedule, c.duration) for c in (first, second)) <= start:
+                continue
+            results.append({
+                'instructor': first.instructor_id,
+                'classes': [
+                    {'id': c.id, 'name': c.name, 'schedule': c.schedule, 'duration': c.duration}
+                    for c in (first, second)
+                ],
+            })
+        return Response({'count': len(results), 'conflicts': results})
+
+    @swagger_auto_schema(
+        operation_description="Class report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def class_report(self, request):
         try:
             if request.user.role == 'ADMIN' or request.user.is_superuser:
                 # Generate class report
                 class_data = FitnessClass.objects.select_related('instructor').all()
+                response = export_response(request, class_data, CLASS_REPORT_COLUMNS, 'classes')
+                if response is not None:
+                    return response
                 serializer = FitnessClassSerializer(class_data, many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(
+        operation_description="An instructor's week: upcoming classes with booked and remaining seats, attendance rate over the last 30 days, average rating and the latest comments, in a fixed three queries.\n\nStaff get their own dashboard; admins pass `instructor`.",
+        manual_parameters=[
+            openapi.Parameter('instructor', openapi.IN_QUERY, description="Instructor id (admins only)", type=openapi.TYPE_STRING),
+            openapi.Parameter('days', openapi.IN_QUERY, description=f"Days of upcoming classes (default {services.DASHBOARD_DAYS}, at most 31)", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: InstructorDashboardSerializer, 400: "Bad Request", 404: "Not Found"}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
+    def instructor_dashboard(self, request):
+        user = request.user
+        instructor_id = user.pk
+        if user.is_superuser or user.role == 'ADMIN':
+            instructor_id = request.query_params.get('instructor')
+            if not instructor_id:
+                return Response({'error': "instructor is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            days = int(request.query_params.get('days', services.DASHBOARD_DAYS))
+            if not 1 <= days <= 31:
+                raise ValueError
+            instructor, comments = services.instructor_dashboard(instructor_id, days=days)
+        except ValueError:
+            return Response({'error': "days must be a whole number between 1 and 31."}, status=status.HTTP_400_BAD_REQUEST)
+        except DjangoValidationError:
+            return Response({'error': "Invalid instructor id."}, status=status.HTTP_400_BAD_REQUEST)
+        if instructor is None:
+            return Response({'error': "Instructor not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(InstructorDashboardSerializer(instructor, context={'comments': comments}).data)
+
+
+class ClassScheduleViewSet(viewsets.ModelViewSet):
+    """
+    Recurring class schedules:
+        . Only admin and staff can create, update, and delete schedules.
+        . Saving a schedule materializes its classes for the next 90 days;
+          the `materialize_schedules` command keeps extending that horizon.
+        . Changing a schedule regenerates its future classes that have no bookings yet.
+        . Occurrences that would double-book the instructor are skipped and counted
+          in `skipped_occurrences`.
+    """
+    queryset = ClassSchedule.objects.select_related('instructor').all()
+    serializer_class = ClassScheduleSerializer
+    permission_classes = [IsAdminOrStaffOrReadOnly]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['instructor__email']
+    ordering_fields = ['start_date', 'start_time']
+    pagination_class = ClassSchedulePagination
+    skipped_occurrences = 0
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.data['skipped_occurrences'] = self.skipped_occurrences
+        return response
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response.data['skipped_occurrences'] = self.skipped_occurrences
+        return response
+
+    def perform_create(self, serializer):
+        _, self.skipped_occurrences = services.materialize_schedules([serializer.save()])
+
+    def perform_update(self, serializer):
+        _, self.skipped_occurrences = services.regenerate_schedule(serializer.save())
+
+    @swagger_auto_schema(
+        operation_description="Materialize every active schedule up to `days` ahead (Admin and Staff only).",
+        manual_parameters=[
+            openapi.Parameter('days', openapi.IN_QUERY, description="Horizon in days (default 90)", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: "Number of created and skipped classes"}
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminOrStaff])
+    def materialize(self, request):
+        try:
+            days = int(request.query_params.get('days', services.SCHEDULE_HORIZON_DAYS))
+        except ValueError:
+            return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        created, skipped = services.materialize_schedules(horizon_days=min(max(days, 1), 366))
+        return Response({'created': created, 'skipped_occurrences': skipped})
+
 
 class ClassBookingViewSet(viewsets.ModelViewSet):
     
     serializer_class = ClassBookingSerializer
-    permission_classes = [IsMemberOrAdminStaff]
+    permission_classes = [IsMemberOrAdminStaff, HasActiveMembership]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['fitness_class__name', 'user__email']
     search_fields = ['fitness_class__name', 'user__email']
@@ -217,14 +443,99 @@ class ClassBookingViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        services.cancel_booking(instance)
+
+    @swagger_auto_schema(
+        operation_description="Enrol a list of users into a list of classes in one request (Admin and Staff only).\n\nEach class is checked for capacity once; users are seated in the given order until it is full. Returns one result per user and class: created, duplicate or full.",
+        request_body=BulkEnrollSerializer,
+        responses={
+            200: BulkEnrollResultSerializer(many=True),
+            400: "Bad Request",
+        }
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminOrStaff])
+    def bulk_enroll(self, request):
+        serializer = BulkEnrollSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = services.bulk_enroll(serializer.validated_data['users'], serializer.validated_data['fitness_classes'])
+        return Response(BulkEnrollResultSerializer(results, many=True).data)
+
+    @swagger_auto_schema(
+        operation_description="Signed, short-lived check-in code for a booking, shown as a QR code at the front desk.\n\nCodes expire after 10 minutes; the app should fetch a fresh one while it is displayed.",
+        responses={200: CheckInTokenSerializer, 404: "Not Found"}
+    )
+    @action(detail=True, methods=['get'])
+    def check_in_token(self, request, pk=None):
+        booking = self.get_object()
+        token, expires_at = attendance_services.make_check_in_token(booking)
+        return Response(CheckInTokenSerializer({'token': token, 'expires_at': expires_at}).data)
+
+    @swagger_auto_schema(
+        operation_description="Class booking report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False , methods=['get'] , permission_classes=[IsAdminOrStaff])
     def class_booking_report(self , request):
         try:
             if request.user.role in ['ADMIN' , 'STAFF'] or request.user.is_superuser:
                 # Generate class booking report
                 booking_data = ClassBooking.objects.select_related('user' , 'fitness_class').all()
+                response = export_response(request, booking_data, CLASS_BOOKING_REPORT_COLUMNS, 'class_bookings')
+                if response is not None:
+                    return response
                 serializer = ClassBookingSerializer(booking_data , many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class WaitlistViewSet(viewsets.ModelViewSet):
+    """
+    Waitlist for fully booked classes:
+        . Members with an active membership join the queue of a full class and
+          can leave it at any time.
+        . When a booking is cancelled, the oldest entry is promoted into the freed seat.
+        . Admin and staff can view every queue.
+    """
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsMemberOrAdminStaff, HasActiveMembership]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['fitness_class']
+    pagination_class = WaitlistPagination
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        user = self.request.user
+
+        if getattr(self, 'swagger_fake_view', False):
+            return WaitlistEntry.objects.none()
+
+        if user.is_superuser or user.role in ['ADMIN', 'STAFF']:
+            return WaitlistEntry.objects.with_position().select_related('user', 'fitness_class')
+        elif user.role == 'MEMBER':
+            return WaitlistEntry.objects.filter(user=user).with_position().select_related('user', 'fitness_class')
+
+        return WaitlistEntry.objects.none()
+
+    @swagger_auto_schema(
+        operation_description="Join the waitlist of a fully booked class",
+        request_body=WaitlistEntrySerializer,
+        responses={
+            201: WaitlistEntrySerializer,
+            400: "Bad Request",
+        }
+    )
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @swagger_auto_schema(
+        operation_description="Leave a class waitlist",
+        responses={
+            204: "No Content",
+            404: "Not Found",
+        }
+    )
+    def destroy(self, request, *args, **kwargs):
+        return super().destroy(request, *args, **kwargs)
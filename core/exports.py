@@ -0,0 +1,192 @@
+import csv
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.response import Response
+
+# Query parameter selecting a streamed export on the *_report actions.
+# (`format` is taken by DRF's renderer negotiation.)
+EXPORT_PARAM = 'export'
+EXPORT_CHUNK_SIZE = 2000
+# rows rendered per chunk handed to the WSGI server
+ROWS_PER_WRITE = 500
+
+# (output column, field path) per report; related fields are joined by values_list()
+CLASS_REPORT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('instructor', 'instructor__email'),
+    ('schedule', 'schedule'),
+    ('duration', 'duration'),
+    ('max_capacity', 'max_capacity'),
+    ('booked_count', 'booked_count'),
+    ('created_at', 'created_at'),
+]
+
+CLASS_BOOKING_REPORT_COLUMNS = [
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('user_email', 'user__email'),
+    ('fitness_class', 'fitness_class_id'),
+    ('fitness_class_name', 'fitness_class__name'),
+    ('schedule', 'fitness_class__schedule'),
+    ('booking_date', 'booking_date'),
+]
+
+MEMBERSHIP_REPORT_COLUMNS = [
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('user_email', 'user__email'),
+    ('plan', 'plan_id'),
+    ('plan_name', 'plan__name'),
+    ('start_date', 'start_date'),
+    ('end_date', 'end_date'),
+    ('is_active', 'is_active'),
+]
+
+PAYMENT_REPORT_COLUMNS = [
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('user_email', 'user__email'),
+    ('membership', 'membership_id'),
+    ('membership_plan', 'membership_plan_id'),
+    ('plan_name', 'membership_plan__name'),
+    ('amount', 'amount'),
+    ('payment_date', 'payment_date'),
+    ('payment_method', 'payment_method'),
+    ('transaction_id', 'transaction_id'),
+    ('is_successful', 'is_successful'),
+]
+
+FEEDBACK_REPORT_COLUMNS = [
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('user_email', 'user__email'),
+    ('fitness_class', 'fitness_class_id'),
+    ('fitness_class_name', 'fitness_class__name'),
+    ('rating', 'rating'),
+    ('comment', 'comment'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+ATTENDANCE_REPORT_COLUMNS = [
+    ('id', 'id'),
+    ('user', 'user_id'),
+    ('user_email', 'user__email'),
+    ('fitness_class', 'fitness_class_id'),
+    ('fitness_class_name', 'fitness_class__name'),
+    ('class_booking', 'class_booking_id'),
+    ('attendance_date', 'attendance_date'),
+    ('status', 'status'),
+]
+
+USER_REPORT_COLUMNS = [
+    ('id', 'id'),
+    ('email', 'email'),
+    ('role', 'role'),
+    ('phone', 'phone'),
+    ('is_verified', 'is_verified'),
+    ('is_active', 'is_active'),
+    ('date_joined', 'date_joined'),
+]
+
+
+class _Echo:
+    """File-like object whose write() hands back what it is given, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def export_rows(queryset, columns):
+    """Flat value tuples straight from the database cursor: no model instances, no serializers."""
+    paths = [path for _, path in columns]
+    return queryset.order_by('pk').values_list(*paths).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _csv_stream(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in columns])
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow(['' if value is None else _plain(value) for value in row]))
+        if len(lines) == ROWS_PER_WRITE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+def _ndjson_stream(rows, columns):
+    names = [name for name, _ in columns]
+    encode = json.JSONEncoder(ensure_ascii=False, default=_plain).encode
+    lines = []
+    for row in rows:
+        lines.append(encode(dict(zip(names, row))) + '\n')
+        if len(lines) == ROWS_PER_WRITE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+
+EXPORT_FORMATS = {
+    'csv': (_csv_stream, 'text/csv; charset=utf-8'),
+    'ndjson': (_ndjson_stream, 'application/x-ndjson; charset=utf-8'),
+}
+# for the report actions' swagger_auto_schema manual_parameters
+EXPORT_PARAMETER = openapi.Parameter(
+    EXPORT_PARAM, openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(EXPORT_FORMATS),
+    description="Stream the report as a CSV or NDJSON download instead of a JSON list",
+)
+
+
+def render_rows(rows, columns, export):
+    """Text chunks of `rows` (value tuples from export_rows) rendered as `export` ('csv' or 'ndjson')."""
+    stream, _ = EXPORT_FORMATS[export]
+    return stream(rows, columns)
+
+
+def render_export(queryset, columns, export):
+    """Text chunks of `queryset` rendered as `export` ('csv' or 'ndjson')."""
+    return render_rows(export_rows(queryset, columns), columns, export)
+
+
+def export_response(request, queryset, columns, name):
+    """
+    Stream `queryset` as CSV or NDJSON when the request asks for it with
+    ?export=csv|ndjson; returns None otherwise so the action can answer as before.
+
+    `columns` is a list of (output name, field path) pairs read with
+    values_list(), so memory stays flat whatever the number of rows.
+    """
+    export = request.query_params.get(EXPORT_PARAM)
+    if not export:
+        return None
+    if export not in EXPORT_FORMATS:
+        return Response(
+            {'error': f"{EXPORT_PARAM} must be one of: {', '.join(EXPORT_FORMATS)}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    _, content_type = EXPORT_FORMATS[export]
+    response = StreamingHttpResponse(render_export(queryset, columns, export), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}-{timezone.localdate().isoformat()}.{export}"'
+    return response
+
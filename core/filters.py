@@ -1,15 +1,39 @@
 from django_filters import rest_framework as filters
-from memberships.models import MembershipPlan
+from django.db.models import F
+from memberships.models import MembershipPlan, Membership
 from classes.models import FitnessClass
 from payments.models import Payment
+from reports.models import ClassRollup, InstructorDailyRollup
 
 class FitnessClassFilter(filters.FilterSet):
     max_capacity_min = filters.NumberFilter(field_name="max_capacity", lookup_expr="gte")
     max_capacity_max = filters.NumberFilter(field_name="max_capacity", lookup_expr="lte")
+    available = filters.BooleanFilter(method='filter_available')
+    min_seats = filters.NumberFilter(method='filter_min_seats')
 
     class Meta:
         model = FitnessClass
-        fields = ['max_capacity_min', 'max_capacity_max', 'instructor__email']
+        fields = ['max_capacity_min', 'max_capacity_max', 'instructor__email', 'available', 'min_seats']
+
+    def filter_available(self, queryset, name, value):
+        if value:
+            return queryset.filter(booked_count__lt=F('max_capacity'))
+        return queryset.filter(booked_count__gte=F('max_capacity'))
+
+    def filter_min_seats(self, queryset, name, value):
+        return queryset.filter(max_capacity__gte=F('booked_count') + value)
+
+class MembershipFilter(filters.FilterSet):
+    active = filters.BooleanFilter(method='filter_active')
+
+    class Meta:
+        model = Membership
+        fields = ['is_active', 'plan__name', 'active']
+
+    def filter_active(self, queryset, name, value):
+        if value:
+            return queryset.active()
+        return queryset.inactive()
 
 class MembershipPlanFilter(filters.FilterSet):
     price_min = filters.NumberFilter(field_name="price", lookup_expr="gte")
@@ -30,4 +54,22 @@ class PaymentFilter(filters.FilterSet):
 
     class Meta:
         model = Payment
-        fields = ['amount_min', 'amount_max', 'payment_date_min', 'payment_date_max']
\ No newline at end of file
+        fields = ['amount_min', 'amount_max', 'payment_date_min', 'payment_date_max']
+
+
+class ClassRollupFilter(filters.FilterSet):
+    date_from = filters.DateFilter(field_name="date", lookup_expr="gte")
+    date_to = filters.DateFilter(field_name="date", lookup_expr="lte")
+
+    class Meta:
+        model = ClassRollup
+        fields = ['date_from', 'date_to', 'instructor', 'fitness_class']
+
+
+class InstructorDailyRollupFilter(filters.FilterSet):
+    date_from = filters.DateFilter(field_name="date", lookup_expr="gte")
+    date_to = filters.DateFilter(field_name="date", lookup_expr="lte")
+
+    class Meta:
+        model = InstructorDailyRollup
+        fields = ['date_from', 'date_to', 'instructor']
@@ -0,0 +1,19 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from core import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of every searchable model."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows indexed per batch (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        for label in search.SEARCH_DOCUMENTS:
+            model = apps.get_model(label)
+            pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(pks), chunk_size):
+                search.update_search_index(model.objects.filter(pk__in=pks[start:start + chunk_size]))
+            self.stdout.write(self.style.SUCCESS(f"Indexed {len(pks)} rows of {label}."))
@@ -1,3 +1,23 @@
 from django.db import models
 
 # Create your models here.
+
+class SearchTerm(models.Model):
+    """
+    Inverted index used by core.search when the database has no tsvector
+    support (SQLite in development and tests).
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+
+    class Meta:
+        # covering indexes: term prefix -> objects for matching, object -> terms for ranking
+        indexes = [
+            models.Index(fields=['model', 'term', 'object_id'], name='search_term_idx'),
+            models.Index(fields=['model', 'object_id', 'term'], name='search_term_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.object_id} {self.term}"
@@ -1,9 +1,10 @@
 from django.shortcuts import render
 from rest_framework import permissions
-from classes.models import FitnessClass, ClassBooking
+from classes.models import FitnessClass, ClassBooking, WaitlistEntry
 from payments.models import Payment
 from feedback.models import Feedback
 from accounts.models import Profile
+from memberships.services import has_active_membership
 
 # Create your views here.
 
@@ -21,6 +22,13 @@ class IsAdminOrStaff(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and (request.user.role in ['ADMIN', 'STAFF'] or request.user.is_superuser)
 
+class IsAdmin(permissions.BasePermission):
+    """Only Admin users can access the view."""
+    message = "You do not have permission to perform this action."
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (request.user.role == 'ADMIN' or request.user.is_superuser)
+
 class IsAdminOrStaffOrReadOnly(permissions.BasePermission):
     """ only admin and staff can edit, others can only read """
     def has_permission(self, request, view):
@@ -71,6 +79,17 @@ class IsMember(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.role == 'MEMBER'
 
+class HasActiveMembership(permissions.BasePermission):
+    """Members need an active membership to create objects (bookings, waitlist entries, feedback); admin and staff are exempt."""
+    message = "An active membership is required."
+
+    def has_permission(self, request, view):
+        if getattr(view, 'action', None) != 'create' or not request.user.is_authenticated:
+            return True
+        if request.user.is_superuser or request.user.role in ['ADMIN', 'STAFF']:
+            return True
+        return has_active_membership(request.user.pk)
+
 class IsMemberOrAdminStaff(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.user.is_authenticated:
@@ -80,9 +99,9 @@ class IsMemberOrAdminStaff(permissions.BasePermission):
         return False
 
     def has_object_permission(self, request, view, obj):
-        # Members can only modify their own bookings
+        # Members can only modify their own bookings and waitlist entries
         if request.user.role == 'MEMBER':
-            if isinstance(obj, ClassBooking):
+            if isinstance(obj, (ClassBooking, WaitlistEntry)):
                 return obj.user == request.user
         return True
 
@@ -0,0 +1,139 @@
+import re
+from django.apps import apps
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import EmailField, F, FloatField, OuterRef, Q, Subquery, Sum, TextField, Value
+from django.db.models.functions import Coalesce, Replace
+from rest_framework.filters import SearchFilter
+
+# Searchable text per model: (field path, weight). Weights follow PostgreSQL's
+# A-D ranking classes; the SQLite fallback scores them with the same defaults.
+SEARCH_DOCUMENTS = {
+    'classes.FitnessClass': [('name', 'A'), ('description', 'B'), ('instructor__email', 'C')],
+    'memberships.MembershipPlan': [('name', 'A'), ('description', 'B')],
+}
+WEIGHT_SCORES = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+
+
+def uses_tsvector(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall((text or '').lower())]
+
+
+def _column(model, path):
+    """A field of the row itself, or a related field pulled in with a subquery (UPDATE cannot join)."""
+    if '__' not in path:
+        return F(path)
+    relation, remote = path.split('__', 1)
+    field = model._meta.get_field(relation)
+    return Subquery(field.related_model._default_manager.filter(pk=OuterRef(field.attname)).values(remote)[:1])
+
+
+def _field(model, path):
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _document_text(model, path):
+    text = Coalesce(_column(model, path), Value(''), output_field=TextField())
+    if isinstance(_field(model, path), EmailField):
+        # the parser keeps an address as one `email` lexeme; split it into
+        # its parts so "jane" finds jane.doe@gym.com, as tokenize() does
+        for separator in '@.':
+            text = Replace(text, Value(separator), Value(' '), output_field=TextField())
+    return text
+
+
+def search_vector_expression(model):
+    document = SEARCH_DOCUMENTS[model._meta.label]
+    vector = None
+    for path, weight in document:
+        part = SearchVector(_document_text(model, path), weight=weight)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_index(queryset):
+    """
+    (Re)index every row of `queryset`.
+    On PostgreSQL this is a single UPDATE of the tsvector column; elsewhere
+    the rows' terms are rewritten in the core.SearchTerm inverted index.
+    """
+    model = queryset.model
+    if uses_tsvector(queryset.db):
+        return queryset.update(search_vector=search_vector_expression(model))
+
+    SearchTerm = apps.get_model('core', 'SearchTerm')
+    label = model._meta.label
+    document = SEARCH_DOCUMENTS[label]
+    rows = list(queryset.values_list('pk', *[path for path, _ in document]))
+    pks = [row[0] for row in rows]
+    SearchTerm.objects.filter(model=label, object_id__in=pks).delete()
+
+    terms = []
+    for pk, *values in rows:
+        scores = {}
+        for (path, weight), value in zip(document, values):
+            for token in tokenize(value):
+                scores[token] = max(scores.get(token, 0), WEIGHT_SCORES[weight])
+        terms.extend(SearchTerm(model=label, object_id=pk, term=term, weight=score) for term, score in scores.items())
+    SearchTerm.objects.bulk_create(terms, batch_size=1000)
+    return len(rows)
+
+
+def remove_from_search_index(model, pks):
+    if not uses_tsvector():
+        apps.get_model('core', 'SearchTerm').objects.filter(model=model._meta.label, object_id__in=pks).delete()
+
+
+def search(queryset, text):
+    """Filter `queryset` to rows matching every word of `text`, best ranked first."""
+    tokens = tokenize(text)
+    if not tokens:
+        return queryset
+
+    if uses_tsvector(queryset.db):
+        # every word as a prefix ("yog" finds yoga), like the SearchTerm range
+        # scans below; tokens are \w+ only, so they carry no tsquery operators
+        query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), search_type='raw')
+        return (
+            queryset.filter(search_vector=query)
+            .annotate(search_rank=SearchRank(F('search_vector'), query))
+            .order_by('-search_rank', 'pk')
+        )
+
+    SearchTerm = apps.get_model('core', 'SearchTerm')
+    terms = SearchTerm.objects.filter(model=queryset.model._meta.label)
+    # prefix matches as index range scans on (model, term)
+    matches = [Q(term__gte=token, term__lt=token + '\uffff') for token in tokens]
+    for match in matches:
+        queryset = queryset.filter(pk__in=terms.filter(match).values('object_id'))
+    any_token = Q()
+    for match in matches:
+        any_token |= match
+    rank = (
+        terms.filter(any_token, object_id=OuterRef('pk'))
+        .order_by()
+        .values('object_id')
+        .annotate(total=Sum('weight'))
+        .values('total')
+    )
+    return queryset.annotate(search_rank=Subquery(rank, output_field=FloatField())).order_by('-search_rank', 'pk')
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Drop-in replacement for DRF's SearchFilter (same `search` parameter) that
+    uses the indexed full-text search above instead of ILIKE '%term%' scans.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        return search(queryset, text.replace('\x00', ''))
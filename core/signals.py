@@ -1,26 +1,58 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from memberships.models import Membership
+from memberships.services import renew_membership
 from payments.models import Payment
-from django.utils import timezone
+from core import search
 
 @receiver(post_save, sender=Payment)
 def create_membership_on_payment(sender, instance, created, **kwargs):
-    if created and instance.is_successful:
+    # payments.services.create_payment links the membership itself; this only
+    # covers successful payments recorded elsewhere (e.g. the admin)
+    if created and instance.is_successful and instance.membership_id is None and instance.membership_plan_id:
         try:
-            start_date = timezone.now()
-            end_date = start_date + timezone.timedelta(days=instance.membership_plan.duration_in_days)
-
-            membership = Membership.objects.create(
-                user=instance.user,
-                plan=instance.membership_plan,
-                start_date=start_date,
-                end_date=end_date,
-                is_active=True
-            )
-
-            # Link the created membership to the payment
+            # stacked on the member's coverage like any other renewal; the
+            # savepoint keeps a failure here from breaking the caller's transaction
+            with transaction.atomic():
+                membership = renew_membership(instance.user, instance.membership_plan)
+
+            # Link the created membership to the payment without re-saving (and re-signalling) it
+            Payment.objects.filter(pk=instance.pk).update(membership=membership)
             instance.membership = membership
-            instance.save()
         except Exception as e:
-            print(f"Error creating membership: {e}")
\ No newline at end of file
+            print(f"Error creating membership: {e}")
+
+@receiver(post_save, sender='classes.FitnessClass')
+@receiver(post_save, sender='memberships.MembershipPlan')
+def update_search_index_on_save(sender, instance, **kwargs):
+    search.update_search_index(sender.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender='classes.FitnessClass')
+@receiver(post_delete, sender='memberships.MembershipPlan')
+def remove_from_search_index_on_delete(sender, instance, **kwargs):
+    search.remove_from_search_index(sender, [instance.pk])
+
+
+# the instructor's own fields in the class search document (instructor__email)
+INSTRUCTOR_SEARCH_FIELDS = [
+    path.split('__', 1)[1] for path, _ in search.SEARCH_DOCUMENTS['classes.FitnessClass'] if path.startswith('instructor__')
+]
+
+
+@receiver(pre_save, sender='accounts.CustomUser')
+def remember_indexed_instructor_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or (update_fields is not None and not set(update_fields) & set(INSTRUCTOR_SEARCH_FIELDS)):
+        return
+    instance._indexed_instructor_fields = (
+        sender.objects.filter(pk=instance.pk).values_list(*INSTRUCTOR_SEARCH_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender='accounts.CustomUser')
+def reindex_instructor_classes(sender, instance, created, **kwargs):
+    # only when indexed fields changed, not on every profile or last_login save
+    indexed = instance.__dict__.pop('_indexed_instructor_fields', None)
+    if indexed is None or indexed == tuple(getattr(instance, name) for name in INSTRUCTOR_SEARCH_FIELDS):
+        return
+    search.update_search_index(instance.fitness_classes.all())
@@ -0,0 +1,34 @@
+from datetime import timedelta
+from django.utils import timezone
+from accounts.models import CustomUser
+from classes.models import FitnessClass
+from memberships.models import MembershipPlan, Membership
+
+
+def make_user(email, role='MEMBER'):
+    return CustomUser.objects.create_user(email=email, password='password', role=role, is_verified=True)
+
+
+def make_class(instructor, name='Spin', max_capacity=10, starts_in=timedelta(days=1), duration=60):
+    return FitnessClass.objects.create(
+        name=name,
+        description=name,
+        duration=duration,
+        max_capacity=max_capacity,
+        instructor=instructor,
+        schedule=timezone.now() + starts_in,
+    )
+
+
+def make_plan(days=30, name=None, price='30.00'):
+    return MembershipPlan.objects.create(
+        name=name or f'{days} days', description='plan', price=price, duration_in_days=days,
+    )
+
+
+def give_membership(user, days=30, plan=None):
+    """An active membership that started a day ago and runs `days` more days."""
+    now = timezone.now()
+    return Membership.objects.create(
+        user=user, plan=plan or make_plan(), start_date=now - timedelta(days=1), end_date=now + timedelta(days=days), is_active=True,
+    )
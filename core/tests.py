@@ -1,3 +1,60 @@
+from datetime import timedelta
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from classes.models import FitnessClass
+from core import search
+from core.testing import make_user
 
 # Create your tests here.
+
+class SearchTests(TestCase):
+    """Runs against whichever index the backend uses (tsvector or core.SearchTerm)."""
+
+    def setUp(self):
+        instructor = make_user('jane.doe@gym.example.com', 'STAFF')
+        other = make_user('sam@gym.example.com', 'STAFF')
+        schedule = timezone.now() + timedelta(days=1)
+        self.yoga = FitnessClass.objects.create(
+            name='Morning Yoga', description='Gentle flow', duration=60, max_capacity=10, instructor=instructor, schedule=schedule,
+        )
+        self.spin = FitnessClass.objects.create(
+            name='Spin', description='Hill climbs and yoga stretches', duration=45, max_capacity=10, instructor=other, schedule=schedule,
+        )
+
+    def found(self, text):
+        return list(search.search(FitnessClass.objects.all(), text))
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.found('yog'), [self.yoga, self.spin])
+        self.assertEqual(self.found('mor yo'), [self.yoga])
+
+    def test_instructor_email_parts_match(self):
+        self.assertEqual(self.found('jane'), [self.yoga])
+        self.assertEqual(self.found('doe'), [self.yoga])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.found('yoga pilates'), [])
+
+    def test_search_parameter_on_the_class_list(self):
+        response = self.client.get('/fitness_classes/', {'search': 'hill'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.spin.pk])
+
+
+    def test_instructor_email_change_reindexes_their_classes(self):
+        instructor = self.yoga.instructor
+        instructor.email = 'janet.smith@gym.example.com'
+        instructor.save()
+        self.assertEqual(self.found('smith'), [self.yoga])
+        self.assertEqual(self.found('doe'), [])
+
+    def test_other_user_saves_leave_the_index_alone(self):
+        instructor = self.yoga.instructor
+        for changes in [{'is_verified': False}, {'role': 'ADMIN'}]:
+            for name, value in changes.items():
+                setattr(instructor, name, value)
+            with CaptureQueriesContext(connection) as queries:
+                instructor.save()
+            self.assertEqual([q['sql'] for q in queries if 'fitnessclass' in q['sql'] or 'searchterm' in q['sql']], [])
+        self.assertEqual(self.found('jane'), [self.yoga])
@@ -0,0 +1,42 @@
+from django.db import models
+from django.db.models import Sum
+from classes.managers import RATING_VALUES, rating_changes
+from classes.models import FitnessClass
+
+RATING_COUNTERS = ['rating_count', 'rating_sum', *(f'rating_{value}' for value in RATING_VALUES)]
+
+
+class InstructorRatingQuerySet(models.QuerySet):
+    def add_rating(self, instructor_id, rating):
+        """Count one `rating` star feedback towards an instructor: an insert-if-missing and one UPDATE."""
+        self.bulk_create([self.model(instructor_id=instructor_id)], ignore_conflicts=True)
+        return self.filter(pk=instructor_id).update(**rating_changes(rating, 1)) == 1
+
+    def remove_rating(self, instructor_id, rating):
+        """Take back one `rating` star feedback from an instructor, never going below zero."""
+        return self.filter(
+            pk=instructor_id, **{f'rating_{rating}__gte': 1},
+        ).update(**rating_changes(rating, -1)) == 1
+
+    def refresh(self, instructor_ids):
+        """
+        Recompute instructors' totals from the counters of the classes they
+        teach, after classes moved to another instructor or were deleted.
+        """
+        totals = {
+            row.pop('instructor_id'): row
+            for row in FitnessClass.objects.filter(instructor_id__in=instructor_ids)
+            .order_by().values('instructor_id').annotate(**{name: Sum(name) for name in RATING_COUNTERS})
+        }
+        rows = []
+        for instructor_id in instructor_ids:
+            counts = totals.get(instructor_id) or dict.fromkeys(RATING_COUNTERS, 0)
+            average = counts['rating_sum'] / counts['rating_count'] if counts['rating_count'] else 0
+            rows.append(self.model(instructor_id=instructor_id, rating_average=average, **counts))
+        self.bulk_create(
+            rows, update_conflicts=True, unique_fields=['instructor'], update_fields=[*RATING_COUNTERS, 'rating_average'],
+        )
+
+
+class InstructorRatingManager(models.Manager.from_queryset(InstructorRatingQuerySet)):
+    pass
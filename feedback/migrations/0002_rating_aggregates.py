@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_instructor_ratings(apps, schema_editor):
+    FitnessClass = apps.get_model('classes', 'FitnessClass')
+    InstructorRating = apps.get_model('feedback', 'InstructorRating')
+    counters = ['rating_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+    rows = []
+    for totals in (
+        FitnessClass.objects.filter(rating_count__gt=0).order_by().values('instructor_id')
+        .annotate(**{name: models.Sum(name) for name in counters})
+    ):
+        totals['rating_average'] = totals['rating_sum'] / totals['rating_count']
+        rows.append(InstructorRating(**totals))
+    InstructorRating.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('classes', '0008_rating_aggregates'),
+        ('feedback', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstructorRating',
+            fields=[
+                ('instructor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_average', models.FloatField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-rating_average', '-rating_count'], name='instructor_top_rated_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_instructor_ratings, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from accounts.models import CustomUser
 from classes.models import FitnessClass 
 from django.core.validators import MinValueValidator, MaxValueValidator
+from feedback.managers import InstructorRatingManager
 
 # Create your models here.
 
@@ -14,4 +15,58 @@ class Feedback(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"{self.user.username} - {self.fitness_class.name} - {self.rating}"
\ No newline at end of file
+        return f"{self.user.username} - {self.fitness_class.name} - {self.rating}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what this feedback counts towards, so an edit can move it
+        instance._counted = (instance.__dict__.get('fitness_class_id'), instance.__dict__.get('rating'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        counted = None if self._state.adding else getattr(self, '_counted', None)
+        if counted == (self.fitness_class_id, self.rating):
+            return super().save(*args, **kwargs)
+
+        # The feedback row and the class and instructor rating counters change
+        # in one transaction, so the aggregates always match the feedback.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if counted is not None:
+                uncount_rating(*counted)
+            FitnessClass.objects.add_rating(self.fitness_class_id, self.rating)
+            InstructorRating.objects.add_rating(self.fitness_class.instructor_id, self.rating)
+        self._counted = (self.fitness_class_id, self.rating)
+
+
+class InstructorRating(models.Model):
+    """Feedback rating aggregates over all classes of an instructor (see FitnessClass.rating_*)."""
+    instructor = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='rating')
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    objects = InstructorRatingManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-rating_average', '-rating_count'], name='instructor_top_rated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.instructor.email}: {self.rating_average:.2f} ({self.rating_count})"
+
+
+def uncount_rating(fitness_class_id, rating):
+    """Take a rating back from a class and from whoever teaches it now."""
+    instructor_id = FitnessClass.objects.filter(pk=fitness_class_id).values_list('instructor_id', flat=True).first()
+    if instructor_id is None:
+        return
+    FitnessClass.objects.remove_rating(fitness_class_id, rating)
+    InstructorRating.objects.remove_rating(instructor_id, rating)
@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from classes.models import FitnessClass
+from feedback.models import Feedback, InstructorRating, uncount_rating
+
+
+def _origin_model(origin):
+    return getattr(origin, 'model', type(origin))
+
+
+@receiver(post_delete, sender=Feedback)
+def uncount_rating_on_feedback_delete(sender, instance, origin=None, **kwargs):
+    # Also fires for cascades (e.g. a deleted member). A deleted class takes
+    # its own counters with it and re-totals its instructor below.
+    if _origin_model(origin) is FitnessClass:
+        return
+    uncount_rating(instance.fitness_class_id, instance.rating)
+
+
+@receiver(pre_save, sender=FitnessClass)
+def remember_rated_instructor(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._rated_instructor_id = (
+        FitnessClass.objects.filter(pk=instance.pk).values_list('instructor_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=FitnessClass)
+def move_ratings_on_instructor_change(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_rated_instructor_id', None)
+    if previous is not None and previous != instance.instructor_id:
+        InstructorRating.objects.refresh([previous, instance.instructor_id])
+    instance._rated_instructor_id = instance.instructor_id
+
+
+@receiver(post_delete, sender=FitnessClass)
+def retotal_instructor_on_class_delete(sender, instance, origin=None, **kwargs):
+    # when the instructor themselves is being deleted their totals go with them
+    if _origin_model(origin) is get_user_model():
+        return
+    InstructorRating.objects.refresh([instance.instructor_id])
@@ -1,3 +1,109 @@
+from datetime import timedelta
 from django.test import TestCase
+from rest_framework.test import APIClient
+from classes.models import FitnessClass
+from classes.serializers import FitnessClassSerializer
+from core.testing import make_user, make_class, give_membership
+from feedback.models import Feedback, InstructorRating
 
 # Create your tests here.
+
+def rating_row(obj):
+    return (obj.rating_count, obj.rating_sum, round(obj.rating_average, 4), [getattr(obj, f'rating_{value}') for value in range(1, 6)])
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach@example.com', 'STAFF')
+        self.other_coach = make_user('other@example.com', 'STAFF')
+        self.yoga = make_class(self.coach, 'Yoga', starts_in=-timedelta(days=1))
+        self.spin = make_class(self.coach, 'Spin', starts_in=-timedelta(days=2))
+        self.members = [make_user(f'member{i}@example.com') for i in range(3)]
+
+    def rate(self, member, fitness_class, rating):
+        return Feedback.objects.create(user=member, fitness_class=fitness_class, rating=rating, comment='ok')
+
+    def class_rating(self, fitness_class):
+        return rating_row(FitnessClass.objects.get(pk=fitness_class.pk))
+
+    def instructor_rating(self, instructor):
+        return rating_row(InstructorRating.objects.get(pk=instructor.pk))
+
+    def test_ratings_are_counted_on_the_class_and_the_instructor(self):
+        for member, rating in zip(self.members, [5, 4, 4]):
+            self.rate(member, self.yoga, rating)
+        self.rate(self.members[0], self.spin, 1)
+        self.assertEqual(self.class_rating(self.yoga), (3, 13, 4.3333, [0, 0, 0, 2, 1]))
+        self.assertEqual(self.class_rating(self.spin), (1, 1, 1.0, [1, 0, 0, 0, 0]))
+        self.assertEqual(self.instructor_rating(self.coach), (4, 14, 3.5, [1, 0, 0, 2, 1]))
+
+    def test_an_edited_rating_moves_between_buckets_and_classes(self):
+        feedback = self.rate(self.members[0], self.yoga, 5)
+        feedback = Feedback.objects.get(pk=feedback.pk)
+        feedback.rating = 2
+        feedback.save()
+        self.assertEqual(self.class_rating(self.yoga), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+        feedback.fitness_class = self.spin
+        feedback.save()
+        self.assertEqual(self.class_rating(self.yoga), (0, 0, 0.0, [0, 0, 0, 0, 0]))
+        self.assertEqual(self.class_rating(self.spin), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+        self.assertEqual(self.instructor_rating(self.coach), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+        # a comment-only edit leaves the counters alone
+        feedback.comment = 'changed my mind'
+        feedback.save()
+        self.assertEqual(self.class_rating(self.spin), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+
+    def test_deleted_feedback_is_taken_back(self):
+        kept = self.rate(self.members[0], self.yoga, 3)
+        self.rate(self.members[1], self.yoga, 5).delete()
+        self.assertEqual(self.class_rating(self.yoga), (1, 3, 3.0, [0, 0, 1, 0, 0]))
+        self.assertEqual(self.instructor_rating(self.coach), (1, 3, 3.0, [0, 0, 1, 0, 0]))
+        # a deleted member takes their feedback with them
+        kept.user.delete()
+        self.assertEqual(self.class_rating(self.yoga), (0, 0, 0.0, [0, 0, 0, 0, 0]))
+
+    def test_ratings_follow_a_class_to_its_new_instructor(self):
+        self.rate(self.members[0], self.yoga, 4)
+        self.rate(self.members[1], self.spin, 2)
+        self.yoga.instructor = self.other_coach
+        self.yoga.save()
+        self.assertEqual(self.instructor_rating(self.coach), (1, 2, 2.0, [0, 1, 0, 0, 0]))
+        self.assertEqual(self.instructor_rating(self.other_coach), (1, 4, 4.0, [0, 0, 0, 1, 0]))
+        self.spin.delete()
+        self.assertEqual(self.instructor_rating(self.coach), (0, 0, 0.0, [0, 0, 0, 0, 0]))
+
+    def test_stale_class_edit_keeps_the_ratings(self):
+        stale = FitnessClass.objects.get(pk=self.yoga.pk)
+        self.rate(self.members[0], self.yoga, 5)
+        serializer = FitnessClassSerializer(stale, data={'name': 'Power Yoga'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(self.class_rating(self.yoga), (1, 5, 5.0, [0, 0, 0, 0, 1]))
+
+
+class RatingsEndpointTests(TestCase):
+    def setUp(self):
+        self.coach = make_user('coach@example.com', 'STAFF')
+        self.member = make_user('member@example.com')
+        self.fitness_class = make_class(self.coach, starts_in=-timedelta(days=1))
+        give_membership(self.member)
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def test_feedback_through_the_api_shows_in_the_histogram(self):
+        response = self.client.post('/feedbacks/', {'fitness_class': self.fitness_class.pk, 'rating': 4, 'comment': 'Great'})
+        self.assertEqual(response.status_code, 201)
+        self.client.patch(f"/feedbacks/{response.data['id']}/", {'rating': 2}, format='json')
+        for params, key in [({'fitness_class': self.fitness_class.pk}, 'fitness_class'), ({'instructor': self.coach.pk}, 'instructor')]:
+            summary = self.client.get('/feedbacks/ratings/', params).data
+            self.assertEqual(
+                (summary['average'], summary['count'], summary['histogram']),
+                (2.0, 1, {'1': 0, '2': 1, '3': 0, '4': 0, '5': 0}), key,
+            )
+
+    def test_unrated_instructor_and_bad_queries(self):
+        summary = self.client.get('/feedbacks/ratings/', {'instructor': self.coach.pk}).data
+        self.assertEqual((summary['average'], summary['count']), (None, 0))
+        self.assertEqual(self.client.get('/feedbacks/ratings/').status_code, 400)
+        self.assertEqual(self.client.get('/feedbacks/ratings/', {'fitness_class': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/feedbacks/ratings/', {'fitness_class': self.fitness_class.pk + 1}).status_code, 404)
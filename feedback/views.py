@@ -1,19 +1,27 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
 from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import PageNumberPagination
-from feedback.models import Feedback
+from feedback.models import Feedback, InstructorRating
+from classes.models import FitnessClass
+from accounts.models import CustomUser
+from classes.serializers import RatingSummarySerializer
 from feedback.serializers import FeedbackSerializer
 from core.permissions import IsMemberOrAdminStaff
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from core.permissions import FeedbackPermission
+from core.permissions import FeedbackPermission, HasActiveMembership
 from core.permissions import IsAdminOrStaff
+from core.exports import EXPORT_PARAMETER, export_response, FEEDBACK_REPORT_COLUMNS
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
+
+RATING_FIELDS = ['rating_count', 'rating_average', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5']
+
 # Create your views here.
 
 class FeedbackPagination(PageNumberPagination):
@@ -22,7 +30,7 @@ class FeedbackPagination(PageNumberPagination):
 class FeedbackViewSet(viewsets.ModelViewSet):
     queryset = Feedback.objects.select_related('user', 'fitness_class').all()
     serializer_class = FeedbackSerializer
-    permission_classes = [FeedbackPermission]
+    permission_classes = [FeedbackPermission, HasActiveMembership]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['rating', 'fitness_class__name']
     search_fields = ['comment', 'fitness_class__name', 'user__email']
@@ -70,14 +78,51 @@ class FeedbackViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
+    @swagger_auto_schema(
+        operation_description="Feedback report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def feedback_report(self, request):
         try:
             if request.user.role == 'ADMIN' or request.user.is_superuser:
                 # Generate feedback report
                 feedback_data = Feedback.objects.select_related('user', 'fitness_class').all()
+                response = export_response(request, feedback_data, FEEDBACK_REPORT_COLUMNS, 'feedback')
+                if response is not None:
+                    return response
                 serializer = FeedbackSerializer(feedback_data, many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @swagger_auto_schema(
+        operation_description="Average rating, rating count and 1-5 star histogram of a class (`fitness_class`) or of an instructor (`instructor`), read from the stored aggregates.",
+        manual_parameters=[
+            openapi.Parameter('fitness_class', openapi.IN_QUERY, description="Fitness class id", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('instructor', openapi.IN_QUERY, description="Instructor id", type=openapi.TYPE_STRING),
+        ],
+        responses={200: RatingSummarySerializer, 400: "Bad Request", 404: "Not Found"}
+    )
+    @action(detail=False, methods=['get'])
+    def ratings(self, request):
+        class_id = request.query_params.get('fitness_class')
+        instructor_id = request.query_params.get('instructor')
+        if bool(class_id) == bool(instructor_id):
+            return Response({'error': "Pass exactly one of fitness_class or instructor."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            if class_id:
+                summary = FitnessClass.objects.only(*RATING_FIELDS).get(pk=class_id)
+                return Response({'fitness_class': summary.pk, **RatingSummarySerializer(summary).data})
+            summary = InstructorRating.objects.filter(pk=instructor_id).first()
+            if summary is None:
+                if not CustomUser.objects.filter(pk=instructor_id).exists():
+                    return Response({'error': "Instructor not found."}, status=status.HTTP_404_NOT_FOUND)
+                # nobody rated this instructor's classes yet
+                summary = InstructorRating(instructor_id=instructor_id)
+            return Response({'instructor': instructor_id, **RatingSummarySerializer(summary).data})
+        except FitnessClass.DoesNotExist:
+            return Response({'error': "Fitness class not found."}, status=status.HTTP_404_NOT_FOUND)
+        except (ValueError, DjangoValidationError):
+            return Response({'error': "Invalid id."}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from memberships import services
+
+
+class Command(BaseCommand):
+    help = "Mark memberships whose end date has passed as inactive."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=services.EXPIRY_CHUNK_SIZE,
+            help="Memberships updated per statement (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        expired = services.expire_memberships(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Expired {expired} memberships."))
@@ -0,0 +1,26 @@
+from django.db import models
+from django.utils import timezone
+
+
+class MembershipQuerySet(models.QuerySet):
+    def active(self, at=None):
+        """
+        Memberships in force at `at` (default: now); renewals stacked to start
+        later are not in force yet. Checks end_date as well,
+        so the answer is right even before the expiry sweep has caught up;
+        per user it is a range scan on the (user, is_active, end_date) index.
+        """
+        at = at or timezone.now()
+        return self.filter(is_active=True, start_date__lte=at, end_date__gt=at)
+
+    def inactive(self, at=None):
+        at = at or timezone.now()
+        return self.exclude(is_active=True, start_date__lte=at, end_date__gt=at)
+
+    def expired(self, at=None):
+        """Memberships still flagged active whose end_date has passed."""
+        return self.filter(is_active=True, end_date__lte=at or timezone.now())
+
+
+class MembershipManager(models.Manager.from_queryset(MembershipQuerySet)):
+    pass
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 11:24
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+def _text(expression):
+    return Coalesce(expression, Value(''), output_field=TextField())
+
+
+# GIN index and backfill only exist on PostgreSQL; other backends use the
+# core.SearchTerm inverted index (rebuild it with `manage.py rebuild_search_index`).
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS plan_search_vector_gin ON memberships_membershipplan USING gin (search_vector)')
+    MembershipPlan = apps.get_model('memberships', 'MembershipPlan')
+    # a frozen copy of core.search.search_vector_expression as of this migration
+    MembershipPlan.objects.update(search_vector=(
+        SearchVector(_text(F('name')), weight='A')
+        + SearchVector(_text(F('description')), weight='B')
+    ))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS plan_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('memberships', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membershipplan',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
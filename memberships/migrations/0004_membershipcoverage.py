@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 11:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_coverage(apps, schema_editor):
+    Membership = apps.get_model('memberships', 'Membership')
+    MembershipCoverage = apps.get_model('memberships', 'MembershipCoverage')
+    rows = (
+        Membership.objects.filter(is_active=True)
+        .order_by().values('user_id').annotate(until=Max('end_date'))
+        .values_list('user_id', 'until')
+    )
+    MembershipCoverage.objects.bulk_create(
+        (MembershipCoverage(user_id=user_id, covered_until=until) for user_id, until in rows.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('memberships', '0003_membership_active_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipCoverage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='membership_coverage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('covered_until', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='membership',
+            name='start_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_coverage, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.utils import timezone
+from django.contrib.postgres.search import SearchVectorField
 from accounts.models import CustomUser
+from memberships.managers import MembershipManager
 
 # Create your models here.
 
@@ -10,6 +13,8 @@ class MembershipPlan(models.Model):
     duration_in_days = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # maintained by core.search; GIN-indexed on PostgreSQL (see migration 0002)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -18,9 +23,32 @@ class MembershipPlan(models.Model):
 class Membership(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE , related_name='memberships')
     plan = models.ForeignKey(MembershipPlan, on_delete=models.CASCADE , related_name='memberships')
-    start_date = models.DateTimeField(auto_now_add=True)
+    start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=False)
 
+    objects = MembershipManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_active', 'end_date'], name='membership_user_active_idx'),
+            # what the expiry sweep scans: memberships still flagged active, by end_date
+            models.Index(fields=['end_date'], condition=models.Q(is_active=True), name='membership_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.plan.name}"
+
+
+class MembershipCoverage(models.Model):
+    """
+    How far a member is covered: the latest end_date of their active
+    memberships, kept up to date by memberships.services.refresh_coverage.
+    Renewals lock the member's user row, so one member's renewals run one at a time.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='membership_coverage')
+    covered_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.user.username} - {self.plan.name}"
\ No newline at end of file
+        return f"{self.user.username} - {self.covered_until}"
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from memberships.models import MembershipPlan, Membership
 from accounts.models import CustomUser
+from memberships.services import renew_membership
 
 class MembershipPlanSerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,4 +17,21 @@ class MembershipSerializer(serializers.ModelSerializer):
     class Meta:
         model = Membership
         fields = ['id', 'user', 'plan', 'plan_detail' , 'start_date', 'end_date', 'is_active']
-        # read_only_fields = ['start_date', 'end_date']
\ No newline at end of file
+        # the entitlement window follows from the plan and the member's coverage
+        read_only_fields = ['start_date', 'end_date']
+
+    def create(self, validated_data):
+        membership = renew_membership(validated_data['user'], validated_data['plan'])
+        if not validated_data.get('is_active', True):
+            membership.is_active = False
+            membership.save()
+        return membership
+
+
+class MembershipRenewSerializer(serializers.Serializer):
+    payment_method = serializers.CharField(max_length=50)
+
+
+class MembershipCoverageSerializer(serializers.Serializer):
+    user = serializers.UUIDField()
+    covered_until = serializers.DateTimeField(allow_null=True)
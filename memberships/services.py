@@ -0,0 +1,160 @@
+import math
+from collections import namedtuple
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from accounts.models import CustomUser
+from memberships.models import Membership, MembershipCoverage
+
+EXPIRY_CHUNK_SIZE = 1000
+# Upper bound on how long an entitlement is cached. Saves of Membership and
+# Payment invalidate it (memberships.signals); with a per-process cache such
+# as the default LocMemCache, other processes see such a change after at most
+# this long, so use a shared cache backend when running several workers.
+ENTITLEMENT_CACHE_TTL = 60
+
+Entitlement = namedtuple('Entitlement', ['plan_id', 'expires_at'])
+
+
+def expire_memberships(now=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    """
+    Flip is_active off for memberships whose end_date has passed, `chunk_size`
+    rows per UPDATE so no statement locks a large part of the table.
+    Returns the number of memberships expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        pks = list(Membership.objects.expired(now).order_by('end_date').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return expired
+        expired += Membership.objects.filter(pk__in=pks, is_active=True).update(is_active=False)
+
+
+def _entitlement_key(user_id):
+    return f'membership:entitlement:{user_id}'
+
+
+def get_entitlement(user_id, now=None):
+    """
+    The membership `user_id` is entitled through at `now`, as an Entitlement
+    (plan_id, expires_at), or None. Served from the cache when possible: a hit
+    costs no query, and a cached entitlement is never trusted past its
+    expires_at, so expiry takes effect to the second without a sweep.
+    """
+    now = now or timezone.now()
+    key = _entitlement_key(user_id)
+    cached = cache.get(key)
+    if cached is not None:
+        if not cached:
+            return None
+        entitlement = Entitlement(*cached)
+        if entitlement.expires_at > now:
+            return entitlement
+
+    # the membership running longest, so one lookup covers overlapping renewals
+    row = (
+        Membership.objects.active(now).filter(user_id=user_id)
+        .order_by('-end_date').values_list('plan_id', 'end_date').first()
+    )
+    if row is None:
+        cache.set(key, (), ENTITLEMENT_CACHE_TTL)
+        return None
+    entitlement = Entitlement(*row)
+    ttl = min(ENTITLEMENT_CACHE_TTL, math.ceil((entitlement.expires_at - now).total_seconds()))
+    cache.set(key, tuple(entitlement), ttl)
+    return entitlement
+
+
+def has_active_membership(user_id, now=None):
+    return get_entitlement(user_id, now=now) is not None
+
+
+def invalidate_entitlements(user_ids):
+    cache.delete_many([_entitlement_key(user_id) for user_id in set(user_ids)])
+
+
+def refresh_coverage(user_ids):
+    """
+    Recompute MembershipCoverage.covered_until for `user_ids`: one grouped
+    Max(end_date) over the (user, is_active, end_date) index and one upsert.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    until = dict(
+        Membership.objects.filter(user_id__in=user_ids, is_active=True)
+        .order_by().values('user_id').annotate(until=Max('end_date'))
+        .values_list('user_id', 'until')
+    )
+    MembershipCoverage.objects.bulk_create(
+        [MembershipCoverage(user_id=user_id, covered_until=until.get(user_id)) for user_id in user_ids],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['covered_until', 'updated_at'],
+    )
+
+
+def covered_until(user_id):
+    """The end of `user_id`'s coverage (None if never covered): a primary-key lookup."""
+    return MembershipCoverage.objects.filter(user_id=user_id).values_list('covered_until', flat=True).first()
+
+
+def _coverage_ends(user_ids):
+    """
+    covered_until of each member: their MembershipCoverage row, or, for
+    members without one yet, the latest end_date of their active memberships.
+    """
+    ends = dict(MembershipCoverage.objects.filter(user_id__in=user_ids).values_list('user_id', 'covered_until'))
+    untracked = set(user_ids) - set(ends)
+    if untracked:
+        ends.update(
+            Membership.objects.filter(user_id__in=untracked, is_active=True)
+            .order_by().values('user_id').annotate(until=Max('end_date'))
+            .values_list('user_id', 'until')
+        )
+    return ends
+
+
+def stack_memberships(purchases, now=None):
+    """
+    Unsaved memberships for `purchases`, a list of (user_id, plan) pairs,
+    each starting where its member's coverage ends (or now, if it already
+    has) and after any earlier purchase of theirs in the list, so renewals
+    stack instead of overlapping. The members' rows are locked first, so
+    call it inside a transaction: concurrent renewals of a member queue up
+    behind each other and each extends from the previous one's end, leaving
+    neither gaps nor double extensions.
+    """
+    now = now or timezone.now()
+    user_ids = sorted({user_id for user_id, _ in purchases}, key=str)
+    list(CustomUser.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    ends = _coverage_ends(user_ids)
+    memberships = []
+    for user_id, plan in purchases:
+        start_date = max(now, ends.get(user_id) or now)
+        membership = Membership(
+            user_id=user_id,
+            plan=plan,
+            start_date=start_date,
+            end_date=start_date + timedelta(days=plan.duration_in_days),
+            is_active=True,
+        )
+        ends[user_id] = membership.end_date
+        memberships.append(membership)
+    return memberships
+
+
+@transaction.atomic(savepoint=False)
+def renew_membership(user, plan, now=None):
+    """
+    Add a membership of `plan` for `user` that starts where their coverage
+    ends (see stack_memberships). Saving it moves covered_until to its
+    end_date (memberships.signals), the only write to the coverage row.
+    """
+    membership, = stack_memberships([(user.pk, plan)], now=now)
+    membership.user = user
+    membership.save()
+    return membership
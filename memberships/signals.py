@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from memberships.services import invalidate_entitlements, refresh_coverage
+
+
+@receiver(post_save, sender='memberships.Membership')
+@receiver(post_delete, sender='memberships.Membership')
+@receiver(post_save, sender='payments.Payment')
+@receiver(post_delete, sender='payments.Payment')
+def invalidate_entitlement(sender, instance, **kwargs):
+    invalidate_entitlements([instance.user_id])
+
+
+@receiver(post_save, sender='memberships.Membership')
+@receiver(post_delete, sender='memberships.Membership')
+def update_coverage(sender, instance, origin=None, **kwargs):
+    # when the member is being deleted their coverage row goes with them
+    if getattr(origin, 'model', type(origin)) is get_user_model():
+        return
+    refresh_coverage([instance.user_id])
@@ -1,3 +1,200 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from classes.models import FitnessClass
+from core.permissions import HasActiveMembership
+from core.testing import make_user, make_plan
+from memberships import services
+from memberships.models import MembershipPlan, Membership, MembershipCoverage
+from payments.models import Payment, WebhookEvent
+from payments.services import process_webhook_events
 
 # Create your tests here.
+
+class RenewalStackingTests(TestCase):
+    def setUp(self):
+        self.member = make_user('member@example.com')
+        self.plan = make_plan()
+        self.now = timezone.now()
+        self.current = Membership.objects.create(
+            user=self.member, plan=self.plan, start_date=self.now - timedelta(days=10),
+            end_date=self.now + timedelta(days=20), is_active=True,
+        )
+
+    def test_renewal_starts_where_coverage_ends(self):
+        renewal = services.renew_membership(self.member, self.plan, now=self.now)
+        self.assertEqual(renewal.start_date, self.current.end_date)
+        self.assertEqual(services.covered_until(self.member.pk), renewal.end_date)
+
+    def test_renewal_writes_the_coverage_row_once(self):
+        # with and without a coverage row (members from before coverage tracking)
+        for tracked in (True, False):
+            if not tracked:
+                MembershipCoverage.objects.filter(user=self.member).delete()
+            with CaptureQueriesContext(connection) as queries:
+                renewal = services.renew_membership(self.member, self.plan, now=self.now)
+            coverage_writes = [q['sql'] for q in queries if 'membershipcoverage' in q['sql'] and not q['sql'].startswith('SELECT')]
+            self.assertEqual(len(coverage_writes), 1)
+            self.assertEqual(services.covered_until(self.member.pk), renewal.end_date)
+
+    def test_payment_recorded_outside_the_api_stacks(self):
+        payment = Payment.objects.create(
+            user=self.member, membership_plan=self.plan, amount='30.00', payment_method='Cash', is_successful=True,
+        )
+        payment.refresh_from_db()
+        self.assertEqual(payment.membership.start_date, self.current.end_date)
+
+    def test_webhook_confirmed_payments_stack(self):
+        payments = [
+            Payment.objects.create(user=self.member, membership_plan=self.plan, amount='30.00', payment_method='Card')
+            for _ in range(2)
+        ]
+        WebhookEvent.objects.bulk_create(
+            WebhookEvent(
+                event_id=f'evt-{i}', event_type='payment.succeeded', transaction_id=payment.transaction_id,
+                occurred_at=self.now, payload={},
+            )
+            for i, payment in enumerate(payments)
+        )
+        process_webhook_events()
+        first, second = (Membership.objects.get(payments=payment) for payment in payments)
+        self.assertEqual(first.start_date, self.current.end_date)
+        self.assertEqual(second.start_date, first.end_date)
+        self.assertEqual(services.covered_until(self.member.pk), second.end_date)
+
+
+class EntitlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.member = make_user('member@example.com')
+        self.plan = make_plan()
+        self.now = timezone.now()
+        self.membership = Membership.objects.create(
+            user=self.member, plan=self.plan, start_date=self.now - timedelta(days=1),
+            end_date=self.now + timedelta(days=29), is_active=True,
+        )
+        self.end = self.membership.end_date
+
+    def test_expiry_boundary(self):
+        second = timedelta(seconds=1)
+        entitlement = services.get_entitlement(self.member.pk, now=self.end - second)
+        self.assertEqual(entitlement, services.Entitlement(self.plan.pk, self.end))
+        # the entitlement cached just before is not trusted at or after end_date
+        self.assertIsNone(services.get_entitlement(self.member.pk, now=self.end))
+        self.assertIsNone(services.get_entitlement(self.member.pk, now=self.end + second))
+
+    def test_boundary_without_cache(self):
+        for now, entitled in [(self.end - timedelta(microseconds=1), True), (self.end, False)]:
+            cache.clear()
+            self.assertEqual(services.has_active_membership(self.member.pk, now=now), entitled)
+
+    def test_stacked_renewal_takes_over_at_the_boundary(self):
+        renewal = services.renew_membership(self.member, self.plan, now=self.now)
+        self.assertEqual(services.get_entitlement(self.member.pk, now=self.end - timedelta(seconds=1)).expires_at, self.end)
+        self.assertEqual(services.get_entitlement(self.member.pk, now=self.end).expires_at, renewal.end_date)
+
+    def test_cache_hit_costs_no_query(self):
+        services.get_entitlement(self.member.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(services.has_active_membership(self.member.pk))
+        # nor does a cached "no membership"
+        other = make_user('other@example.com')
+        services.get_entitlement(other.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(services.has_active_membership(other.pk))
+
+    def test_gated_create_costs_no_query_on_a_cache_hit(self):
+        request = SimpleNamespace(user=self.member)
+        view = SimpleNamespace(action='create')
+        permission = HasActiveMembership()
+        self.assertTrue(permission.has_permission(request, view))
+        with self.assertNumQueries(0):
+            self.assertTrue(permission.has_permission(request, view))
+
+    def test_membership_save_invalidates(self):
+        self.assertTrue(services.has_active_membership(self.member.pk))
+        self.membership.is_active = False
+        self.membership.save()
+        self.assertFalse(services.has_active_membership(self.member.pk))
+        self.membership.is_active = True
+        self.membership.save()
+        self.assertTrue(services.has_active_membership(self.member.pk))
+
+    def test_membership_delete_invalidates(self):
+        self.assertTrue(services.has_active_membership(self.member.pk))
+        self.membership.delete()
+        self.assertFalse(services.has_active_membership(self.member.pk))
+
+    def test_payment_save_invalidates(self):
+        other = make_user('other@example.com')
+        self.assertFalse(services.has_active_membership(other.pk))
+        # a membership written without signals, then picked up by the payment's save
+        Membership.objects.bulk_create([Membership(
+            user=other, plan=self.plan, start_date=self.now, end_date=self.end, is_active=True,
+        )])
+        self.assertFalse(services.has_active_membership(other.pk))
+        Payment.objects.create(user=other, membership_plan=self.plan, amount='30.00', payment_method='Card')
+        self.assertTrue(services.has_active_membership(other.pk))
+
+    def test_booking_is_gated_on_the_entitlement(self):
+        fitness_class = FitnessClass.objects.create(
+            name='Spin', description='Spin', duration=45, max_capacity=10,
+            instructor=make_user('coach@example.com', 'STAFF'), schedule=self.now + timedelta(days=1),
+        )
+        client = APIClient()
+        client.force_authenticate(make_user('lapsed@example.com'))
+        self.assertEqual(client.post('/class_bookings/', {'fitness_class': fitness_class.pk}).status_code, 403)
+        client.force_authenticate(self.member)
+        self.assertEqual(client.post('/class_bookings/', {'fitness_class': fitness_class.pk}).status_code, 201)
+
+
+class MembershipApiTests(TestCase):
+    def setUp(self):
+        # DjangoModelPermissions guards the membership CRUD routes
+        self.admin = make_user('admin@example.com', 'ADMIN')
+        self.admin.is_superuser = True
+        self.admin.save()
+        self.member = make_user('member@example.com')
+        self.monthly, self.yearly = make_plan(30), make_plan(365)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def renew(self, membership, key):
+        return self.client.post(
+            f'/memberships/{membership.pk}/renew/', {'payment_method': 'Card'}, format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_renewal_key_replays_only_the_same_plan(self):
+        monthly = services.renew_membership(self.member, self.monthly)
+        yearly = services.renew_membership(self.member, self.yearly)
+        first = self.renew(monthly, 'renewal-1')
+        self.assertEqual(first.status_code, 201)
+        replay = self.renew(monthly, 'renewal-1')
+        self.assertEqual((replay.status_code, replay['Idempotent-Replayed'], replay.data), (201, 'true', first.data))
+        self.assertEqual(self.renew(yearly, 'renewal-1').status_code, 409)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_clients_cannot_set_the_entitlement_window(self):
+        backdated = timezone.now() - timedelta(days=400)
+        response = self.client.post('/memberships/', {
+            'user': str(self.member.pk), 'plan': self.monthly.pk, 'is_active': True,
+            'start_date': backdated.isoformat(), 'end_date': (backdated + timedelta(days=800)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        membership = Membership.objects.get(pk=response.data['id'])
+        self.assertGreater(membership.start_date, backdated)
+        self.assertEqual(membership.end_date - membership.start_date, timedelta(days=30))
+        self.assertEqual(services.covered_until(self.member.pk), membership.end_date)
+
+        end_date = membership.end_date
+        response = self.client.patch(
+            f'/memberships/{membership.pk}/', {'end_date': (end_date + timedelta(days=365)).isoformat()}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        membership.refresh_from_db()
+        self.assertEqual(membership.end_date, end_date)
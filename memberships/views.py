@@ -2,19 +2,26 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions
 from rest_framework.exceptions import ValidationError
 from memberships.models import MembershipPlan, Membership
-from memberships.serializers import MembershipPlanSerializer, MembershipSerializer
+from memberships.serializers import MembershipPlanSerializer, MembershipSerializer, MembershipRenewSerializer, MembershipCoverageSerializer
+from memberships.services import covered_until
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.pagination import PageNumberPagination
 from django_filters import rest_framework as filters
-from core.filters import MembershipPlanFilter
+from core.filters import MembershipPlanFilter, MembershipFilter
 from core.permissions import IsAdminOrStaffOrReadOnly , IsMemberOrAdminStaff
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
 from core.permissions import IsAdminOrStaff
+from core.exports import EXPORT_PARAMETER, export_response, MEMBERSHIP_REPORT_COLUMNS
+from core.search import FullTextSearchFilter
+from django.db import IntegrityError
+from payments.serializers import PaymentSerializer
+from django.core.exceptions import ValidationError as DjangoValidationError
+from payments.services import IDEMPOTENCY_KEY_HEADER, MAX_IDEMPOTENCY_KEY_LENGTH, create_payment, find_idempotent_payment
 
 # Create your views here.
 
@@ -30,7 +37,7 @@ class MembershipPlanViewSet(viewsets.ModelViewSet):
     queryset = MembershipPlan.objects.all()
     serializer_class = MembershipPlanSerializer
     permission_classes = [IsAdminOrStaffOrReadOnly ]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_fields = ['price', 'duration_in_days']
     search_fields = ['name', 'description']
     ordering_fields = ['price', 'duration_in_days']
@@ -132,6 +139,7 @@ class MembershipViewSet(viewsets.ModelViewSet):
     search_fields = ['user__email', 'plan__name']
     ordering_fields = ['start_date', 'end_date']
     pagination_class = MembershipPagination
+    filterset_class = MembershipFilter
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -194,12 +202,85 @@ class MembershipViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'You do not have permission to delete memberships.'}, status=status.HTTP_403_FORBIDDEN)
         return super().destroy(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        operation_description=(
+            "Renew a membership: records a payment for its plan and adds a membership that starts where the "
+            "member's coverage ends. Renewals of one member are serialized, so concurrent requests extend "
+            "coverage one after another. Send an `Idempotency-Key` header to make retries safe."
+        ),
+        request_body=MembershipRenewSerializer,
+        manual_parameters=[
+            openapi.Parameter(IDEMPOTENCY_KEY_HEADER, openapi.IN_HEADER, description="Unique key per renewal attempt", type=openapi.TYPE_STRING),
+        ],
+        responses={201: PaymentSerializer, 400: "Bad Request", 404: "Not Found", 409: "Idempotency-Key already used for another plan"}
+    )
+    @action(detail=True, methods=['post'], permission_classes=[IsMemberOrAdminStaff])
+    def renew(self, request, pk=None):
+        membership = self.get_object()
+        serializer = MembershipRenewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER, '').strip() or None
+        if idempotency_key and len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return Response({'error': f"{IDEMPOTENCY_KEY_HEADER} must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters"}, status=400)
+
+        previous = find_idempotent_payment(membership.user, idempotency_key)
+        if previous is not None:
+            return self._replay(previous, membership.plan_id)
+        try:
+            payment = create_payment(
+                membership.user, membership.plan, serializer.validated_data['payment_method'],
+                idempotency_key=idempotency_key,
+            )
+        except IntegrityError:
+            # a concurrent retry with the same key got there first
+            previous = find_idempotent_payment(membership.user, idempotency_key)
+            if previous is None:
+                raise
+            return self._replay(previous, membership.plan_id)
+        return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
+
+    def _replay(self, payment, plan_id):
+        # same rule as PaymentViewSet: a key only replays the renewal it was first used for
+        if payment.membership_plan_id != plan_id:
+            return Response(
+                {"error": f"{IDEMPOTENCY_KEY_HEADER} was already used for a different payment"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        response = Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    @swagger_auto_schema(
+        operation_description="How far a member is covered by their memberships. Members see their own; admin and staff can pass `user`.",
+        manual_parameters=[
+            openapi.Parameter('user', openapi.IN_QUERY, description="User id (Admin and Staff only)", type=openapi.TYPE_STRING),
+        ],
+        responses={200: MembershipCoverageSerializer}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def coverage(self, request):
+        user_id = request.user.pk
+        if request.query_params.get('user') and (request.user.is_superuser or request.user.role in ['ADMIN', 'STAFF']):
+            user_id = request.query_params['user']
+        try:
+            data = {'user': user_id, 'covered_until': covered_until(user_id)}
+        except DjangoValidationError as e:
+            return Response({'error': e.messages}, status=400)
+        return Response(MembershipCoverageSerializer(data).data)
+
+    @swagger_auto_schema(
+        operation_description="Membership report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def membership_report(self, request):
         try:
             if request.user.role in ['ADMIN' , 'STAFF'] or request.user.is_superuser:
                 # Generate membership report
                 membership_data = Membership.objects.select_related('user', 'plan').all()
+                response = export_response(request, membership_data, MEMBERSHIP_REPORT_COLUMNS, 'memberships')
+                if response is not None:
+                    return response
                 serializer = MembershipSerializer(membership_data, many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
@@ -1,6 +1,19 @@
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, SettlementImport, WebhookEvent
 
 # Register your models here.
 
-admin.site.register(Payment)
\ No newline at end of file
+admin.site.register(Payment)
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'transaction_id', 'occurred_at', 'received_at', 'processed_at', 'error']
+    list_filter = ['event_type']
+    search_fields = ['event_id', 'transaction_id']
+
+
+@admin.register(SettlementImport)
+class SettlementImportAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'imported_at', 'imported_by', 'lines', 'matched', 'updated', 'unknown', 'invalid']
+    readonly_fields = [field.name for field in SettlementImport._meta.fields]
@@ -0,0 +1,77 @@
+"""
+Payment gateway webhook format: signing, parsing, and a stub event source
+for replaying traffic against a local server.
+
+Events are JSON objects:
+    {"id": "evt_...", "type": "payment.succeeded", "created": <unix seconds>,
+     "data": {"transaction_id": "..."}}
+signed with HMAC-SHA256 over the raw body, sent as `X-Gateway-Signature: sha256=<hex>`.
+"""
+import hashlib
+import hmac
+import json
+import random
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+
+SIGNATURE_HEADER = 'X-Gateway-Signature'
+# event type -> Payment.is_successful it leads to
+EVENT_OUTCOMES = {
+    'payment.succeeded': True,
+    'payment.failed': False,
+    'payment.refunded': False,
+}
+
+
+def sign(body, secret=None):
+    secret = settings.PAYMENT_WEBHOOK_SECRET if secret is None else secret
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body, signature):
+    # fail closed while no secret is configured
+    if not settings.PAYMENT_WEBHOOK_SECRET or not signature:
+        return False
+    return hmac.compare_digest(sign(body), signature)
+
+
+def parse_event(body):
+    """Return (event_id, event_type, transaction_id, occurred_at, payload); ValueError if malformed."""
+    try:
+        payload = json.loads(body)
+        event_id = str(payload['id'])
+        event_type = str(payload['type'])
+        transaction_id = str(payload['data']['transaction_id'])
+        occurred_at = datetime.fromtimestamp(float(payload['created']), tz=dt_timezone.utc)
+    except (ValueError, TypeError, KeyError, OverflowError):
+        raise ValueError("Malformed webhook event.")
+    if event_type not in EVENT_OUTCOMES:
+        raise ValueError(f"Unsupported event type '{event_type}'.")
+    if not event_id or len(event_id) > 255 or len(transaction_id) > 64:
+        raise ValueError("Malformed webhook event.")
+    return event_id, event_type, transaction_id, occurred_at, payload
+
+
+def stub_events(transaction_ids, count, duplicate_rate=0.1, seed=None):
+    """
+    Build `count` event bodies the way a gateway delivers them: a share of
+    them are retries of an earlier event (same id), and delivery order is
+    shuffled so newer events can arrive before older ones.
+    """
+    rng = random.Random(seed)
+    transaction_ids = list(transaction_ids)
+    start = datetime.now(dt_timezone.utc).timestamp() - count
+    events = []
+    for n in range(count):
+        if events and rng.random() < duplicate_rate:
+            events.append(rng.choice(events))
+            continue
+        events.append({
+            'id': f'evt_{uuid.UUID(int=rng.getrandbits(128)).hex}',
+            'type': rng.choice(list(EVENT_OUTCOMES)),
+            'created': start + n,
+            'data': {'transaction_id': rng.choice(transaction_ids)},
+        })
+    rng.shuffle(events)
+    return [json.dumps(event).encode() for event in events]
@@ -0,0 +1,95 @@
+import random
+import tracemalloc
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import CustomUser
+from core.benchmarks import measure, rolled_back
+from memberships.models import MembershipPlan, Membership
+from payments import services
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = (
+        "Load synthetic payments and reconcile a generated settlement file against them twice "
+        "(the second run replays the same file), reporting queries, time and peak Python heap. "
+        "Runs in a rolled back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=100_000, help="Payments loaded and settled (default: %(default)s).")
+        parser.add_argument('--members', type=int, default=1000, help="Members paying them (default: %(default)s).")
+        parser.add_argument('--unknown', type=int, default=500, help="Lines for transactions we never saw (default: %(default)s).")
+        parser.add_argument('--batch-size', type=int, default=services.SETTLEMENT_BATCH_SIZE, help="Lines matched per lookup (default: %(default)s).")
+        parser.add_argument('--seed', type=int, default=15, help="Random seed (default: %(default)s).")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with rolled_back():
+            plan = MembershipPlan.objects.create(name='Benchmark', description='benchmark', price='30.00', duration_in_days=30)
+            members = CustomUser.objects.bulk_create(
+                CustomUser(email=f'benchmark-member-{i}@example.invalid') for i in range(options['members'])
+            )
+            now = timezone.now()
+            # most payments succeeded and bought a membership; a few failed
+            succeeded = [rng.random() > 0.01 for _ in range(options['payments'])]
+            memberships = Membership.objects.bulk_create(
+                (
+                    Membership(
+                        user=members[i % len(members)], plan=plan, start_date=now,
+                        end_date=now + timedelta(days=30), is_active=True,
+                    )
+                    for i, successful in enumerate(succeeded) if successful
+                ),
+                batch_size=5000,
+            )
+            bought = iter(memberships)
+            payments = Payment.objects.bulk_create(
+                (
+                    Payment(
+                        user=members[i % len(members)], membership_plan=plan, amount=plan.price, payment_method='Card',
+                        transaction_id=str(uuid.UUID(int=rng.getrandbits(128))), is_successful=successful,
+                        membership=next(bought) if successful else None,
+                    )
+                    for i, successful in enumerate(succeeded)
+                ),
+                batch_size=5000,
+            )
+
+            # what the acquirer reports: mostly agreeing, with refunds,
+            # chargebacks, late settlements and corrected amounts mixed in
+            rows = []
+            for payment in payments:
+                status, amount = ('settled' if payment.is_successful else 'failed'), Decimal(plan.price)
+                roll = rng.random()
+                if roll < 0.01:
+                    status = 'refunded' if payment.is_successful else 'settled'
+                elif roll < 0.015:
+                    status = 'chargeback' if payment.is_successful else 'settled'
+                elif roll < 0.025:
+                    amount -= Decimal('5.00')
+                rows.append(f'{payment.transaction_id},{amount},{status}\n')
+            rows += [f'{uuid.UUID(int=rng.getrandbits(128))},30.00,settled\n' for _ in range(options['unknown'])]
+            rows += ['not-a-payment,thirty,settled\n', 'x,1.001,settled\n', 'y,1.00,lost\n']
+            rng.shuffle(rows)
+            lines = ['transaction_id,amount,status\n', *rows]
+
+            def reconcile(run):
+                return services.reconcile_settlement(iter(lines), f'benchmark-{run}.csv', batch_size=options['batch_size'])
+
+            for run in ('first run', 'replay'):
+                # heap traced in a rolled back pass of its own, as tracing slows the timed one
+                with rolled_back():
+                    tracemalloc.start()
+                    reconcile(run)
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                summary, queries, seconds = measure(reconcile, run)
+                self.stdout.write(
+                    f"{run}: {summary.lines} lines in {seconds:.2f}s, {queries} queries, peak heap {peak / 2**20:.1f} MB; "
+                    f"{summary.matched} matched, {summary.updated} corrected ({summary.status_mismatches} status, "
+                    f"{summary.amount_mismatches} amount), {summary.unknown} unknown, {summary.invalid} invalid"
+                )
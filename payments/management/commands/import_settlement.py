@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from payments import services
+
+
+class Command(BaseCommand):
+    help = "Reconcile an acquirer settlement CSV (transaction_id, amount, status) against payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Settlement CSV file.")
+        parser.add_argument(
+            '--batch-size', type=int, default=services.SETTLEMENT_BATCH_SIZE,
+            help="Lines matched per lookup (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                summary = services.reconcile_settlement(lines, options['path'], batch_size=options['batch_size'])
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {summary.lines} lines: {summary.matched} matched, {summary.updated} payments corrected "
+            f"({summary.status_mismatches} status, {summary.amount_mismatches} amount mismatches)."
+        ))
+        if summary.unknown or summary.invalid:
+            self.stdout.write(self.style.WARNING(
+                f"{summary.unknown} unknown transactions, {summary.invalid} invalid lines."
+            ))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from payments import services
+
+
+class Command(BaseCommand):
+    help = "Apply queued payment gateway webhooks to payments and memberships."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=services.WEBHOOK_BATCH_SIZE,
+            help="Events applied per transaction (default: %(default)s).",
+        )
+        parser.add_argument(
+            '--poll', type=float, default=0,
+            help="Keep running, checking the inbox every POLL seconds once it is drained.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed, updated = services.process_webhook_events(batch_size=options['batch_size'])
+            if processed or not options['poll']:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} events, updated {updated} payments."))
+            if not options['poll']:
+                break
+            time.sleep(options['poll'])
@@ -0,0 +1,47 @@
+import time
+import urllib.error
+import urllib.request
+from django.core.management.base import BaseCommand, CommandError
+from payments import gateway
+from payments.models import Payment
+
+
+class Command(BaseCommand):
+    help = (
+        "Stub payment gateway: POST signed webhook events for existing payments to a running server, "
+        "including redeliveries and out-of-order events, and report throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/payments/webhook/', help="Webhook endpoint (default: %(default)s).")
+        parser.add_argument('--count', type=int, default=5000, help="Events to send (default: %(default)s).")
+        parser.add_argument('--duplicate-rate', type=float, default=0.1, help="Share of redelivered events (default: %(default)s).")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed, for repeatable runs.")
+
+    def handle(self, *args, **options):
+        transaction_ids = list(Payment.objects.values_list('transaction_id', flat=True))
+        if not transaction_ids:
+            raise CommandError("There are no payments to send events for.")
+
+        bodies = gateway.stub_events(transaction_ids, options['count'], options['duplicate_rate'], options['seed'])
+        results = {}
+        started = time.perf_counter()
+        for body in bodies:
+            request = urllib.request.Request(options['url'], data=body, method='POST', headers={
+                'Content-Type': 'application/json',
+                gateway.SIGNATURE_HEADER: gateway.sign(body),
+            })
+            try:
+                with urllib.request.urlopen(request) as response:
+                    code = response.status
+            except urllib.error.HTTPError as e:
+                code = e.code
+            except urllib.error.URLError as e:
+                raise CommandError(f"Could not reach {options['url']}: {e.reason}")
+            results[code] = results.get(code, 0) + 1
+        elapsed = time.perf_counter() - started
+
+        summary = ', '.join(f"{count} x {code}" for code, count in sorted(results.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {len(bodies)} events in {elapsed:.1f}s ({len(bodies) / elapsed:.0f}/s): {summary}."
+        ))
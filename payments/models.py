@@ -14,6 +14,22 @@ class Payment(models.Model):
     payment_method = models.CharField(max_length=50)  # e.g., 'Credit Card', 'PayPal'
     transaction_id = models.CharField(max_length=64, unique=True)
     is_successful = models.BooleanField(default=False)
+    # client-supplied Idempotency-Key of the request that created the payment
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    # occurred_at of the newest gateway webhook applied to this payment
+    gateway_event_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='unique_payment_idempotency_key',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.transaction_id:
@@ -21,4 +37,46 @@ class Payment(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.user.username} - {self.amount} - {self.payment_date}"
\ No newline at end of file
+        return f"{self.user.username} - {self.amount} - {self.payment_date}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Payment-gateway webhook inbox. Events are stored as received by the
+    webhook endpoint and applied later by `manage.py process_payment_webhooks`.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=64)
+    transaction_id = models.CharField(max_length=64)
+    occurred_at = models.DateTimeField()
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='webhook_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id}"
+
+
+class SettlementImport(models.Model):
+    """Summary of one acquirer settlement file reconciled against Payment.transaction_id."""
+    file_name = models.CharField(max_length=255)
+    imported_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='settlement_imports')
+    imported_at = models.DateTimeField(auto_now_add=True)
+    lines = models.PositiveIntegerField(default=0)
+    matched = models.PositiveIntegerField(default=0)
+    status_mismatches = models.PositiveIntegerField(default=0)
+    amount_mismatches = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unknown = models.PositiveIntegerField(default=0)
+    invalid = models.PositiveIntegerField(default=0)
+    # a sample of the transaction ids that matched no payment
+    unknown_transactions = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"{self.file_name} - {self.imported_at}"
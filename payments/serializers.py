@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from payments.models import Payment
+from payments.models import Payment, SettlementImport
 from memberships.models import  MembershipPlan
 from memberships.serializers import MembershipPlanSerializer , MembershipSerializer
 
@@ -23,4 +23,14 @@ class PaymentSerializer(serializers.ModelSerializer):
         membership_plan = validated_data.get('membership_plan')
         if membership_plan:
             validated_data['amount'] = membership_plan.price
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class SettlementImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SettlementImport
+        fields = [
+            'id', 'file_name', 'imported_by', 'imported_at', 'lines', 'matched', 'status_mismatches',
+            'amount_mismatches', 'updated', 'unknown', 'invalid', 'unknown_transactions',
+        ]
+        read_only_fields = fields
@@ -0,0 +1,277 @@
+import csv
+from decimal import Decimal, InvalidOperation
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, DateField, F, Sum
+from django.db.models.functions import Round, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from memberships.models import Membership
+from memberships.services import invalidate_entitlements, refresh_coverage, renew_membership, stack_memberships
+from payments import gateway
+from payments.models import Payment, SettlementImport, WebhookEvent
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+WEBHOOK_BATCH_SIZE = 500
+SETTLEMENT_BATCH_SIZE = 5000
+SETTLEMENT_COLUMNS = ('transaction_id', 'amount', 'status')
+# settlement status -> Payment.is_successful
+SETTLEMENT_STATUSES = {
+    'settled': True,
+    'success': True,
+    'failed': False,
+    'declined': False,
+    'refunded': False,
+    'chargeback': False,
+}
+MAX_UNKNOWN_TRANSACTIONS = 100
+REVENUE_PERIODS = {
+    'day': TruncDate,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def find_idempotent_payment(user, key):
+    """The payment an earlier request with the same Idempotency-Key created, if any."""
+    if not key:
+        return None
+    return (
+        Payment.objects.select_related('membership__plan')
+        .filter(user=user, idempotency_key=key)
+        .first()
+    )
+
+
+@transaction.atomic
+def create_payment(user, plan, payment_method, idempotency_key=None):
+    """
+    Record a successful payment for `plan` and the membership it buys.
+    The membership is a renewal (memberships.services.renew_membership):
+    it starts where the member's coverage ends. It is inserted first so the
+    Payment row is written once, already linked and marked successful.
+    A repeated `idempotency_key` for the same user raises IntegrityError.
+    """
+    membership = renew_membership(user, plan)
+    return Payment.objects.create(
+        user=user,
+        membership=membership,
+        membership_plan=plan,
+        amount=plan.price,
+        payment_method=payment_method,
+        is_successful=True,
+        idempotency_key=idempotency_key or None,
+    )
+
+
+def ingest_webhook(body):
+    """
+    Append a gateway event to the inbox with a single INSERT and nothing else;
+    redeliveries of an event id are dropped by its unique constraint.
+    Returns False for such a duplicate. Raises ValueError for malformed bodies.
+    """
+    event_id, event_type, transaction_id, occurred_at, payload = gateway.parse_event(body)
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(
+                event_id=event_id,
+                event_type=event_type,
+                transaction_id=transaction_id,
+                occurred_at=occurred_at,
+                payload=payload,
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def process_webhook_events(batch_size=WEBHOOK_BATCH_SIZE):
+    """
+    Drain the webhook inbox in batches of `batch_size`, oldest first.
+    Per batch only the newest event of each payment matters, and it is only
+    applied if it is newer than what the payment has already seen, so
+    duplicates and out-of-order deliveries settle on the gateway's latest
+    state. Several workers can run at once on PostgreSQL (SKIP LOCKED).
+    Returns (events processed, payments updated).
+    """
+    processed = updated = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(processed_at__isnull=True)
+                .order_by('id')
+                .only('id', 'event_type', 'transaction_id', 'occurred_at')[:batch_size]
+            )
+            if not events:
+                break
+            updated += _apply_webhook_events(events)
+            processed += len(events)
+    return processed, updated
+
+
+def _apply_webhook_events(events):
+    latest = {}
+    for event in events:
+        current = latest.get(event.transaction_id)
+        if current is None or event.occurred_at > current.occurred_at:
+            latest[event.transaction_id] = event
+
+    payments = Payment.objects.select_related('membership', 'membership_plan').in_bulk(
+        list(latest), field_name='transaction_id'
+    )
+    changed_payments = []
+    for transaction_id, event in latest.items():
+        payment = payments.get(transaction_id)
+        if payment is None or (payment.gateway_event_at and event.occurred_at <= payment.gateway_event_at):
+            continue
+        payment.is_successful = gateway.EVENT_OUTCOMES[event.event_type]
+        payment.gateway_event_at = event.occurred_at
+        changed_payments.append(payment)
+
+    _sync_memberships(changed_payments)
+    Payment.objects.bulk_update(changed_payments, ['is_successful', 'gateway_event_at', 'membership'])
+
+    now = timezone.now()
+    unknown = [event.pk for event in events if event.transaction_id not in payments]
+    WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=now)
+    if unknown:
+        WebhookEvent.objects.filter(pk__in=unknown).update(error="Unknown transaction_id.")
+    return len(changed_payments)
+
+
+def _sync_memberships(payments):
+    """
+    Align the memberships of `payments`, whose is_successful is about to be
+    bulk-written: a failed or refunded payment deactivates its membership,
+    one that turned successful reactivates it or, lacking one, buys a
+    membership stacked on the member's coverage (set on payment.membership;
+    the caller saves the link). Bulk writes send no signals, so the members'
+    entitlements and coverage are refreshed here.
+    Payments need `membership` and `membership_plan` loaded.
+    """
+    changed_memberships, purchases = [], []
+    for payment in payments:
+        membership = payment.membership
+        if membership is not None:
+            if membership.is_active != payment.is_successful:
+                membership.is_active = payment.is_successful
+                changed_memberships.append(membership)
+        elif payment.is_successful and payment.membership_plan is not None:
+            purchases.append(payment)
+
+    # memberships bought by now-successful payments stack on the members' coverage
+    new_memberships = stack_memberships([(payment.user_id, payment.membership_plan) for payment in purchases])
+    for payment, membership in zip(purchases, new_memberships):
+        payment.membership = membership
+    Membership.objects.bulk_create(new_memberships)
+    Membership.objects.bulk_update(changed_memberships, ['is_active'])
+    invalidate_entitlements(payment.user_id for payment in payments)
+    refresh_coverage(payment.user_id for payment in payments if payment.membership is not None)
+
+
+def revenue_summary(queryset, period='day'):
+    """
+    Revenue of the successful payments in `queryset`: overall totals, then
+    totals per `period` (day/week/month), per plan and per payment method.
+    Each breakdown is one GROUP BY query; no Payment rows are loaded.
+    """
+    payments = queryset.filter(is_successful=True).order_by()
+    metrics = {'revenue': Sum('amount'), 'count': Count('id'), 'average': Round(Avg('amount'), 2)}
+
+    bucket = REVENUE_PERIODS[period]('payment_date', output_field=DateField())
+
+    return {
+        'period': period,
+        'totals': payments.aggregate(**metrics),
+        'by_period': list(
+            payments.annotate(period_start=bucket)
+            .values('period_start').annotate(**metrics).order_by('period_start')
+        ),
+        'by_plan': list(
+            payments.values(plan_id=F('membership_plan'), plan=F('membership_plan__name'))
+            .annotate(**metrics).order_by('-revenue')
+        ),
+        'by_payment_method': list(
+            payments.values('payment_method').annotate(**metrics).order_by('-revenue')
+        ),
+    }
+
+
+def reconcile_settlement(lines, file_name, imported_by=None, batch_size=SETTLEMENT_BATCH_SIZE):
+    """
+    Reconcile an acquirer settlement CSV (`lines` is any iterable of text
+    lines, e.g. an open file) against Payment.transaction_id.
+
+    The file is read as a stream, `batch_size` rows at a time: each batch is
+    matched with one in_bulk() lookup and its status/amount mismatches are
+    corrected with one bulk_update(), so memory stays bounded by the batch
+    size whatever the file length. Returns the saved SettlementImport summary.
+    Raises ValueError when the header lacks a required column.
+    """
+    reader = csv.DictReader(lines)
+    missing = set(SETTLEMENT_COLUMNS) - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"Settlement file is missing columns: {', '.join(sorted(missing))}")
+
+    summary = SettlementImport(file_name=file_name, imported_by=imported_by)
+    batch = {}
+    for row in reader:
+        summary.lines += 1
+        try:
+            transaction_id = row['transaction_id'].strip()
+            amount = Decimal(row['amount'].strip())
+            is_successful = SETTLEMENT_STATUSES[row['status'].strip().lower()]
+        except (AttributeError, InvalidOperation, KeyError):
+            summary.invalid += 1
+            continue
+        # Payment.amount is DECIMAL(10, 2)
+        if not transaction_id or not amount.is_finite() or amount.as_tuple().exponent < -2 or abs(amount) >= 10 ** 8:
+            summary.invalid += 1
+            continue
+        # a transaction listed twice settles to its last line
+        batch[transaction_id] = (amount, is_successful)
+        if len(batch) >= batch_size:
+            _reconcile_settlement_batch(batch, summary)
+            batch = {}
+    if batch:
+        _reconcile_settlement_batch(batch, summary)
+
+    summary.save()
+    return summary
+
+
+@transaction.atomic
+def _reconcile_settlement_batch(batch, summary):
+    payments = (
+        Payment.objects.select_related('membership', 'membership_plan')
+        .only(
+            'id', 'user_id', 'transaction_id', 'amount', 'is_successful',
+            'membership__user_id', 'membership__is_active', 'membership_plan__duration_in_days',
+        )
+        .in_bulk(list(batch), field_name='transaction_id')
+    )
+    changed, status_changed = [], []
+    for transaction_id, (amount, is_successful) in batch.items():
+        payment = payments.get(transaction_id)
+        if payment is None:
+            summary.unknown += 1
+            if len(summary.unknown_transactions) < MAX_UNKNOWN_TRANSACTIONS:
+                summary.unknown_transactions.append(transaction_id)
+            continue
+        summary.matched += 1
+        mismatch = False
+        if payment.is_successful != is_successful:
+            summary.status_mismatches += 1
+            payment.is_successful = is_successful
+            status_changed.append(payment)
+            mismatch = True
+        if payment.amount != amount:
+            summary.amount_mismatches += 1
+            payment.amount = amount
+            mismatch = True
+        if mismatch:
+            changed.append(payment)
+    # a refund or chargeback ends the membership it paid for
+    _sync_memberships(status_changed)
+    Payment.objects.bulk_update(changed, ['is_successful', 'amount', 'membership'], batch_size=1000)
+    summary.updated += len(changed)
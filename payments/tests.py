@@ -1,3 +1,282 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from core.testing import make_user
+from memberships.models import MembershipPlan, Membership
+from memberships.services import covered_until, has_active_membership
+from payments import gateway
+from payments.models import Payment, WebhookEvent
+from payments.services import create_payment, process_webhook_events, reconcile_settlement
 
 # Create your tests here.
+
+def writes(queries):
+    return [q['sql'].split()[0] for q in queries if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+
+
+class CreatePaymentTests(TestCase):
+    def setUp(self):
+        self.member = make_user('member@example.com')
+        self.plan = MembershipPlan.objects.create(name='Gold', description='plan', price='49.00', duration_in_days=30)
+        self.client = APIClient()
+        self.client.force_authenticate(self.member)
+
+    def pay(self, key=None, plan=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            '/payments/', {'membership_plan': (plan or self.plan).pk, 'payment_method': 'Card'}, format='json', **headers,
+        )
+
+    def test_first_payment_query_count(self):
+        # idempotency lookup and plan lookup, then in one transaction (begin and commit):
+        # member lock, coverage read, Max(end_date) fallback, membership INSERT,
+        # coverage refresh (SELECT + upsert) and payment INSERT
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertNumQueries(11):
+                response = self.pay(key='attempt-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(writes(queries), ['INSERT', 'INSERT', 'INSERT'])
+        payment = Payment.objects.get()
+        self.assertTrue(payment.is_successful)
+        self.assertEqual(payment.membership, Membership.objects.get())
+
+    def test_renewal_query_count(self):
+        self.pay()
+        # no Idempotency-Key lookup, and the coverage row exists now, so the
+        # Max(end_date) fallback is skipped
+        with self.assertNumQueries(9):
+            self.pay()
+        self.assertEqual(Membership.objects.count(), 2)
+
+    def test_replay_returns_the_original_response_in_one_query(self):
+        first = self.pay(key='attempt-1')
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertNumQueries(1):
+                replay = self.pay(key='attempt-1')
+        self.assertEqual(writes(queries), [])
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(Membership.objects.count(), 1)
+
+    def test_key_reused_for_another_plan_conflicts(self):
+        self.pay(key='attempt-1')
+        other = MembershipPlan.objects.create(name='Silver', description='plan', price='29.00', duration_in_days=30)
+        response = self.pay(key='attempt-1', plan=other)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Payment.objects.count(), 1)
+
+
+class SettlementReconciliationTests(TestCase):
+    def setUp(self):
+        self.member = make_user('member@example.com')
+        self.plan = MembershipPlan.objects.create(name='Gold', description='plan', price='49.00', duration_in_days=30)
+        self.payment = create_payment(self.member, self.plan, 'Card')
+
+    def reconcile(self, *lines):
+        return reconcile_settlement(['transaction_id,amount,status\n', *lines], 'settlement.csv')
+
+    def test_refund_ends_the_membership(self):
+        self.assertTrue(has_active_membership(self.member.pk))
+        summary = self.reconcile(f'{self.payment.transaction_id},49.00,refunded\n')
+        self.assertEqual((summary.matched, summary.status_mismatches, summary.updated), (1, 1, 1))
+        self.payment.refresh_from_db()
+        self.assertFalse(self.payment.is_successful)
+        self.assertFalse(self.payment.membership.is_active)
+        self.assertFalse(has_active_membership(self.member.pk))
+        self.assertIsNone(covered_until(self.member.pk))
+
+    def test_settled_failed_payment_buys_its_membership(self):
+        payment = Payment.objects.create(user=self.member, membership_plan=self.plan, amount='49.00', payment_method='Card')
+        self.reconcile(f'{payment.transaction_id},49.00,settled\n')
+        payment.refresh_from_db()
+        self.assertTrue(payment.is_successful)
+        self.assertEqual(payment.membership.start_date, self.payment.membership.end_date)
+        self.assertEqual(covered_until(self.member.pk), payment.membership.end_date)
+
+    def test_amount_mismatch_leaves_the_membership_alone(self):
+        summary = self.reconcile(f'{self.payment.transaction_id},45.00,settled\n', 'unknown-id,1.00,settled\n')
+        self.assertEqual((summary.amount_mismatches, summary.status_mismatches, summary.unknown), (1, 0, 1))
+        self.payment.refresh_from_db()
+        self.assertEqual(str(self.payment.amount), '45.00')
+        self.assertTrue(self.payment.membership.is_active)
+        self.assertTrue(has_active_membership(self.member.pk))
+
+    def test_replayed_file_changes_nothing(self):
+        lines = [f'{self.payment.transaction_id},49.00,refunded\n']
+        first = self.reconcile(*lines)
+        self.payment.refresh_from_db()
+        state = (self.payment.is_successful, self.payment.membership.is_active, Membership.objects.count())
+        with CaptureQueriesContext(connection) as queries:
+            replay = self.reconcile(*lines)
+        self.assertEqual((first.updated, replay.updated), (1, 0))
+        self.assertEqual((replay.matched, replay.status_mismatches), (1, 0))
+        # the summary row is the only write
+        self.assertEqual(writes(queries), ['INSERT'])
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.is_successful, self.payment.membership.is_active, Membership.objects.count()), state)
+
+    def test_partly_matched_file_across_batches(self):
+        others = [
+            Payment.objects.create(user=self.member, membership_plan=self.plan, amount='49.00', payment_method='Card', is_successful=True)
+            for _ in range(3)
+        ]
+        summary = reconcile_settlement([
+            'transaction_id,amount,status,currency\n',
+            f'{self.payment.transaction_id},49.00,settled,EUR\n',
+            'unknown-1,10.00,settled,EUR\n',
+            f'{others[0].transaction_id},49.00,chargeback,EUR\n',
+            f'{others[1].transaction_id},not-money,settled,EUR\n',
+            'unknown-2,10.00,settled,EUR\n',
+            f'{others[2].transaction_id},39.00,settled,EUR\n',
+            f'{others[2].transaction_id},44.00,settled,EUR\n',
+            f'{others[1].transaction_id},49.00,lost,EUR\n',
+        ], 'partial.csv', batch_size=2)
+        self.assertEqual(
+            (summary.lines, summary.matched, summary.unknown, summary.invalid, summary.updated),
+            (8, 3, 2, 2, 2),
+        )
+        self.assertEqual(summary.unknown_transactions, ['unknown-1', 'unknown-2'])
+        for payment in others:
+            payment.refresh_from_db()
+        self.assertEqual([payment.is_successful for payment in others], [False, True, True])
+        # a transaction listed twice in one batch settles to its last line
+        self.assertEqual(str(others[2].amount), '44.00')
+        self.assertFalse(others[0].membership.is_active)
+
+    def test_missing_columns_are_rejected(self):
+        with self.assertRaises(ValueError):
+            reconcile_settlement(['transaction_id,amount\n', 'abc,1.00\n'], 'bad.csv')
+
+
+class RevenueTests(TestCase):
+    def setUp(self):
+        self.admin = make_user('admin@example.com', 'ADMIN')
+        self.member = make_user('member@example.com')
+        self.gold = MembershipPlan.objects.create(name='Gold', description='plan', price='50.00', duration_in_days=30)
+        self.silver = MembershipPlan.objects.create(name='Silver', description='plan', price='20.00', duration_in_days=30)
+        for day, plan, method, successful in [
+            (3, self.gold, 'Card', True), (3, self.silver, 'Cash', True), (4, self.gold, 'Card', True),
+            (20, self.silver, 'Card', True), (20, self.gold, 'Card', False),
+        ]:
+            payment = Payment.objects.create(
+                user=self.member, membership_plan=plan, amount=plan.price, payment_method=method, is_successful=successful,
+            )
+            Payment.objects.filter(pk=payment.pk).update(payment_date=datetime(2026, 3, day, 12, tzinfo=dt_timezone.utc))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def revenue(self, **params):
+        return self.client.get('/payments/revenue/', params)
+
+    def test_only_admins_see_revenue(self):
+        for user in [make_user('staff@example.com', 'STAFF'), self.member]:
+            self.client.force_authenticate(user)
+            self.assertEqual(self.revenue().status_code, 403, user.role)
+        self.client.force_authenticate(None)
+        self.assertIn(self.revenue().status_code, (401, 403))
+
+    def test_totals_and_breakdowns_count_successful_payments(self):
+        data = self.revenue().data
+        self.assertEqual(
+            (data['totals']['revenue'], data['totals']['count'], Decimal(data['totals']['average'])),
+            (Decimal('140.00'), 4, Decimal('35.00')),
+        )
+        self.assertEqual(
+            [(row['plan'], row['revenue'], row['count']) for row in data['by_plan']],
+            [('Gold', Decimal('100.00'), 2), ('Silver', Decimal('40.00'), 2)],
+        )
+        self.assertEqual(
+            [(row['payment_method'], row['revenue']) for row in data['by_payment_method']],
+            [('Card', Decimal('120.00')), ('Cash', Decimal('20.00'))],
+        )
+
+    def test_period_buckets(self):
+        def buckets(period):
+            return [(str(row['period_start']), row['count']) for row in self.revenue(period=period).data['by_period']]
+        self.assertEqual(buckets('day'), [('2026-03-03', 2), ('2026-03-04', 1), ('2026-03-20', 1)])
+        self.assertEqual(buckets('week'), [('2026-03-02', 3), ('2026-03-16', 1)])
+        self.assertEqual(buckets('month'), [('2026-03-01', 4)])
+
+    def test_date_filters(self):
+        data = self.revenue(payment_date_min='2026-03-04', payment_date_max='2026-03-10').data
+        self.assertEqual((data['totals']['count'], data['totals']['revenue']), (1, Decimal('50.00')))
+
+    def test_bad_input_is_rejected(self):
+        self.assertEqual(self.revenue(period='year').status_code, 400)
+        self.assertEqual(self.revenue(payment_date_min='March').status_code, 400)
+        self.assertEqual(self.revenue(amount_min='lots').status_code, 400)
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET='test-secret')
+class WebhookTests(TestCase):
+    def setUp(self):
+        self.member = make_user('member@example.com')
+        self.plan = MembershipPlan.objects.create(name='Gold', description='plan', price='49.00', duration_in_days=30)
+        self.payment = Payment.objects.create(user=self.member, membership_plan=self.plan, amount='49.00', payment_method='Card')
+        self.client = APIClient()
+
+    def event(self, event_id, event_type, created=1_700_000_000, transaction_id=None):
+        return json.dumps({
+            'id': event_id, 'type': event_type, 'created': created,
+            'data': {'transaction_id': transaction_id or self.payment.transaction_id},
+        }).encode()
+
+    def deliver(self, body, signature=None):
+        headers = {'HTTP_X_GATEWAY_SIGNATURE': gateway.sign(body) if signature is None else signature}
+        return self.client.post('/payments/webhook/', body, content_type='application/json', **headers)
+
+    def test_bad_or_missing_signature_is_rejected(self):
+        body = self.event('evt_1', 'payment.succeeded')
+        for signature in ['', 'sha256=' + '0' * 64, gateway.sign(body, secret='other-secret'), gateway.sign(body + b' ')]:
+            self.assertEqual(self.deliver(body, signature).status_code, 403, signature)
+        with override_settings(PAYMENT_WEBHOOK_SECRET=''):
+            self.assertEqual(self.deliver(body, gateway.sign(body, secret='')).status_code, 403)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_malformed_event_is_rejected(self):
+        for body in [b'not json', json.dumps({'id': 'evt_1', 'type': 'payment.lost', 'created': 1, 'data': {'transaction_id': 'x'}}).encode()]:
+            self.assertEqual(self.deliver(body).status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_duplicate_event_is_processed_once(self):
+        body = self.event('evt_1', 'payment.succeeded')
+        self.assertEqual(self.deliver(body).status_code, 202)
+        response = self.deliver(body)
+        self.assertEqual((response.status_code, response.data['status']), (200, 'duplicate'))
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(process_webhook_events(), (1, 1))
+        self.assertEqual(self.deliver(body).status_code, 200)
+        self.assertEqual(process_webhook_events(), (0, 0))
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.is_successful)
+        self.assertEqual(Membership.objects.filter(payments=self.payment).count(), 1)
+
+    def test_out_of_order_event_does_not_regress_the_payment(self):
+        # refunded later, but the refund is delivered (and drained) first
+        self.deliver(self.event('evt_refund', 'payment.refunded', created=1_700_000_100))
+        self.assertEqual(process_webhook_events(), (1, 1))
+        self.deliver(self.event('evt_success', 'payment.succeeded', created=1_700_000_000))
+        self.assertEqual(process_webhook_events(), (1, 0))
+        self.payment.refresh_from_db()
+        self.assertFalse(self.payment.is_successful)
+        self.assertFalse(has_active_membership(self.member.pk))
+
+    def test_newest_event_of_a_batch_wins(self):
+        for event_id, event_type, created in [
+            ('evt_b', 'payment.refunded', 1_700_000_200), ('evt_a', 'payment.succeeded', 1_700_000_100),
+            ('evt_c', 'payment.failed', 1_700_000_050),
+        ]:
+            self.deliver(self.event(event_id, event_type, created))
+        self.deliver(self.event('evt_unknown', 'payment.succeeded', transaction_id='no-such-payment'))
+        self.assertEqual(process_webhook_events(batch_size=10), (4, 1))
+        self.payment.refresh_from_db()
+        self.assertFalse(self.payment.is_successful)
+        self.assertEqual(self.payment.gateway_event_at.timestamp(), 1_700_000_200)
+        self.assertEqual(WebhookEvent.objects.get(event_id='evt_unknown').error, "Unknown transaction_id.")
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
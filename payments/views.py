@@ -1,5 +1,6 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
@@ -7,15 +8,21 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import rest_framework as filters
 from payments.models import Payment
-from payments.serializers import PaymentSerializer
-from core.permissions import IsMemberOrAdminStaff, IsAdminOrStaff
+from payments.serializers import PaymentSerializer, SettlementImportSerializer
+from core.permissions import IsMemberOrAdminStaff, IsAdminOrStaff, IsAdmin
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from memberships.models import Membership, MembershipPlan
 from core.permissions import PaymentPermissions
 from core.filters import PaymentFilter
-from datetime import timedelta
-from django.db import transaction
+from core.exports import EXPORT_PARAMETER, export_response, PAYMENT_REPORT_COLUMNS
+import io
+from django.db import IntegrityError
+from payments import gateway
+from payments.services import (
+    IDEMPOTENCY_KEY_HEADER, MAX_IDEMPOTENCY_KEY_LENGTH, REVENUE_PERIODS,
+    create_payment, find_idempotent_payment, ingest_webhook, reconcile_settlement, revenue_summary,
+)
 
 class PaymentPagination(PageNumberPagination):
     page_size = 15
@@ -60,51 +67,70 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return super().list(request, *args, **kwargs)
 
     @swagger_auto_schema(
-        operation_description="Create a new payment",
+        operation_description=(
+            "Create a new payment. The membership it buys starts where the member's current coverage ends. "
+            "Send an `Idempotency-Key` header to make retries safe: "
+            "a repeated key returns the payment the first request created instead of charging again."
+        ),
         request_body=PaymentSerializer,
-        responses={201: PaymentSerializer, 400: "Bad Request"}
+        manual_parameters=[
+            openapi.Parameter(IDEMPOTENCY_KEY_HEADER, openapi.IN_HEADER, description="Unique key per payment attempt", type=openapi.TYPE_STRING),
+        ],
+        responses={201: PaymentSerializer, 400: "Bad Request", 409: "Idempotency-Key reused for a different request"}
     )
     def create(self, request, *args, **kwargs):
         data = request.data.copy()
         membership_plan_id = data.get('membership_plan')
         membership_id = data.get('membership')
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER, '').strip() or None
 
-        try:
-            with transaction.atomic():
-                if membership_plan_id:
-                    plan = MembershipPlan.objects.get(id=membership_plan_id)
-                    data['amount'] = plan.price
-                elif membership_id:
-                    membership = Membership.objects.select_related('plan').get(id=membership_id)
-                    data['amount'] = membership.plan.price
-                else:
-                    return Response({"error": "Membership or MembershipPlan is required"}, status=400)
-
-                serializer = self.get_serializer(data=data)
-                serializer.is_valid(raise_exception=True)
-                self.perform_create(serializer)
-
-                # Automatically create Membership
-                payment_instance = serializer.instance
-                payment_instance.is_successful = True
-                payment_instance.save()
-
-                if membership_plan_id:
-                    membership = Membership.objects.create(
-                        user=payment_instance.user,
-                        plan=plan,
-                        start_date=payment_instance.payment_date,
-                        end_date=payment_instance.payment_date + timedelta(days=plan.duration_in_days),
-                        is_active=True
-                    )
-                    payment_instance.membership = membership
-                    payment_instance.save()
+        if idempotency_key and len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            return Response({"error": f"{IDEMPOTENCY_KEY_HEADER} must be at most {MAX_IDEMPOTENCY_KEY_LENGTH} characters"}, status=400)
 
+        try:
+            if membership_id and not membership_plan_id:
+                # paying for an existing membership renews its plan
+                membership = Membership.objects.get(id=membership_id, user=request.user)
+                membership_plan_id = data['membership_plan'] = membership.plan_id
+            elif not membership_plan_id:
+                return Response({"error": "Membership or MembershipPlan is required"}, status=400)
+
+            previous = find_idempotent_payment(request.user, idempotency_key)
+            if previous is not None:
+                return self._replay(previous, membership_plan_id)
+
+            serializer = self.get_serializer(data=data)
+            serializer.is_valid(raise_exception=True)
+            try:
+                payment = create_payment(
+                    user=request.user,
+                    plan=serializer.validated_data['membership_plan'],
+                    payment_method=serializer.validated_data['payment_method'],
+                    idempotency_key=idempotency_key,
+                )
+            except IntegrityError:
+                # a concurrent request with the same key won the insert
+                previous = find_idempotent_payment(request.user, idempotency_key)
+                if previous is None:
+                    raise
+                return self._replay(previous, membership_plan_id)
+
+            serializer.instance = payment
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
             return Response({"error": str(e)}, status=400)
 
+    def _replay(self, payment, membership_plan_id):
+        if str(membership_plan_id) != str(payment.membership_plan_id):
+            return Response(
+                {"error": f"{IDEMPOTENCY_KEY_HEADER} was already used for a different payment"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        response = Response(self.get_serializer(payment).data, status=status.HTTP_201_CREATED)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
     @swagger_auto_schema(
         operation_description="Retrieve details of a specific payment",
         responses={200: PaymentSerializer, 404: "Not Found"}
@@ -135,13 +161,91 @@ class PaymentViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        operation_description="Payment report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def payment_report(self, request):
         try:
             if request.user.role == 'ADMIN':
                 payment_data = Payment.objects.select_related('user', 'membership_plan').all()
+                response = export_response(request, payment_data, PAYMENT_REPORT_COLUMNS, 'payments')
+                if response is not None:
+                    return response
                 serializer = self.get_serializer(payment_data, many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Revenue of successful payments (Admin only): totals, count and average amount, "
+            "overall and grouped by period, plan and payment method. Aggregated in the database."
+        ),
+        manual_parameters=[
+            openapi.Parameter('period', openapi.IN_QUERY, description="day (default), week or month", type=openapi.TYPE_STRING),
+            openapi.Parameter('payment_date_min', openapi.IN_QUERY, description="Payments on or after this date", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('payment_date_max', openapi.IN_QUERY, description="Payments up to this date", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+            openapi.Parameter('amount_min', openapi.IN_QUERY, description="Minimum amount", type=openapi.TYPE_NUMBER),
+            openapi.Parameter('amount_max', openapi.IN_QUERY, description="Maximum amount", type=openapi.TYPE_NUMBER),
+        ],
+        responses={200: "Revenue totals and breakdowns", 400: "Bad Request", 403: "Forbidden"}
+    )
+    @action(detail=False, methods=['get'], permission_classes=[IsAdmin])
+    def revenue(self, request):
+        period = request.query_params.get('period', 'day')
+        if period not in REVENUE_PERIODS:
+            return Response({'error': f"period must be one of: {', '.join(REVENUE_PERIODS)}"}, status=400)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(revenue_summary(queryset, period))
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Reconcile an acquirer settlement CSV (Admin only). The file needs `transaction_id`, `amount` "
+            "and `status` columns; payments whose status or amount differ from the file are corrected. "
+            "Returns the reconciliation summary."
+        ),
+        manual_parameters=[
+            openapi.Parameter('file', openapi.IN_FORM, description="Settlement CSV", type=openapi.TYPE_FILE, required=True),
+        ],
+        responses={201: SettlementImportSerializer, 400: "Bad Request", 403: "Forbidden"}
+    )
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminOrStaff], parser_classes=[MultiPartParser])
+    def import_settlement(self, request):
+        if request.user.role != 'ADMIN':
+            return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A settlement file is required'}, status=400)
+        try:
+            lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            summary = reconcile_settlement(lines, upload.name, imported_by=request.user)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(SettlementImportSerializer(summary).data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Payment gateway webhook. Verifies the `X-Gateway-Signature` HMAC and queues the raw event; "
+            "events are applied asynchronously by `manage.py process_payment_webhooks`. "
+            "Redelivered events are acknowledged without being queued again."
+        ),
+        manual_parameters=[
+            openapi.Parameter(gateway.SIGNATURE_HEADER, openapi.IN_HEADER, description="sha256=<HMAC of the raw body>", type=openapi.TYPE_STRING, required=True),
+        ],
+        responses={202: "Queued", 200: "Duplicate event", 400: "Malformed event", 403: "Bad signature"}
+    )
+    @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny], authentication_classes=[])
+    def webhook(self, request):
+        body = request.body
+        if not gateway.verify_signature(body, request.headers.get(gateway.SIGNATURE_HEADER)):
+            return Response({'error': 'Invalid signature'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            queued = ingest_webhook(body)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if queued:
+            return Response({'status': 'queued'}, status=status.HTTP_202_ACCEPTED)
+        return Response({'status': 'duplicate'}, status=status.HTTP_200_OK)
@@ -1,6 +1,25 @@
 from django.contrib import admin
-from .models import Report
+from .models import Report, ReportJob, ClassRollup, InstructorDailyRollup
 
 # Register your models here.
 
-admin.site.register(Report)
\ No newline at end of file
+admin.site.register(Report)
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'report', 'export_format', 'status', 'requested_by', 'created_at', 'finished_at', 'row_count', 'result_size']
+    list_filter = ['status', 'report']
+    exclude = ['result']
+
+
+@admin.register(ClassRollup)
+class ClassRollupAdmin(admin.ModelAdmin):
+    list_display = ['fitness_class_id', 'instructor', 'date', 'capacity', 'bookings', 'present', 'late', 'absent', 'updated_at']
+    list_filter = ['date']
+
+
+@admin.register(InstructorDailyRollup)
+class InstructorDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['instructor', 'date', 'classes', 'capacity', 'bookings', 'present', 'late', 'absent', 'updated_at']
+    list_filter = ['date']
@@ -0,0 +1,190 @@
+import numpy as np
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.functions import Cast, ExtractMonth, ExtractYear
+from django.utils import timezone
+from attendance.models import Attendance
+from memberships.models import Membership
+from payments.models import Payment
+
+# attendance statuses that count as having come to a class
+ATTENDED_STATUSES = ['present', 'late']
+# the analysis reads every payment, membership and attendance row, so a
+# result is reused for this many seconds
+COHORT_CACHE_TTL = 15 * 60
+
+
+def _month_index(field):
+    """Months since year 0 of a datetime column, computed by the database in the current time zone."""
+    return ExtractYear(field) * 12 + ExtractMonth(field) - 1
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
+
+
+def month_label(index):
+    year, month = divmod(int(index), 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+
+class _UserCodes:
+    """Maps raw user ids to dense integer codes, so users can index arrays."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, user_ids):
+        codes = self.codes
+        return np.fromiter((codes.setdefault(user_id, len(codes)) for user_id in user_ids), dtype=np.int64)
+
+
+def _columns(queryset, *fields):
+    """
+    The values_list() columns of `queryset`, one list per field, read in a
+    single query. Rows come straight from the cursor: per-value converters
+    (UUID objects, datetimes) would cost more than the analysis itself.
+    """
+    sql, params = queryset.order_by().values_list(*fields).query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [list(column) for column in zip(*rows)] if rows else [[] for _ in fields]
+
+
+def _expand_intervals(users, starts, ends):
+    """(user, month) for every month covered by the [start, end] month intervals, without a Python loop."""
+    lengths = np.maximum(ends - starts + 1, 0)
+    total = int(lengths.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(users, lengths), np.repeat(starts, lengths) + offsets
+
+
+def cohort_retention(first_month=None, last_month=None, horizon=None, until_month=None):
+    """
+    Monthly cohort retention, churn and lifetime value.
+
+    A member's cohort is the month of their first successful payment. They
+    count as retained in month M+k if a Membership of theirs covered that
+    month or they attended (present or late) a class in it.
+
+    Three compact column reads (payments, memberships, attendance) feed
+    vectorized NumPy operations; there is no per-cohort or per-member query.
+    `first_month`/`last_month` (month indexes, see month_label) limit the
+    cohorts reported, `horizon` the months after the cohort month, and
+    `until_month` is the last month counted (default: the current one).
+    """
+    until_month = until_month if until_month is not None else month_index(timezone.localdate())
+    users = _UserCodes()
+
+    pay_users, pay_months, amounts = _columns(
+        Payment.objects.filter(is_successful=True).annotate(
+            month=_month_index('payment_date'), value=Cast('amount', FloatField()),
+        ),
+        'user_id', 'month', 'value',
+    )
+    pay_users = users.encode(pay_users)
+    pay_months = np.asarray(pay_months, dtype=np.int64)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    counted = pay_months <= until_month
+    pay_users, pay_months, amounts = pay_users[counted], pay_months[counted], amounts[counted]
+
+    member_users, member_starts, member_ends = _columns(
+        Membership.objects.annotate(first=_month_index('start_date'), last=_month_index('end_date')),
+        'user_id', 'first', 'last',
+    )
+    member_users = users.encode(member_users)
+    member_starts = np.asarray(member_starts, dtype=np.int64)
+    member_ends = np.asarray(member_ends, dtype=np.int64)
+
+    attend_users, attend_months = _columns(
+        Attendance.objects.filter(status__in=ATTENDED_STATUSES).annotate(month=_month_index('fitness_class__schedule')),
+        'user_id', 'month',
+    )
+    attend_users = users.encode(attend_users)
+    attend_months = np.asarray(attend_months, dtype=np.int64)
+
+    result = {'cohorts': [], 'churn': []}
+    if not len(pay_users):
+        return result
+
+    # cohort month of every paying member
+    user_count = len(users.codes)
+    cohort_of = np.full(user_count, np.iinfo(np.int64).max)
+    np.minimum.at(cohort_of, pay_users, pay_months)
+    paying = cohort_of != np.iinfo(np.int64).max
+
+    start = int(cohort_of[paying].min())
+    end = max(until_month, start)
+    span = end - start + 1
+
+    # distinct (member, month) activity, as one sorted int64 key per pair
+    covered_users, covered_months = _expand_intervals(member_users, np.maximum(member_starts, start), np.minimum(member_ends, end))
+    active_users = np.concatenate([covered_users, attend_users])
+    active_months = np.concatenate([covered_months, attend_months])
+    in_range = (active_months >= start) & (active_months <= end)
+    keys = np.unique(active_users[in_range] * span + (active_months[in_range] - start))
+    key_users, key_months = np.divmod(keys, span)
+
+    # cohort x months-since-cohort counts of retained members
+    key_cohorts = cohort_of[key_users]
+    retained = paying[key_users] & (key_months + start >= key_cohorts)
+    cohort_rows = key_cohorts[retained] - start
+    ages = key_months[retained] + start - key_cohorts[retained]
+    retained_counts = np.bincount(cohort_rows * span + ages, minlength=span * span).reshape(span, span)
+    sizes = np.bincount(cohort_of[paying] - start, minlength=span)
+
+    # revenue by cohort and months since cohort, accumulated into lifetime value
+    pay_cohorts = cohort_of[pay_users] - start
+    pay_ages = pay_months - cohort_of[pay_users]
+    revenue = np.bincount(pay_cohorts * span + pay_ages, weights=amounts, minlength=span * span).reshape(span, span)
+    cumulative_revenue = np.cumsum(revenue, axis=1)
+
+    first = max(start, first_month) if first_month is not None else start
+    last = min(end, last_month) if last_month is not None else end
+    for cohort in range(first, last + 1):
+        row = cohort - start
+        size = int(sizes[row])
+        if not size:
+            continue
+        months = end - cohort + 1
+        if horizon is not None:
+            months = min(months, horizon + 1)
+        counts = retained_counts[row, :months]
+        result['cohorts'].append({
+            'cohort': month_label(cohort),
+            'size': size,
+            'retained': counts.tolist(),
+            'retention': np.round(counts / size, 4).tolist(),
+            'revenue': np.round(revenue[row, :months], 2).tolist(),
+            'ltv': np.round(cumulative_revenue[row, :months] / size, 2).tolist(),
+        })
+
+    # churn: members active in a month and not in the next
+    active_per_month = np.bincount(key_months, minlength=span)
+    # keys are sorted, so "active next month too" is a binary search for key + 1
+    following = np.minimum(np.searchsorted(keys, keys + 1), len(keys) - 1)
+    continues = (keys[following] == keys + 1) & (key_months + 1 < span)
+    churned = np.bincount(key_months[~continues], minlength=span)
+    for month in range(max(first, start), min(last, end - 1) + 1):
+        offset = month - start
+        active = int(active_per_month[offset])
+        result['churn'].append({
+            'month': month_label(month),
+            'active': active,
+            'churned': int(churned[offset]),
+            'churn_rate': round(int(churned[offset]) / active, 4) if active else None,
+        })
+    return result
+
+
+def cached_cohort_retention(first_month=None, last_month=None, horizon=None):
+    """cohort_retention() up to the current month, cached for COHORT_CACHE_TTL per set of arguments."""
+    until_month = month_index(timezone.localdate())
+    key = f'reports:cohort-retention:{first_month}:{last_month}:{horizon}:{until_month}'
+    result = cache.get(key)
+    if result is None:
+        result = cohort_retention(first_month, last_month, horizon, until_month)
+        cache.set(key, result, COHORT_CACHE_TTL)
+    return result
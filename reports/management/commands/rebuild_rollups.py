@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from reports import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute all occupancy and attendance rollups from bookings and attendance (backfills, repairs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=rollups.ROLLUP_BATCH_SIZE,
+            help="Classes rolled up per transaction (default: %(default)s).",
+        )
+
+    def handle(self, *args, **options):
+        total = rollups.rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups of {total} classes."))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from reports import rollups
+
+
+class Command(BaseCommand):
+    help = "Refresh the occupancy and attendance rollups of classes that changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=rollups.ROLLUP_BATCH_SIZE,
+            help="Classes refreshed per transaction (default: %(default)s).",
+        )
+        parser.add_argument(
+            '--poll', type=float, default=0,
+            help="Keep running, checking the queue every POLL seconds once it is drained.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed = rollups.process_pending_rollups(batch_size=options['batch_size'])
+            if refreshed or not options['poll']:
+                self.stdout.write(self.style.SUCCESS(f"Refreshed rollups of {refreshed} classes."))
+            if not options['poll']:
+                break
+            time.sleep(options['poll'])
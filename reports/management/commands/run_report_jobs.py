@@ -0,0 +1,54 @@
+import multiprocessing
+import time
+import django
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.core.management.base import BaseCommand
+from reports import services
+
+
+class Command(BaseCommand):
+    help = "Run queued report jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=max(1, multiprocessing.cpu_count() - 1),
+            help="Worker processes (default: %(default)s).",
+        )
+        parser.add_argument(
+            '--poll', type=float, default=2.0,
+            help="Seconds between queue checks while idle (default: %(default)s).",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the queue is empty instead of waiting for new jobs.",
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        done = failed = 0
+        running = {}
+        # spawned workers start with fresh database connections instead of forked copies;
+        # they set Django up before the first job is unpickled
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            while True:
+                for job_id in services.claim_jobs(limit=workers - len(running)):
+                    running[pool.submit(services.run_report_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                finished, _ = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job_id = running.pop(future)
+                    status = future.result()
+                    if status == 'done':
+                        done += 1
+                    else:
+                        failed += 1
+                    self.stdout.write(f"Report job {job_id}: {status}")
+
+        self.stdout.write(self.style.SUCCESS(f"Finished {done} report jobs, {failed} failed."))
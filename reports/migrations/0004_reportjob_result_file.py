@@ -0,0 +1,35 @@
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+import reports.models
+
+
+def move_results_to_files(apps, schema_editor):
+    ReportJob = apps.get_model('reports', 'ReportJob')
+    for job in ReportJob.objects.exclude(result=None).iterator(chunk_size=20):
+        job.result_file.save(f'{job.report}-{job.pk}.{job.export_format}.gz', ContentFile(bytes(job.result)), save=False)
+        job.save(update_fields=['result_file'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='result_file',
+            field=models.FileField(blank=True, editable=False, storage=reports.models.report_job_storage, upload_to='report_jobs/%Y/%m/'),
+        ),
+        migrations.RunPython(move_results_to_files, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='reportjob',
+            name='result',
+        ),
+        migrations.RenameField(
+            model_name='reportjob',
+            old_name='result_file',
+            new_name='result',
+        ),
+    ]
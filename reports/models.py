@@ -1,3 +1,4 @@
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from accounts.models import CustomUser
 from classes.models import FitnessClass
@@ -11,4 +12,127 @@ class Report(models.Model):
     content = models.TextField()
 
     def __str__(self):
-        return f"Report by {self.user.email} on {self.report_date}"
\ No newline at end of file
+        return f"Report by {self.user.email} on {self.report_date}"
+
+
+def report_job_storage():
+    """
+    Local files under MEDIA_ROOT for report job results: exports hold member
+    data, so they stay out of the public media storage (DEFAULT_FILE_STORAGE).
+    """
+    return FileSystemStorage()
+
+
+class ReportJob(models.Model):
+    """
+    A report export run in the background by `manage.py run_report_jobs`.
+    Identical requests share one job through `fingerprint`; the result is a
+    gzip-compressed file in report_job_storage().
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    report = models.CharField(max_length=32)
+    export_format = models.CharField(max_length=10)
+    params = models.JSONField(default=dict, blank=True)
+    # sha256 of (report, export_format, params)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    requested_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    row_count = models.PositiveIntegerField(null=True, blank=True)
+    result = models.FileField(upload_to='report_jobs/%Y/%m/', storage=report_job_storage, blank=True, editable=False)
+    result_size = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            # at most one queued or running job per distinct request
+            models.UniqueConstraint(
+                fields=['fingerprint'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_inflight_report_job',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='report_job_queue_idx'),
+            models.Index(fields=['fingerprint', 'finished_at'], name='report_job_fingerprint_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.report} ({self.export_format}) - {self.status}"
+
+
+class ClassRollup(models.Model):
+    """
+    Booking and attendance counts of one class, on the local date it is
+    scheduled. Maintained by reports.rollups; the rows of a deleted class are
+    kept until the rollup refresh has taken them out of the instructor totals.
+    """
+    fitness_class = models.OneToOneField(
+        FitnessClass, on_delete=models.DO_NOTHING, db_constraint=False, primary_key=True, related_name='rollup',
+    )
+    instructor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='class_rollups')
+    date = models.DateField()
+    capacity = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    present = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date', 'fitness_class']
+        indexes = [
+            models.Index(fields=['date'], name='class_rollup_date_idx'),
+            models.Index(fields=['instructor', 'date'], name='class_rollup_instructor_idx'),
+        ]
+
+    def __str__(self):
+        return f"Class {self.fitness_class_id} on {self.date}"
+
+
+class InstructorDailyRollup(models.Model):
+    """Per instructor and day totals of ClassRollup, maintained by reports.rollups."""
+    instructor = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    classes = models.PositiveIntegerField(default=0)
+    capacity = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    present = models.PositiveIntegerField(default=0)
+    late = models.PositiveIntegerField(default=0)
+    absent = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date', 'instructor']
+        constraints = [
+            models.UniqueConstraint(fields=['instructor', 'date'], name='unique_instructor_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='instructor_rollup_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.instructor.email} on {self.date}"
+
+
+class PendingClassRollup(models.Model):
+    """A class whose rollup is out of date; drained by `manage.py refresh_rollups`."""
+    # a plain id, so deleted classes stay queued until their rollup is removed
+    fitness_class_id = models.BigIntegerField(primary_key=True)
+    queued_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Class {self.fitness_class_id} queued at {self.queued_at}"
@@ -0,0 +1,212 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.db.models.functions import Cast, Coalesce, ExtractHour, ExtractIsoWeekDay, NullIf
+from django.utils import timezone
+from attendance.models import Attendance
+from classes.models import FitnessClass, ClassBooking
+from reports.models import ClassRollup, InstructorDailyRollup, PendingClassRollup
+
+ROLLUP_BATCH_SIZE = 500
+ROLLUP_COUNTS = ['capacity', 'bookings', 'present', 'late', 'absent']
+ATTENDANCE_COUNTS = ['present', 'late', 'absent']
+# heatmaps read every class in the range; results are reused this many seconds
+HEATMAP_CACHE_TTL = 10 * 60
+
+
+def mark_classes_dirty(class_ids, now=None):
+    """
+    Queue classes whose bookings, attendance or schedule changed.
+    One upsert; re-queuing a class moves its timestamp forward, so a refresh
+    running concurrently does not drop the newer change.
+    """
+    now = now or timezone.now()
+    rows = [PendingClassRollup(fitness_class_id=class_id, queued_at=now) for class_id in set(class_ids)]
+    PendingClassRollup.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True, unique_fields=['fitness_class_id'], update_fields=['queued_at'],
+    )
+
+
+def _class_rows(class_ids):
+    """Fresh ClassRollup rows for the classes that still exist, from one read per table."""
+    bookings = dict(
+        ClassBooking.objects.filter(fitness_class_id__in=class_ids)
+        .order_by().values_list('fitness_class_id').annotate(total=Count('id'))
+    )
+    attendance = defaultdict(dict)
+    for class_id, status, total in (
+        Attendance.objects.filter(fitness_class_id__in=class_ids)
+        .order_by().values_list('fitness_class_id', 'status').annotate(total=Count('id'))
+    ):
+        attendance[class_id][status] = total
+
+    rows = []
+    for class_id, instructor_id, schedule, capacity in (
+        FitnessClass.objects.filter(id__in=class_ids).values_list('id', 'instructor_id', 'schedule', 'max_capacity')
+    ):
+        rows.append(ClassRollup(
+            fitness_class_id=class_id,
+            instructor_id=instructor_id,
+            date=timezone.localtime(schedule).date(),
+            capacity=capacity,
+            bookings=bookings.get(class_id, 0),
+            **{status: attendance[class_id].get(status, 0) for status in ATTENDANCE_COUNTS},
+        ))
+    return rows
+
+
+def _refresh_instructor_days(keys):
+    """Recompute the InstructorDailyRollup rows of (instructor id, date) `keys` from ClassRollup."""
+    if not keys:
+        return
+    totals = (
+        ClassRollup.objects.filter(
+            instructor_id__in={instructor_id for instructor_id, _ in keys},
+            date__in={day for _, day in keys},
+        )
+        .order_by().values_list('instructor_id', 'date')
+        .annotate(classes=Count('fitness_class'), **{name: Sum(name) for name in ROLLUP_COUNTS})
+    )
+    rows = [
+        InstructorDailyRollup(instructor_id=instructor_id, date=day, classes=classes, **dict(zip(ROLLUP_COUNTS, counts)))
+        for instructor_id, day, classes, *counts in totals
+        if (instructor_id, day) in keys
+    ]
+    InstructorDailyRollup.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True,
+        unique_fields=['instructor', 'date'], update_fields=['classes', *ROLLUP_COUNTS, 'updated_at'],
+    )
+    emptied = keys - {(row.instructor_id, row.date) for row in rows}
+    for instructor_id, day in emptied:
+        InstructorDailyRollup.objects.filter(instructor_id=instructor_id, date=day).delete()
+
+
+@transaction.atomic
+def refresh_class_rollups(class_ids):
+    """
+    Bring the rollups of `class_ids` up to date.
+    Reads only those classes' bookings and attendance (indexed on the class),
+    then re-totals the instructor days the classes are on now or were on
+    before (a moved, reassigned or deleted class). Returns the rows written.
+    """
+    class_ids = list(class_ids)
+    previous = set(ClassRollup.objects.filter(fitness_class_id__in=class_ids).values_list('instructor_id', 'date'))
+    rows = _class_rows(class_ids)
+    ClassRollup.objects.filter(fitness_class_id__in=class_ids).exclude(
+        fitness_class_id__in=[row.fitness_class_id for row in rows],
+    ).delete()
+    ClassRollup.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True,
+        unique_fields=['fitness_class'], update_fields=['instructor', 'date', *ROLLUP_COUNTS, 'updated_at'],
+    )
+    _refresh_instructor_days(previous | {(row.instructor_id, row.date) for row in rows})
+    return len(rows)
+
+
+def process_pending_rollups(batch_size=ROLLUP_BATCH_SIZE):
+    """
+    Drain the PendingClassRollup queue, oldest first, a batch per transaction.
+    A class queued again while its batch ran stays queued for the next pass.
+    Returns the number of classes refreshed.
+    """
+    refreshed = 0
+    while True:
+        batch = list(PendingClassRollup.objects.order_by('queued_at').values_list('fitness_class_id', 'queued_at')[:batch_size])
+        if not batch:
+            return refreshed
+        class_ids = [class_id for class_id, _ in batch]
+        with transaction.atomic():
+            refresh_class_rollups(class_ids)
+            # re-queuing stamps a later time than anything already read
+            PendingClassRollup.objects.filter(
+                fitness_class_id__in=class_ids, queued_at__lte=max(queued_at for _, queued_at in batch),
+            ).delete()
+        refreshed += len(batch)
+
+
+def rebuild_rollups(batch_size=ROLLUP_BATCH_SIZE):
+    """
+    Recompute every rollup from bookings and attendance, e.g. for a backfill.
+    Classes are read in primary key batches so memory stays bounded.
+    Returns the number of classes rolled up.
+    """
+    with transaction.atomic():
+        PendingClassRollup.objects.all().delete()
+        InstructorDailyRollup.objects.all().delete()
+        ClassRollup.objects.all().delete()
+    total, last_id = 0, 0
+    while True:
+        class_ids = list(FitnessClass.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not class_ids:
+            return total
+        total += refresh_class_rollups(class_ids)
+        last_id = class_ids[-1]
+
+
+def daily_totals(queryset):
+    """Per day sums over a ClassRollup or InstructorDailyRollup queryset, with fill and attendance rates."""
+    days = queryset.order_by().values('date').annotate(**{name: Sum(name) for name in ROLLUP_COUNTS}).order_by('date')
+    return [{**day, **rates(day)} for day in days]
+
+
+def rates(counts):
+    """Fill rate (bookings / capacity) and attendance rate ((present + late) / bookings), rounded."""
+    attended = counts['present'] + counts['late']
+    return {
+        'fill_rate': round(counts['bookings'] / counts['capacity'], 4) if counts['capacity'] else None,
+        'attendance_rate': round(attended / counts['bookings'], 4) if counts['bookings'] else None,
+    }
+
+
+
+class _Heatmap:
+    """Weekday x hour sums, turned into rates by as_dict()."""
+
+    def __init__(self):
+        self.cells = {}
+
+    def add(self, weekday, hour, classes, fill_sum, bookings, attended):
+        sums = self.cells.get((weekday, hour), (0, 0.0, 0, 0))
+        self.cells[(weekday, hour)] = tuple(a + b for a, b in zip(sums, (classes, fill_sum, bookings, attended)))
+
+    def as_dict(self):
+        heatmap = {
+            'classes': [[0] * 24 for _ in range(7)],
+            'fill_rate': [[None] * 24 for _ in range(7)],
+            'attendance_rate': [[None] * 24 for _ in range(7)],
+        }
+        for (weekday, hour), (classes, fill_sum, bookings, attended) in self.cells.items():
+            heatmap['classes'][weekday][hour] = classes
+            heatmap['fill_rate'][weekday][hour] = round(fill_sum / classes, 4)
+            heatmap['attendance_rate'][weekday][hour] = round(attended / bookings, 4) if bookings else None
+        return heatmap
+
+
+def occupancy_heatmap(queryset, per_instructor=False):
+    """
+    Weekday (Monday first) x hour of day matrices of a ClassRollup queryset,
+    by the classes' local start time: number of classes, average fill rate
+    (bookings / capacity per class) and attendance rate ((present + late) /
+    bookings). One grouped query over the classes, not their bookings.
+    With `per_instructor`, the same matrices per instructor id as well.
+    """
+    cells = (
+        queryset.order_by()
+        .annotate(weekday=ExtractIsoWeekDay('fitness_class__schedule'), hour=ExtractHour('fitness_class__schedule'))
+        .values_list('weekday', 'hour', 'instructor_id')
+        .annotate(
+            classes=Count('fitness_class'),
+            fill_sum=Coalesce(Sum(Cast('bookings', FloatField()) / NullIf('capacity', 0)), 0.0),
+            bookings=Sum('bookings'),
+            attended=Sum(F('present') + F('late')),
+        )
+    )
+    overall = _Heatmap()
+    instructors = defaultdict(_Heatmap)
+    for weekday, hour, instructor_id, *sums in cells:
+        overall.add(weekday - 1, hour, *sums)
+        instructors[str(instructor_id)].add(weekday - 1, hour, *sums)
+    result = {'weekdays': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], 'overall': overall.as_dict()}
+    if per_instructor:
+        result['instructors'] = {instructor_id: heatmap.as_dict() for instructor_id, heatmap in instructors.items()}
+    return result
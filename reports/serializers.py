@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from reports.models import Report
+from rest_framework.exceptions import PermissionDenied
+from reports.models import Report, ReportJob, ClassRollup, InstructorDailyRollup
+from reports.rollups import rates
+from reports.services import REPORT_SOURCES, allowed_reports
+from core.exports import EXPORT_FORMATS
 from accounts.serializers import UserSerializer
 from classes.serializers import FitnessClassSerializer
 
@@ -9,4 +13,68 @@ class ReportSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Report
-        fields = ['id', 'user', 'fitness_class', 'report_date', 'content']
\ No newline at end of file
+        fields = ['id', 'user', 'fitness_class', 'report_date', 'content']
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'report', 'export_format', 'params', 'status', 'requested_by', 'created_at',
+            'started_at', 'finished_at', 'row_count', 'result_size', 'error',
+        ]
+        read_only_fields = fields
+
+
+class ReportJobRequestSerializer(serializers.Serializer):
+    report = serializers.ChoiceField(choices=sorted(REPORT_SOURCES))
+    export_format = serializers.ChoiceField(choices=list(EXPORT_FORMATS), default='csv')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate_report(self, value):
+        request = self.context.get('request')
+        if request is not None and value not in allowed_reports(request.user):
+            raise PermissionDenied(f"You are not allowed to export the {value} report.")
+        return value
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': "date_to must not be before date_from."})
+        return attrs
+
+    def job_params(self):
+        """The job's range filter, in the canonical form its fingerprint is taken over."""
+        params = {}
+        if self.validated_data.get('date_from'):
+            params['from'] = self.validated_data['date_from'].isoformat()
+        if self.validated_data.get('date_to'):
+            params['to'] = self.validated_data['date_to'].isoformat()
+        return params
+
+
+class ClassRollupSerializer(serializers.ModelSerializer):
+    fill_rate = serializers.SerializerMethodField()
+    attendance_rate = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ClassRollup
+        fields = [
+            'fitness_class', 'instructor', 'date', 'capacity', 'bookings', 'present', 'late', 'absent',
+            'fill_rate', 'attendance_rate', 'updated_at',
+        ]
+
+    def get_fill_rate(self, obj):
+        return rates(vars(obj))['fill_rate']
+
+    def get_attendance_rate(self, obj):
+        return rates(vars(obj))['attendance_rate']
+
+
+class InstructorDailyRollupSerializer(ClassRollupSerializer):
+    class Meta:
+        model = InstructorDailyRollup
+        fields = [
+            'id', 'instructor', 'date', 'classes', 'capacity', 'bookings', 'present', 'late', 'absent',
+            'fill_rate', 'attendance_rate', 'updated_at',
+        ]
@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import json
+import tempfile
+from datetime import datetime, time, timedelta
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import CustomUser
+from attendance.models import Attendance
+from classes.models import FitnessClass, ClassBooking
+from core import exports
+from feedback.models import Feedback
+from memberships.models import Membership
+from payments.models import Payment
+from reports.models import ReportJob
+
+# report name -> (model, columns, date field the optional from/to range applies to)
+REPORT_SOURCES = {
+    'classes': (FitnessClass, exports.CLASS_REPORT_COLUMNS, 'schedule'),
+    'class_bookings': (ClassBooking, exports.CLASS_BOOKING_REPORT_COLUMNS, 'booking_date'),
+    'memberships': (Membership, exports.MEMBERSHIP_REPORT_COLUMNS, 'start_date'),
+    'payments': (Payment, exports.PAYMENT_REPORT_COLUMNS, 'payment_date'),
+    'feedback': (Feedback, exports.FEEDBACK_REPORT_COLUMNS, 'created_at'),
+    'attendance': (Attendance, exports.ATTENDANCE_REPORT_COLUMNS, 'attendance_date'),
+    'users': (CustomUser, exports.USER_REPORT_COLUMNS, 'date_joined'),
+}
+# reports staff may export too (as their *_report actions allow); every other one is admin only
+STAFF_REPORTS = {'class_bookings', 'memberships'}
+# a finished job is handed out again for identical requests made within this window
+REPORT_JOB_REUSE_WINDOW = timedelta(minutes=10)
+# running jobs not finished after this long are assumed lost with their worker
+REPORT_JOB_TIMEOUT = timedelta(hours=1)
+
+
+def is_report_admin(user):
+    return user.is_superuser or user.role == 'ADMIN'
+
+
+def allowed_reports(user):
+    """The reports `user` may queue and download, matching the role checks of the *_report actions."""
+    return set(REPORT_SOURCES) if is_report_admin(user) else STAFF_REPORTS & set(REPORT_SOURCES)
+
+
+def job_fingerprint(report, export_format, params):
+    canonical = json.dumps([report, export_format, params], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def enqueue_report(report, export_format, params, requested_by=None, now=None):
+    """
+    Queue a report export, or hand back the job an identical request already
+    queued (or finished within REPORT_JOB_REUSE_WINDOW).
+    Returns (job, created).
+    """
+    now = now or timezone.now()
+    fingerprint = job_fingerprint(report, export_format, params)
+    shared = (
+        ReportJob.objects
+        .filter(fingerprint=fingerprint)
+        .filter(
+            Q(status__in=[ReportJob.PENDING, ReportJob.RUNNING])
+            | Q(status=ReportJob.DONE, finished_at__gte=now - REPORT_JOB_REUSE_WINDOW)
+        )
+        .first()
+    )
+    if shared is not None:
+        return shared, False
+    try:
+        with transaction.atomic():
+            job = ReportJob.objects.create(
+                report=report,
+                export_format=export_format,
+                params=params,
+                fingerprint=fingerprint,
+                requested_by=requested_by,
+            )
+    except IntegrityError:
+        # an identical request queued the job in the meantime
+        return ReportJob.objects.get(
+            fingerprint=fingerprint, status__in=[ReportJob.PENDING, ReportJob.RUNNING],
+        ), False
+    return job, True
+
+
+def claim_jobs(limit, now=None):
+    """
+    Move up to `limit` pending jobs, oldest first, to running and return their ids.
+    Each claim is a conditional UPDATE, so two workers never take the same job.
+    """
+    now = now or timezone.now()
+    ReportJob.objects.filter(status=ReportJob.RUNNING, started_at__lt=now - REPORT_JOB_TIMEOUT).update(
+        status=ReportJob.PENDING, started_at=None,
+    )
+    pending = ReportJob.objects.filter(status=ReportJob.PENDING).order_by('created_at').values_list('pk', flat=True)[:limit]
+    return [
+        pk for pk in pending
+        if ReportJob.objects.filter(pk=pk, status=ReportJob.PENDING).update(status=ReportJob.RUNNING, started_at=now)
+    ]
+
+
+def report_queryset(report, params):
+    model, _, date_field = REPORT_SOURCES[report]
+    queryset = model._default_manager.all()
+    tz = timezone.get_current_timezone()
+    if params.get('from'):
+        start = datetime.combine(datetime.fromisoformat(params['from']).date(), time.min, tzinfo=tz)
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if params.get('to'):
+        # inclusive end date
+        end = datetime.combine(datetime.fromisoformat(params['to']).date() + timedelta(days=1), time.min, tzinfo=tz)
+        queryset = queryset.filter(**{f'{date_field}__lt': end})
+    return queryset
+
+
+class _RowCounter:
+    """Passes value tuples through, counting them as they are rendered."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+def run_report_job(job_id):
+    """
+    Render a claimed job and store its gzip-compressed result.
+    The output is compressed into a temporary file chunk by chunk and then
+    saved to the job's `result`, so memory stays flat whatever the size.
+    Runs in a worker process of `manage.py run_report_jobs`; returns the final status.
+    """
+    job = ReportJob.objects.get(pk=job_id)
+    _, columns, _ = REPORT_SOURCES[job.report]
+    try:
+        rows = _RowCounter(exports.export_rows(report_queryset(job.report, job.params), columns))
+        with tempfile.TemporaryFile() as spool:
+            with gzip.GzipFile(fileobj=spool, mode='wb') as compressed:
+                for chunk in exports.render_rows(rows, columns, job.export_format):
+                    compressed.write(chunk.encode())
+            job.result_size = spool.tell()
+            spool.seek(0)
+            if job.result:
+                # left by a run that timed out after saving it
+                job.result.delete(save=False)
+            job.result.save(f'{job.report}-{job.pk}.{job.export_format}.gz', File(spool), save=False)
+        job.row_count = rows.count
+        job.status = ReportJob.DONE
+    except Exception as e:
+        job.status = ReportJob.FAILED
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'row_count', 'result', 'result_size', 'error', 'finished_at'])
+    return job.status
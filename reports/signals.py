@@ -0,0 +1,29 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from classes.models import FitnessClass
+from reports.rollups import mark_classes_dirty
+
+# Queue the affected classes for `manage.py refresh_rollups`. Bulk writes skip
+# these signals and queue their classes themselves.
+
+@receiver(post_save, sender='classes.ClassBooking')
+def queue_rollup_on_booking_save(sender, instance, **kwargs):
+    # a booking moved to another class also changes the class it left
+    previous_class_id = getattr(instance, '_seat_class_id', None)
+    mark_classes_dirty({instance.fitness_class_id, previous_class_id} - {None})
+
+
+@receiver(post_delete, sender='classes.ClassBooking')
+@receiver(post_save, sender='attendance.Attendance')
+@receiver(post_delete, sender='attendance.Attendance')
+def queue_rollup_on_change(sender, instance, origin=None, **kwargs):
+    # a deleted class queues itself once rather than once per cascaded row
+    if getattr(origin, 'model', type(origin)) is FitnessClass:
+        return
+    mark_classes_dirty([instance.fitness_class_id])
+
+
+@receiver(post_save, sender='classes.FitnessClass')
+@receiver(post_delete, sender='classes.FitnessClass')
+def queue_rollup_on_class_change(sender, instance, **kwargs):
+    mark_classes_dirty([instance.pk])
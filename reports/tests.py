@@ -1,3 +1,212 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from attendance import services as attendance_services
+from attendance.models import Attendance
+from classes import services as class_services
+from classes.models import FitnessClass, ClassBooking
+from core.testing import make_user
+from reports import rollups, services
+from reports.models import ReportJob, ClassRollup, InstructorDailyRollup, PendingClassRollup
 
 # Create your tests here.
+
+class TemporaryMediaMixin:
+    """Report job results are written to a temporary MEDIA_ROOT."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+
+
+class ReportJobPermissionTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.admin = make_user('admin@example.com', 'ADMIN')
+        self.staff = make_user('staff@example.com', 'STAFF')
+        self.client = APIClient()
+
+    def queue(self, user, report):
+        self.client.force_authenticate(user)
+        return self.client.post('/report_jobs/', {'report': report, 'export_format': 'csv'}, format='json')
+
+    def finished_job(self, report):
+        job, _ = services.enqueue_report(report, 'csv', {}, requested_by=self.admin)
+        services.claim_jobs(10)
+        services.run_report_job(job.pk)
+        return job
+
+    def test_staff_cannot_queue_admin_reports(self):
+        for report in ['users', 'payments', 'classes', 'feedback', 'attendance']:
+            response = self.queue(self.staff, report)
+            self.assertEqual(response.status_code, 403, report)
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_staff_can_queue_the_reports_their_actions_allow(self):
+        for report in ['class_bookings', 'memberships']:
+            self.assertEqual(self.queue(self.staff, report).status_code, 202, report)
+
+    def test_admin_can_queue_every_report(self):
+        for report in services.REPORT_SOURCES:
+            self.assertEqual(self.queue(self.admin, report).status_code, 202, report)
+
+    def test_staff_only_see_and_download_allowed_jobs(self):
+        payments = self.finished_job('payments')
+        memberships = self.finished_job('memberships')
+        self.client.force_authenticate(self.staff)
+        listed = [job['id'] for job in self.client.get('/report_jobs/').data['results']]
+        self.assertEqual(listed, [memberships.pk])
+        self.assertEqual(self.client.get(f'/report_jobs/{payments.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'/report_jobs/{payments.pk}/download/').status_code, 404)
+        self.assertEqual(self.client.get(f'/report_jobs/{memberships.pk}/download/').status_code, 200)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(f'/report_jobs/{payments.pk}/download/').status_code, 200)
+
+
+class RunReportJobTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.admin = make_user('admin@example.com', 'ADMIN')
+        self.instructor = make_user('coach@example.com', 'STAFF')
+        now = timezone.now()
+        descriptions = ['plain', 'two\nlines', 'comma, "quotes"']
+        self.classes = [
+            FitnessClass.objects.create(
+                name=f'Class {i}', description=description, duration=60, max_capacity=10,
+                instructor=self.instructor, schedule=now + timedelta(days=i),
+            )
+            for i, description in enumerate(descriptions)
+        ]
+
+    def run_job(self, report, export_format, params=None):
+        job, _ = services.enqueue_report(report, export_format, params or {}, requested_by=self.admin)
+        services.claim_jobs(10)
+        self.assertEqual(services.run_report_job(job.pk), ReportJob.DONE)
+        job.refresh_from_db()
+        return job
+
+    def read(self, job):
+        with job.result.open('rb') as stored:
+            return gzip.decompress(stored.read()).decode()
+
+    def test_result_is_a_gzip_file_with_every_row_counted(self):
+        job = self.run_job('classes', 'csv')
+        rows = list(csv.reader(io.StringIO(self.read(job))))
+        self.assertEqual(rows[0][:3], ['id', 'name', 'description'])
+        self.assertEqual([row[2] for row in rows[1:]], ['plain', 'two\nlines', 'comma, "quotes"'])
+        # a quoted newline is one row, not two
+        self.assertEqual(job.row_count, 3)
+        self.assertTrue(job.result.path.startswith(os.path.join(self.media_root, 'report_jobs')))
+        self.assertEqual(job.result_size, os.path.getsize(job.result.path))
+
+    def test_row_count_follows_the_date_range(self):
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        job = self.run_job('classes', 'ndjson', {'from': tomorrow})
+        names = [json.loads(line)['name'] for line in self.read(job).splitlines()]
+        self.assertEqual(names, ['Class 1', 'Class 2'])
+        self.assertEqual(job.row_count, 2)
+
+    def test_empty_report(self):
+        job = self.run_job('payments', 'ndjson')
+        self.assertEqual((job.row_count, self.read(job)), (0, ''))
+
+    def test_download_streams_the_stored_file(self):
+        job = self.run_job('classes', 'csv')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(f'/report_jobs/{job.pk}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn(f'filename="classes-{job.created_at.date().isoformat()}.csv.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.read(job))
+
+    def test_rerun_replaces_the_previous_result(self):
+        job = self.run_job('classes', 'csv')
+        previous = job.result.path
+        ReportJob.objects.filter(pk=job.pk).update(status=ReportJob.RUNNING)
+        services.run_report_job(job.pk)
+        job.refresh_from_db()
+        self.assertFalse(os.path.exists(previous))
+        self.assertTrue(os.path.exists(job.result.path))
+        self.assertEqual(job.row_count, 3)
+
+
+class RollupConsistencyTests(TestCase):
+    """Incrementally maintained rollups must equal a rebuild from bookings and attendance."""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.instructors = [make_user(f'coach{i}@example.com', 'STAFF') for i in range(2)]
+        self.members = [make_user(f'member{i}@example.com') for i in range(8)]
+        self.classes = [
+            FitnessClass.objects.create(
+                name=f'Class {i}', description='class', duration=60, max_capacity=6,
+                instructor=self.instructors[i % 2], schedule=self.now + timedelta(days=i - 3, hours=i),
+            )
+            for i in range(6)
+        ]
+        self.past, self.upcoming = self.classes[:3], self.classes[3:]
+
+    def snapshot(self):
+        return (
+            sorted(ClassRollup.objects.values_list('fitness_class_id', 'instructor_id', 'date', *rollups.ROLLUP_COUNTS)),
+            sorted(InstructorDailyRollup.objects.values_list('instructor_id', 'date', 'classes', *rollups.ROLLUP_COUNTS)),
+        )
+
+    def assertRollupsMatchRecompute(self):
+        rollups.process_pending_rollups(batch_size=2)
+        self.assertFalse(PendingClassRollup.objects.exists())
+        incremental = self.snapshot()
+        rollups.rebuild_rollups(batch_size=4)
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def test_rollups_match_a_rebuild_through_every_kind_of_change(self):
+        for member in self.members[:5]:
+            for fitness_class in self.classes[::2]:
+                class_services.book_class(member, fitness_class)
+        class_services.bulk_enroll([member.pk for member in self.members], [self.classes[1].pk, self.classes[4].pk])
+        class_rollups, _ = self.assertRollupsMatchRecompute()
+        self.assertEqual(sum(row[4] for row in class_rollups), ClassBooking.objects.count())
+
+        # a booking moved to another class, and a cancellation promoting nobody
+        booking = ClassBooking.objects.filter(fitness_class=self.classes[0], user=self.members[0]).get()
+        booking.fitness_class = self.classes[3]
+        booking.save()
+        class_services.cancel_booking(ClassBooking.objects.filter(fitness_class=self.classes[2]).first())
+        self.assertRollupsMatchRecompute()
+
+        # roster marks, a re-mark, then the no-show sweep for everyone left
+        roster = list(ClassBooking.objects.filter(fitness_class__in=self.past).values_list('fitness_class_id', 'user_id'))
+        for class_id, user_id in roster[::2]:
+            attendance_services.mark_roster(class_id, {user_id: 'present'})
+        class_id, user_id = roster[0]
+        attendance_services.mark_roster(class_id, {user_id: 'late'})
+        swept, absences = attendance_services.sweep_no_shows(now=self.now)
+        self.assertEqual(swept, 3)
+        self.assertGreater(absences, 0)
+        class_rollups, _ = self.assertRollupsMatchRecompute()
+        self.assertEqual(
+            sum(row[5] + row[6] + row[7] for row in class_rollups),
+            Attendance.objects.count(),
+        )
+
+        # the class moves to another instructor and day, an attendance row goes, a class is deleted
+        moved = self.classes[4]
+        moved.instructor = self.instructors[1]
+        moved.schedule += timedelta(days=2)
+        moved.max_capacity = 6
+        moved.save()
+        Attendance.objects.filter(status='absent').first().delete()
+        self.classes[5].delete()
+        class_rollups, instructor_days = self.assertRollupsMatchRecompute()
+        self.assertEqual(len(class_rollups), 5)
+        self.assertEqual(sum(row[2] for row in instructor_days), 5)
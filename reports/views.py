@@ -4,6 +4,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from core.permissions import IsAdminOrStaff
+from core.exports import EXPORT_PARAMETER, export_response, ATTENDANCE_REPORT_COLUMNS, PAYMENT_REPORT_COLUMNS, USER_REPORT_COLUMNS
+from drf_yasg.utils import swagger_auto_schema
 
 from accounts.models import CustomUser
 from classes.models import FitnessClass
@@ -11,7 +13,8 @@ from feedback.models import Feedback
 from memberships.models import Membership
 from attendance.models import Attendance
 from payments.models import Payment
-from reports.models import Report
+from reports.models import Report, ReportJob, ClassRollup, InstructorDailyRollup
+from reports import analytics, rollups, services
 
 from accounts.serializers import UserSerializer
 from classes.serializers import FitnessClassSerializer
@@ -19,10 +22,27 @@ from feedback.serializers import FeedbackSerializer
 from memberships.serializers import MembershipSerializer
 from attendance.serializers import AttendanceSerializer
 from payments.serializers import PaymentSerializer
-from reports.serializers import ReportSerializer
+from reports.serializers import (
+    ReportSerializer, ReportJobSerializer, ReportJobRequestSerializer, ClassRollupSerializer, InstructorDailyRollupSerializer,
+)
+from core.filters import ClassRollupFilter, InstructorDailyRollupFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from drf_yasg import openapi
+from django.http import FileResponse
+from django.core.cache import cache
+import hashlib
+from rest_framework.pagination import PageNumberPagination
 
 # Create your views here.
 
+class ReportJobPagination(PageNumberPagination):
+    page_size = 20
+
+
+class RollupPagination(PageNumberPagination):
+    page_size = 50
+
+
 class ReportViewSet(viewsets.ModelViewSet):
 
     """
@@ -44,18 +64,29 @@ class ReportViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrStaff]
 
 
+    @swagger_auto_schema(
+        operation_description="Attendance report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def attendance_report(self, request):
         try:
             if request.user.role == 'ADMIN':
                 # Generate attendance report
                 attendance_data = Attendance.objects.select_related('user', 'fitness_class').all()
+                response = export_response(request, attendance_data, ATTENDANCE_REPORT_COLUMNS, 'attendance')
+                if response is not None:
+                    return response
                 serializer = AttendanceSerializer(attendance_data, many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(
+        operation_description="User report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def user_report(self, request):
         try:
@@ -63,12 +94,19 @@ class ReportViewSet(viewsets.ModelViewSet):
                 # Generate user report
                 
                 user_data = CustomUser.objects.all()
+                response = export_response(request, user_data, USER_REPORT_COLUMNS, 'users')
+                if response is not None:
+                    return response
                 serializer = UserSerializer(user_data, many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @swagger_auto_schema(
+        operation_description="Payment report. Add `?export=csv` or `?export=ndjson` to stream it as a download.",
+        manual_parameters=[EXPORT_PARAMETER],
+    )
     @action(detail=False, methods=['get'], permission_classes=[IsAdminOrStaff])
     def payment_report(self, request):
         try:
@@ -76,8 +114,176 @@ class ReportViewSet(viewsets.ModelViewSet):
                 # Generate payment report
                 
                 payment_data = Payment.objects.select_related('user', 'membership_plan').all()
+                response = export_response(request, payment_data, PAYMENT_REPORT_COLUMNS, 'payments')
+                if response is not None:
+                    return response
                 serializer = PaymentSerializer(payment_data, many=True)
                 return Response(serializer.data)
             return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
         except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ReportJobViewSet(viewsets.ModelViewSet):
+    """
+    Background report exports, for reports too large to build within a request:
+        . POST queues a job and returns it; an identical request shares the job already queued.
+        . Poll the job until its status is `done`, then fetch `download/` (gzip-compressed CSV or NDJSON).
+        . Jobs are run by `manage.py run_report_jobs`.
+        . Staff can only queue and see the reports their *_report actions allow (class bookings, memberships).
+    """
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAdminOrStaff]
+    pagination_class = ReportJobPagination
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return ReportJob.objects.none()
+        jobs = ReportJob.objects.select_related('requested_by')
+        if services.is_report_admin(self.request.user):
+            return jobs
+        # jobs are shared between identical requests, so staff see every job of the reports they may export
+        return jobs.filter(report__in=services.allowed_reports(self.request.user))
+
+    @swagger_auto_schema(
+        operation_description="Queue a report export. Returns 202 with a new job, or 200 with the job an identical request already queued.",
+        request_body=ReportJobRequestSerializer,
+        responses={202: ReportJobSerializer, 200: ReportJobSerializer, 400: "Bad Request", 403: "Report not allowed for this user"}
+    )
+    def create(self, request, *args, **kwargs):
+        serializer = ReportJobRequestSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        job, created = services.enqueue_report(
+            serializer.validated_data['report'],
+            serializer.validated_data['export_format'],
+            serializer.job_params(),
+            requested_by=request.user,
+        )
+        return Response(
+            ReportJobSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+        )
+
+    @swagger_auto_schema(
+        operation_description="Download a finished job's result as a gzip file.",
+        responses={200: "application/gzip", 404: "Not Found", 409: "Job not finished"}
+    )
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ReportJob.DONE:
+            return Response({'error': f"Report job is {job.status}."}, status=status.HTTP_409_CONFLICT)
+        # streamed from the stored file in chunks
+        return FileResponse(
+            job.result.open('rb'),
+            as_attachment=True,
+            filename=f'{job.report}-{job.created_at.date().isoformat()}.{job.export_format}.gz',
+            content_type='application/gzip',
+        )
+
+
+class RollupViewSetMixin:
+    """Admins see every instructor's rollups, staff only their own."""
+    permission_classes = [IsAdminOrStaff]
+    filter_backends = [DjangoFilterBackend]
+    pagination_class = RollupPagination
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return self.queryset.none()
+        user = self.request.user
+        if user.is_superuser or user.role == 'ADMIN':
+            return self.queryset.all()
+        return self.queryset.filter(instructor=user)
+
+    @swagger_auto_schema(
+        operation_description="Bookings, attendance, fill rate and attendance rate summed per day over the filtered rollups.",
+    )
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        return Response(rollups.daily_totals(self.filter_queryset(self.get_queryset())))
+
+
+class ClassRollupViewSet(RollupViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Per class booking and attendance counts, one row per class on its local date.
+    Filter with `date_from`, `date_to`, `instructor` and `fitness_class`.
+    Kept up to date by `manage.py refresh_rollups`.
+    """
+    queryset = ClassRollup.objects.all()
+    serializer_class = ClassRollupSerializer
+    filterset_class = ClassRollupFilter
+
+    @swagger_auto_schema(
+        operation_description="Weekday x hour matrices of class count, average fill rate and attendance rate for a date range (`date_from` and `date_to` required). Add `per_instructor=true` for one set per instructor. Cached for 10 minutes per range.",
+        manual_parameters=[
+            openapi.Parameter('date_from', openapi.IN_QUERY, description="First class date (YYYY-MM-DD)", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('date_to', openapi.IN_QUERY, description="Last class date (YYYY-MM-DD)", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('per_instructor', openapi.IN_QUERY, description="Also return a heatmap per instructor", type=openapi.TYPE_BOOLEAN),
+        ],
+        responses={200: "Heatmaps", 400: "Bad Request"}
+    )
+    @action(detail=False, methods=['get'])
+    def heatmap(self, request):
+        if not request.query_params.get('date_from') or not request.query_params.get('date_to'):
+            return Response({'error': "date_from and date_to are required."}, status=status.HTTP_400_BAD_REQUEST)
+        per_instructor = request.query_params.get('per_instructor', '').lower() in ('1', 'true')
+        user = request.user
+        scope = 'all' if user.is_superuser or user.role == 'ADMIN' else user.pk
+        params = sorted((key, value) for key, value in request.query_params.items() if key != 'page')
+        key = 'reports:heatmap:' + hashlib.sha256(repr((scope, params)).encode()).hexdigest()
+        result = cache.get(key)
+        if result is None:
+            result = rollups.occupancy_heatmap(self.filter_queryset(self.get_queryset()), per_instructor=per_instructor)
+            cache.set(key, result, rollups.HEATMAP_CACHE_TTL)
+        return Response(result)
+
+
+class InstructorDailyRollupViewSet(RollupViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Per instructor and day totals of the class rollups.
+    Filter with `date_from`, `date_to` and `instructor`.
+    """
+    queryset = InstructorDailyRollup.objects.all()
+    serializer_class = InstructorDailyRollupSerializer
+    filterset_class = InstructorDailyRollupFilter
+
+
+def parse_month(value):
+    """'YYYY-MM' to a month index (see reports.analytics.month_label)."""
+    year, _, month = value.partition('-')
+    if len(year) != 4 or not year.isdigit() or not month.isdigit() or not 1 <= int(month) <= 12:
+        raise ValueError(f"Invalid month: {value}, use YYYY-MM.")
+    return int(year) * 12 + int(month) - 1
+
+
+class CohortRetentionViewSet(viewsets.ViewSet):
+    """
+    Monthly cohort retention, churn and lifetime value (admins only).
+    A cohort is the month of a member's first successful payment; a member is
+    retained in a later month if a membership covered it or they attended a class.
+    """
+    permission_classes = [IsAdminOrStaff]
+
+    @swagger_auto_schema(
+        operation_description="Cohort x months-since-first-payment retention matrix, per cohort revenue and LTV, and monthly churn. Cached for 15 minutes.",
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, description="First cohort month (YYYY-MM)", type=openapi.TYPE_STRING),
+            openapi.Parameter('to', openapi.IN_QUERY, description="Last cohort month (YYYY-MM)", type=openapi.TYPE_STRING),
+            openapi.Parameter('horizon', openapi.IN_QUERY, description="Months after the cohort month to report", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: "Cohorts and churn", 400: "Bad Request", 403: "Forbidden"}
+    )
+    def list(self, request):
+        if request.user.role != 'ADMIN' and not request.user.is_superuser:
+            return Response({'detail': 'Not authorized'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            first_month = parse_month(request.query_params['from']) if request.query_params.get('from') else None
+            last_month = parse_month(request.query_params['to']) if request.query_params.get('to') else None
+            horizon = int(request.query_params['horizon']) if request.query_params.get('horizon') else None
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if horizon is not None and horizon < 0:
+            return Response({'error': "horizon must not be negative."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(analytics.cached_cohort_retention(first_month, last_month, horizon))